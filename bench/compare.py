@@ -0,0 +1,77 @@
+import argparse
+import json
+import math
+import statistics
+import sys
+
+
+def mann_whitney_u(a: list[float], b: list[float]) -> float:
+    """
+    The two-sided p-value of the Mann-Whitney U test that `a` and `b` come from the same
+    distribution, by the normal approximation with a correction for ties. Unlike a t-test
+    it does not assume the times are normally distributed, which they rarely are.
+    """
+    values = sorted([(value, 0) for value in a] + [(value, 1) for value in b])
+    n = len(values)
+
+    # Rank the values from 1, giving tied values the average of their ranks.
+    rank_sum_a = 0.0
+    tie_correction = 0.0
+    i = 0
+    while i < n:
+        j = i
+        while j + 1 < n and values[j + 1][0] == values[i][0]:
+            j += 1
+        rank = (i + j) / 2 + 1
+        rank_sum_a += rank * sum(1 for k in range(i, j + 1) if values[k][1] == 0)
+        ties = j - i + 1
+        tie_correction += ties ** 3 - ties
+        i = j + 1
+
+    n_a, n_b = len(a), len(b)
+    u = rank_sum_a - n_a * (n_a + 1) / 2
+    mean = n_a * n_b / 2
+    variance = n_a * n_b / 12 * ((n + 1) - tie_correction / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (abs(u - mean) - 0.5) / math.sqrt(variance)
+    return min(1.0, 2 * (1 - statistics.NormalDist().cdf(z)))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Compare two result files written by bench/run.py.")
+    arg_parser.add_argument("baseline")
+    arg_parser.add_argument("candidate")
+    arg_parser.add_argument("--alpha", type=float, default=0.05,
+                            help="p-value below which a difference counts as significant (default: 0.05)")
+    arg_parser.add_argument("--threshold", type=float, default=2.0,
+                            help="smallest change in the median, in percent, worth reporting (default: 2)")
+    args = arg_parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)["workloads"]
+    with open(args.candidate) as f:
+        candidate = json.load(f)["workloads"]
+
+    regressions = 0
+    print(f"{'workload':<14}{'baseline':>10}{'candidate':>11}{'change':>9}{'p':>8}  verdict")
+    for workload in sorted(baseline.keys() & candidate.keys()):
+        before = baseline[workload]
+        after = candidate[workload]
+        change = (after["median"] - before["median"]) / before["median"] * 100
+        p = mann_whitney_u(before["times"], after["times"])
+
+        if p >= args.alpha or abs(change) < args.threshold:
+            verdict = "no significant change"
+        elif change > 0:
+            verdict = "slower"
+            regressions += 1
+        else:
+            verdict = "faster"
+        print(f"{workload:<14}{before['median']:>9.3f}s{after['median']:>10.3f}s{change:>+8.1f}%{p:>8.3f}  {verdict}")
+
+    for workload in sorted(baseline.keys() ^ candidate.keys()):
+        print(f"{workload:<14} only in {'the baseline' if workload in baseline else 'the candidate'}")
+
+    # A non-zero exit lets a CI job fail on a regression.
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,82 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+LOX = os.path.join(BENCH_DIR, "..", "tree_walk", "lox.py")
+WORKLOADS = sorted(os.path.splitext(os.path.basename(path))[0] for path in glob.glob(os.path.join(BENCH_DIR, "*.lox")))
+
+
+def run_once(workload: str, lox_args: list[str]) -> tuple[float, str]:
+    """
+    Runs a workload in a fresh interpreter process. Returns the wall time and a digest
+    of what it printed, so that runs which print something different can be caught.
+    """
+    command = [sys.executable, LOX, "--no-cache", *lox_args, os.path.join(BENCH_DIR, f"{workload}.lox")]
+    start_time = time.perf_counter()
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    seconds = time.perf_counter() - start_time
+    if result.returncode != 0:
+        sys.exit(f"{workload} exited with {result.returncode}:\n{result.stdout.decode()}")
+    return seconds, hashlib.sha256(result.stdout).hexdigest()
+
+
+def summarize(times: list[float]) -> dict:
+    return {
+        "runs": len(times),
+        "median": statistics.median(times),
+        "p95": statistics.quantiles(times, n=20, method="inclusive")[18] if len(times) > 1 else times[0],
+        "stddev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "min": min(times),
+        "times": times,
+    }
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Time the Lox workloads in bench/, each in fresh processes.")
+    arg_parser.add_argument("workloads", nargs="*", metavar="workload",
+                            help=f"which workloads to run (default: all of {', '.join(WORKLOADS)})")
+    arg_parser.add_argument("-n", "--runs", type=int, default=10, help="runs per workload (default: 10)")
+    arg_parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    arg_parser.add_argument("--lox-args", default="", metavar="ARGS",
+                            help="extra arguments for lox.py, like --lox-args=\"--engine vm --numbers float\"")
+    args = arg_parser.parse_args()
+
+    for workload in args.workloads:
+        if workload not in WORKLOADS:
+            arg_parser.error(f"no workload called {workload!r}")
+    workloads = args.workloads or WORKLOADS
+    lox_args = args.lox_args.split()
+    times: dict[str, list[float]] = {workload: [] for workload in workloads}
+    digests: dict[str, str] = {}
+
+    # Round robin over the workloads, so that the machine getting busier or quieter
+    # part way through affects them all alike.
+    for _ in range(args.runs):
+        for workload in workloads:
+            seconds, digest = run_once(workload, lox_args)
+            if digests.setdefault(workload, digest) != digest:
+                sys.exit(f"{workload} printed something different from one run to the next")
+            times[workload].append(seconds)
+
+    results = {
+        "lox_args": lox_args,
+        "python": sys.version,
+        "machine": platform.platform(),
+        "workloads": {workload: summarize(workload_times) for workload, workload_times in times.items()},
+    }
+
+    print(f"{'workload':<14}{'median':>10}{'p95':>10}{'stddev':>10}")
+    for workload, summary in results["workloads"].items():
+        print(f"{workload:<14}{summary['median']:>9.3f}s{summary['p95']:>9.3f}s{summary['stddev']:>9.3f}s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
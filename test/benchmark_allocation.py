@@ -0,0 +1,56 @@
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "tree_walk"))
+
+from lox import Lox
+
+# Lox has no arrays, so the objects are kept alive as a linked list.
+PROGRAM = """
+class Node {{
+  init(x, y, next) {{
+    this.x = x;
+    this.y = y;
+    this.next = next;
+  }}
+}}
+
+var head = nil;
+for (var i = 0; i < {count}; i = i + 1) {{
+  head = Node(i, i + 1, head);
+}}
+
+var total = 0;
+var node = head;
+while (node) {{
+  total = total + node.x + node.y;
+  node = node.next;
+}}
+print total;
+"""
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Allocate and walk many small Lox objects.")
+    arg_parser.add_argument("--count", type=int, default=100000)
+    arg_parser.add_argument("--engine", choices=["tree", "closure"], default="tree")
+    args = arg_parser.parse_args()
+
+    lox = Lox(args.engine)
+    source = PROGRAM.format(count=args.count)
+
+    start_time = time.time()
+    lox.run(source)
+    seconds = time.time() - start_time
+
+    # A second run with tracing on, as tracemalloc slows allocation down a lot.
+    lox = Lox(args.engine)
+    tracemalloc.start()
+    lox.run(source)
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f"{args.count} objects in {seconds:.2f} seconds")
+    print(f"{retained / args.count:.1f} bytes retained per object")
@@ -0,0 +1,49 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+LOX = os.path.join(os.path.dirname(__file__), "..", "tree_walk", "lox.py")
+
+SCRIPT = """
+fun fib(n) {{
+  if (n < 2) return n;
+  return fib(n - 1) + fib(n - 2);
+}}
+print fib({n});
+"""
+
+
+def run(command: list[str]) -> float:
+    start_time = time.perf_counter()
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start_time
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Compare --jobs batches with one process per script.")
+    arg_parser.add_argument("--scripts", type=int, default=40)
+    arg_parser.add_argument("--n", type=int, default=15, help="the fib each script computes")
+    arg_parser.add_argument("--engine", choices=["tree", "closure", "vm", "python"], default="tree")
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for i in range(args.scripts):
+            paths.append(os.path.join(directory, f"job{i}.lox"))
+            with open(paths[-1], "w") as f:
+                f.write(SCRIPT.format(n=args.n))
+
+        options = ["--engine", args.engine, "--no-cache"]
+        seconds = sum(run([sys.executable, LOX, *options, path]) for path in paths)
+        print(f"one process per script: {seconds:.2f}s, {args.scripts / seconds:.1f} scripts per second")
+
+        jobs = 1
+        while True:
+            seconds = run([sys.executable, LOX, *options, "--jobs", str(jobs), *paths])
+            print(f"--jobs {jobs}: {seconds:.2f}s, {args.scripts / seconds:.1f} scripts per second")
+            if jobs >= (os.cpu_count() or 1):
+                break
+            jobs = min(jobs * 2, os.cpu_count() or 1)
@@ -0,0 +1,77 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "tree_walk"))
+
+from lox import Lox
+
+# Each program builds {count} numbers, reads them all back by position, and sorts them.
+LINKED = """
+class Node {{
+  init(value, next) {{
+    this.value = value;
+    this.next = next;
+  }}
+}}
+
+var head = nil;
+for (var i = 0; i < {count}; i = i + 1) {{
+  head = Node((i * 7919) - (i * 7919 / {count}), head);
+}}
+
+// Reading the i-th value means walking the list from the head.
+var total = 0;
+for (var i = 0; i < {reads}; i = i + 1) {{
+  var node = head;
+  for (var j = 0; j < i; j = j + 1) node = node.next;
+  total = total + node.value;
+}}
+
+// Insertion sort, by relinking nodes.
+var sorted = nil;
+while (head) {{
+  var next = head.next;
+  if (!sorted or head.value <= sorted.value) {{
+    head.next = sorted;
+    sorted = head;
+  }} else {{
+    var at = sorted;
+    while (at.next and at.next.value < head.value) at = at.next;
+    head.next = at.next;
+    at.next = head;
+  }}
+  head = next;
+}}
+print total + sorted.value;
+"""
+
+NATIVE = """
+var values = List();
+for (var i = 0; i < {count}; i = i + 1) {{
+  coll_append(values, (i * 7919) - (i * 7919 / {count}));
+}}
+
+var total = 0;
+for (var i = 0; i < {reads}; i = i + 1) {{
+  total = total + coll_get(values, coll_len(values) - 1 - i);
+}}
+
+coll_sort(values);
+print total + coll_get(values, 0);
+"""
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Compare native lists with linked lists of Lox objects.")
+    arg_parser.add_argument("--count", type=int, default=2000)
+    arg_parser.add_argument("--engine", choices=["tree", "closure", "vm", "python"], default="tree")
+    args = arg_parser.parse_args()
+
+    # Reading every value of the linked list by position is quadratic, so only read some.
+    reads = min(args.count, 500)
+    for name, program in (("linked list", LINKED), ("native list", NATIVE)):
+        lox = Lox(args.engine)
+        start_time = time.time()
+        lox.run(program.format(count=args.count, reads=reads))
+        print(f"{name}: {time.time() - start_time:.2f} seconds")
@@ -0,0 +1,51 @@
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "tree_walk"))
+
+from lox import Lox
+
+# A small rule, like one run against every record a service receives.
+RULE = """
+fun band(value) {
+  if (value < 10) return "low";
+  if (value < 100) return "medium";
+  return "high";
+}
+if (amount > limit) print id + " " + band(amount);
+"""
+
+EMPTY = "var done = true;"
+
+
+def microseconds_per_run(run, runs: int) -> float:
+    start_time = time.perf_counter()
+    for i in range(runs):
+        run(i)
+    return (time.perf_counter() - start_time) / runs * 1e6
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Time running a compiled Script many times against "
+                                                     "compiling the source again for every run.")
+    arg_parser.add_argument("--runs", type=int, default=20000)
+    args = arg_parser.parse_args()
+
+    for engine in ["tree", "closure", "vm", "python"]:
+        output = io.StringIO()
+        lox = Lox(engine, "float")
+        empty = lox.compile(EMPTY)
+        rule = lox.compile(RULE)
+
+        overhead = microseconds_per_run(lambda i: empty.run(stdout=output), args.runs)
+        compiled = microseconds_per_run(
+            lambda i: rule.run({"id": f"r{i}", "amount": i % 200, "limit": 50}, stdout=output), args.runs)
+        # Each run in a fresh session, as it takes to keep runs apart without Script.
+        source = microseconds_per_run(
+            lambda i: Lox(engine, "float", stdout=output).run(f'var id = "r{i}"; var amount = {i % 200}; '
+                                                              f'var limit = 50; {RULE}'), args.runs // 10)
+        print(f"{engine}: {overhead:.1f}us per run of an empty script, {compiled:.1f}us per rule run, "
+              f"{source:.1f}us compiling the rule for every run")
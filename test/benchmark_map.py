@@ -0,0 +1,65 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+LOX = os.path.join(os.path.dirname(__file__), "..", "tree_walk", "lox.py")
+
+SCRIPT = """
+fun transform(record) {
+  if (coll_get(record, "level") == "debug") return nil;
+  var tags = coll_get(record, "tags");
+  coll_set(record, "ms", coll_get(record, "us") / 1000);
+  coll_set(record, "tags", coll_join(coll_sort(tags), ","));
+  return record;
+}
+"""
+
+
+def run(records: int, options: list[str]) -> tuple[float, int]:
+    """
+    Pipes `records` generated records through --map, and returns the seconds it took
+    and how many lines it wrote. The input is generated as it is read, so it never
+    exists as a whole.
+    """
+    start_time = time.perf_counter()
+    # Written straight to a file, so that the output pipe never fills up and blocks.
+    with tempfile.TemporaryFile("w+") as output:
+        process = subprocess.Popen([sys.executable, LOX, "--map", *options], stdin=subprocess.PIPE,
+                                   stdout=output, text=True)
+        for i in range(records):
+            level = ("info", "debug", "warn")[i % 3]
+            process.stdin.write(json.dumps({"id": i, "level": level, "us": i * 1500, "tags": ["b", "a", str(i)]}))
+            process.stdin.write("\n")
+        process.stdin.close()
+        process.wait()
+        output.seek(0)
+        lines = sum(1 for _ in output)
+    return time.perf_counter() - start_time, lines
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Time --map, and check its memory stays flat as the input grows.")
+    arg_parser.add_argument("--records", type=int, default=50000)
+    arg_parser.add_argument("--engine", choices=["tree", "closure", "vm", "python"], default="closure")
+    arg_parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    args = arg_parser.parse_args()
+
+    with tempfile.NamedTemporaryFile("w", suffix=".lox", delete=False) as f:
+        f.write(SCRIPT)
+    try:
+        for jobs in (None, args.jobs):
+            options = ["--engine", args.engine, f.name] + ([] if jobs is None else ["--jobs", str(jobs)])
+            for records in (args.records // 10, args.records):
+                seconds, lines = run(records, options)
+                # Peak memory of the largest child so far; it only grows if the input is kept.
+                peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+                print(f"{'in process' if jobs is None else f'--jobs {jobs}'}, {records} records: {seconds:.2f}s, "
+                      f"{records / seconds:.0f} records per second, {lines} written, "
+                      f"largest process peak {peak:.0f} MiB")
+    finally:
+        os.unlink(f.name)
@@ -0,0 +1,66 @@
+import argparse
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "tree_walk"))
+
+from expr import Expr
+from parser import Parser
+from scanner import RegexScanner
+from stmt import Stmt
+
+# One block of machine generated looking code. Each copy gets its own names.
+TEMPLATE = """
+class Point{n} {{
+  init(x, y) {{ this.x = x; this.y = y; }}
+  sum() {{ return this.x + this.y; }}
+}}
+fun work{n}(a, b) {{
+  var p = Point{n}(a, b * 2);
+  var total = 0;
+  for (var i = 0; i < 3; i = i + 1) {{
+    if (i == 1 or a > b) total = total + p.sum(); else total = total - 1;
+  }}
+  print "work {n}";
+  return total;
+}}
+"""
+
+def generate(lines: int) -> str:
+    block_lines = TEMPLATE.count("\n")
+    return "".join(TEMPLATE.format(n=n) for n in range(lines // block_lines + 1))
+
+
+def count_nodes(node: object) -> int:
+    if isinstance(node, list):
+        return sum(count_nodes(item) for item in node)
+    if not isinstance(node, (Expr, Stmt)):
+        return 0
+    fields = vars(node) if hasattr(node, "__dict__") else type(node).__slots__
+    return 1 + sum(count_nodes(getattr(node, field)) for field in fields)
+
+
+def measure(source: str) -> tuple[int, int, int, int]:
+    tracemalloc.start()
+    tokens = RegexScanner(source).scan_tokens()
+    token_bytes = tracemalloc.get_traced_memory()[0]
+
+    statements = Parser(tokens).parse()
+    node_bytes = tracemalloc.get_traced_memory()[0] - token_bytes
+    tracemalloc.stop()
+
+    return len(tokens), token_bytes, count_nodes(statements), node_bytes
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Report the memory used per token and per AST node.")
+    arg_parser.add_argument("--lines", type=int, default=50000)
+    args = arg_parser.parse_args()
+
+    sys.setrecursionlimit(10000)
+    source = generate(args.lines)
+    tokens, token_bytes, nodes, node_bytes = measure(source)
+    print(f"{source.count(chr(10))} lines")
+    print(f"{tokens} tokens, {token_bytes / tokens:.1f} bytes per token")
+    print(f"{nodes} nodes, {node_bytes / nodes:.1f} bytes per node")
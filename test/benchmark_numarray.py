@@ -0,0 +1,51 @@
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "tree_walk"))
+
+from lox import Lox
+
+# Both halves compute the same sum, maximum and dot product of {count} numbers, timed
+# from inside Lox so that building the data is left out.
+PROGRAM = """
+var values = List();
+for (var i = 0; i < {count}; i = i + 1) coll_append(values, (i * 37) / 100 - 50);
+var array = NumArray(values);
+
+var start = clock();
+var total = 0;
+var largest = coll_get(values, 0);
+var dotted = 0;
+for (var i = 0; i < coll_len(values); i = i + 1) {{
+  var value = coll_get(values, i);
+  total = total + value;
+  if (value > largest) largest = value;
+  dotted = dotted + value * value;
+}}
+var looped = clock() - start;
+
+start = clock();
+var native_total = arr_sum(array);
+var native_largest = arr_max(array);
+var native_dotted = arr_dot(array, array);
+var native = clock() - start;
+
+print "interpreted loop seconds:";
+print looped;
+print "native call seconds:";
+print native;
+print "differences (rounding only):";
+print native_total - total;
+print native_largest - largest;
+print native_dotted - dotted;
+"""
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Compare NumArray reductions with interpreted loops.")
+    arg_parser.add_argument("--count", type=int, default=200000)
+    arg_parser.add_argument("--engine", choices=["tree", "closure", "vm", "python"], default="tree")
+    arg_parser.add_argument("--numbers", choices=["decimal", "float", "int"], default="float")
+    args = arg_parser.parse_args()
+
+    Lox(args.engine, args.numbers).run(PROGRAM.format(count=args.count))
@@ -0,0 +1,29 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+LOX = os.path.join(os.path.dirname(__file__), "..", "tree_walk", "lox.py")
+ENGINES = ["tree", "closure", "vm", "python"]
+NUMBERS = ["decimal", "float", "int"]
+
+
+def run(script: str, engine: str, numbers: str) -> float:
+    start_time = time.time()
+    subprocess.run([sys.executable, LOX, "--engine", engine, "--numbers", numbers, script],
+                   check=True, stdout=subprocess.DEVNULL)
+    return time.time() - start_time
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Time a Lox program under every numeric backend.")
+    arg_parser.add_argument("script", nargs="?")
+    arg_parser.add_argument("--engines", nargs="+", choices=ENGINES, default=ENGINES)
+    args = arg_parser.parse_args()
+
+    script = args.script or os.path.join(os.path.dirname(__file__), "benchmark_numbers.lox")
+    print(f"{'engine':<10}" + "".join(f"{numbers:>10}" for numbers in NUMBERS))
+    for engine in args.engines:
+        times = [run(script, engine, numbers) for numbers in NUMBERS]
+        print(f"{engine:<10}" + "".join(f"{seconds:>9.2f}s" for seconds in times))
@@ -0,0 +1,57 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "tree_walk"))
+
+from lox import Lox
+from output import MemoryOutput, DEFAULT_BUFFER_SIZE
+
+PROGRAM = """
+for (var i = 0; i < {count}; i = i + 1) {{
+  print "line";
+  print i;
+}}
+"""
+
+# The same loop without printing, to tell the cost of printing from the loop's.
+LOOP = """
+var line;
+for (var i = 0; i < {count}; i = i + 1) {{
+  line = "line";
+  line = i;
+}}
+"""
+
+
+def best_time(lox: Lox, program: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        lox.run(program)
+        best = min(best, time.perf_counter() - start_time)
+    return best
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Time a script that prints a lot with different output buffering.")
+    arg_parser.add_argument("--count", type=int, default=200000, help="how many times round the loop, printing twice")
+    arg_parser.add_argument("--engine", choices=["tree", "closure", "vm", "python"], default="closure")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="runs of each, of which the fastest counts")
+    args = arg_parser.parse_args()
+
+    program = PROGRAM.format(count=args.count)
+    loop = best_time(Lox(args.engine, "float"), LOOP.format(count=args.count), args.repeat)
+    print(f"the loop alone: {loop:.2f}s")
+    with open(os.devnull, "w") as devnull:
+        for name, options in (
+            ("unbuffered (--buffer-size 0)", {"stdout": devnull, "buffer_size": 0}),
+            ("line buffered", {"stdout": devnull, "line_buffered": True}),
+            (f"buffered ({DEFAULT_BUFFER_SIZE} characters)", {"stdout": devnull}),
+            ("buffered (64 KiB)", {"stdout": devnull, "buffer_size": 65536}),
+            ("in memory", {"stdout": MemoryOutput()}),
+        ):
+            seconds = best_time(Lox(args.engine, "float", **options), program, args.repeat)
+            lines = 2 * args.count
+            print(f"{name}: {seconds:.2f}s, {(seconds - loop) / lines * 1e9:.0f}ns per printed line")
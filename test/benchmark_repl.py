@@ -0,0 +1,52 @@
+import argparse
+import contextlib
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "tree_walk"))
+
+from lox import Lox, ENGINES
+
+SETUP = """
+class Counter {
+  init() { this.count = 0; }
+  add(n) { this.count = this.count + n; return this; }
+}
+var counter = Counter();
+"""
+
+# The kind of lines typed into a long running console, over and over. Redefining a
+# function replaces the old one, so its code should be released too.
+LINES = [
+    "var x = {n};",
+    "for (var i = 0; i < 5; i = i + 1) counter.add(i);",
+    "{{ var local = x * 2; print local + counter.count; }}",
+    "fun handler(a) {{ var b = a + {n}; return b * 2; }}",
+    "print handler(x);",
+    "if (counter.count > 100) counter = Counter();",
+]
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Report memory over a long REPL session.")
+    arg_parser.add_argument("--lines", type=int, default=30000)
+    arg_parser.add_argument("--engine", choices=ENGINES, default="tree")
+    args = arg_parser.parse_args()
+
+    lox = Lox(args.engine)
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            lox.run(SETUP)
+        baseline = tracemalloc.get_traced_memory()[0]
+        for n in range(args.lines):
+            with contextlib.redirect_stdout(devnull):
+                lox.run(LINES[n % len(LINES)].format(n=n))
+            if (n + 1) % (args.lines // 10) == 0:
+                growth = tracemalloc.get_traced_memory()[0] - baseline
+                print(f"{n + 1:>8} lines: {growth / 1024:8.1f} KiB more than after setup")
+    seconds = time.perf_counter() - start_time
+    print(f"{args.lines / seconds:.0f} lines/second")
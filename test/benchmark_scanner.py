@@ -0,0 +1,56 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "tree_walk"))
+
+from scanner import RegexScanner, Scanner
+
+# Every kind of lexeme: keywords, identifiers, numbers, strings (one of them spanning
+# lines), one and two character operators, comments and indentation.
+TEMPLATE = """
+// Block {n} of generated code.
+class Shape{n} < Base {{
+  init(width, height) {{
+    this.width = width;   // in units
+    this.height = height;
+  }}
+  area() {{ return this.width * this.height / 2.5; }}
+}}
+fun check{n}(a, b) {{
+  if (a != b and !(a <= 10) or b >= 3.25) {{
+    print "block {n} differs";
+  }} else {{
+    print "a string
+that spans lines";
+  }}
+  for (var i = 0; i < 100; i = i + 1) a = a - -i;
+  return a == nil;
+}}
+"""
+
+SCANNERS = {"regex": RegexScanner, "char": Scanner}
+
+
+def generate(lines: int) -> str:
+    block_lines = TEMPLATE.count("\n")
+    return "".join(TEMPLATE.format(n=n) for n in range(lines // block_lines + 1))
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Report the tokens per second of each scanner.")
+    arg_parser.add_argument("--lines", type=int, default=200000)
+    arg_parser.add_argument("--repeat", type=int, default=3, help="report the best of this many runs")
+    args = arg_parser.parse_args()
+
+    source = generate(args.lines)
+    print(f"{source.count(chr(10))} lines, {len(source) / 1e6:.1f} MB")
+
+    for name, scanner in SCANNERS.items():
+        seconds = float("inf")
+        for _ in range(args.repeat):
+            start_time = time.perf_counter()
+            tokens = scanner(source).scan_tokens()
+            seconds = min(seconds, time.perf_counter() - start_time)
+        print(f"{name:>5}: {len(tokens)} tokens in {seconds:.2f} seconds, {len(tokens) / seconds:,.0f} tokens/second")
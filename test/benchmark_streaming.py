@@ -0,0 +1,61 @@
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "tree_walk"))
+
+from lox import Lox, ENGINES
+
+# Mostly top-level statements, like a generated script, with a function now and then.
+TEMPLATE = """
+var total{n} = 0;
+for (var i = 0; i < 3; i = i + 1) {{
+  total{n} = total{n} + i * {n};
+}}
+if (total{n} > 10) print total{n}; else print "small";
+fun step{n}(x) {{ return x + {n}; }}
+print step{n}(total{n});
+"""
+
+
+def generate(lines: int) -> str:
+    block_lines = TEMPLATE.count("\n")
+    return "".join(TEMPLATE.format(n=n) for n in range(lines // block_lines + 1))
+
+
+def measure(engine: str, path: str, stream: bool) -> tuple[float, int]:
+    lox = Lox(engine)
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if stream:
+            lox.stream_file(path)
+        else:
+            lox.run_file(path)
+    seconds = time.perf_counter() - start_time
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Compare peak memory running a huge script whole and streamed.")
+    arg_parser.add_argument("--lines", type=int, default=20000)
+    arg_parser.add_argument("--engine", choices=ENGINES, default="tree")
+    args = arg_parser.parse_args()
+
+    source = generate(args.lines)
+    with tempfile.NamedTemporaryFile("w", suffix=".lox", delete=False) as f:
+        f.write(source)
+    try:
+        print(f"{source.count(chr(10))} lines, {len(source) / 1e6:.1f} MB")
+        for stream in (False, True):
+            seconds, peak = measure(args.engine, f.name, stream)
+            mode = "streamed" if stream else "whole"
+            print(f"{mode:>8}: {seconds:.2f} seconds, {peak / 1e6:.1f} MB peak")
+    finally:
+        os.remove(f.name)
@@ -0,0 +1,86 @@
+import argparse
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "tree_walk"))
+
+from lox import Lox
+
+ENGINES = ["tree", "closure", "vm", "python"]
+
+# Classes exercise the shapes, which all sessions share, and the errors check that
+# each session only sees its own.
+SCRIPTS = {
+    "fib": """
+fun fib(n) {
+  if (n < 2) return n;
+  return fib(n - 1) + fib(n - 2);
+}
+for (var i = 0; i < 12; i = i + 1) print fib(i);
+""",
+    "classes": """
+class Point {
+  init(x, y) {
+    this.x = x;
+    this.y = y;
+  }
+  sum() { return this.x + this.y; }
+}
+var total = 0;
+for (var i = 0; i < 200; i = i + 1) {
+  var point = Point(i, i * 2);
+  point.z = i;
+  total = total + point.sum() + point.z;
+}
+print total;
+""",
+    "collections": """
+var values = List();
+for (var i = 0; i < 50; i = i + 1) coll_append(values, 50 - i);
+coll_sort(values);
+print coll_join(values, ",");
+""",
+    "syntax error": """
+print "before";
+var = 1;
+""",
+    "runtime error": """
+print "before";
+print 1 + "one";
+print "after";
+""",
+}
+
+
+def run(engine: str, name: str) -> tuple[str, bool, bool]:
+    output = io.StringIO()
+    lox = Lox(engine, stdout=output)
+    lox.run(SCRIPTS[name])
+    return output.getvalue(), lox.diagnostics.had_error, lox.diagnostics.had_runtime_error
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Run many Lox sessions at once on threads, and check "
+                                                     "that each one's output and errors are its own.")
+    arg_parser.add_argument("--threads", type=int, default=16)
+    arg_parser.add_argument("--rounds", type=int, default=20, help="how many times to run each script on each engine")
+    args = arg_parser.parse_args()
+    # Switch threads far more often than usual, to interleave the sessions finely.
+    sys.setswitchinterval(1e-6)
+
+    jobs = [(engine, name) for engine in ENGINES for name in SCRIPTS]
+    expected = {job: run(*job) for job in jobs}
+
+    mismatches = 0
+    with ThreadPoolExecutor(args.threads) as executor:
+        futures = [(job, executor.submit(run, *job)) for _ in range(args.rounds) for job in jobs]
+        for job, future in futures:
+            if future.result() != expected[job]:
+                mismatches += 1
+                print(f"{job[0]} {job[1]}: expected {expected[job]!r}, got {future.result()!r}")
+
+    print(f"{len(futures)} sessions on {args.threads} threads, {mismatches} mismatched")
+    if mismatches:
+        sys.exit(1)
@@ -0,0 +1,100 @@
+from enum import IntEnum, auto
+from typing import Any
+
+
+class OpCode(IntEnum):
+    OP_CONSTANT = auto()
+    OP_NIL = auto()
+    OP_TRUE = auto()
+    OP_FALSE = auto()
+    OP_POP = auto()
+    OP_GET_LOCAL = auto()
+    OP_SET_LOCAL = auto()
+    OP_GET_GLOBAL = auto()
+    OP_DEFINE_GLOBAL = auto()
+    OP_SET_GLOBAL = auto()
+    OP_GET_UPVALUE = auto()
+    OP_SET_UPVALUE = auto()
+    OP_GET_PROPERTY = auto()
+    OP_SET_PROPERTY = auto()
+    OP_GET_SUPER = auto()
+    OP_EQUAL = auto()
+    OP_NOT_EQUAL = auto()
+    OP_GREATER = auto()
+    OP_GREATER_EQUAL = auto()
+    OP_LESS = auto()
+    OP_LESS_EQUAL = auto()
+    OP_ADD = auto()
+    OP_SUBTRACT = auto()
+    OP_MULTIPLY = auto()
+    OP_DIVIDE = auto()
+    OP_NOT = auto()
+    OP_NEGATE = auto()
+    OP_PRINT = auto()
+    OP_JUMP = auto()
+    OP_JUMP_IF_FALSE = auto()
+    OP_JUMP_IF_TRUE = auto()
+    OP_POP_JUMP_IF_FALSE = auto()
+    OP_CALL = auto()
+    OP_INVOKE = auto()
+    OP_SUPER_INVOKE = auto()
+    OP_CLOSURE = auto()
+    OP_CLOSE_UPVALUE = auto()
+    OP_RETURN = auto()
+    OP_CLASS = auto()
+    OP_INHERIT = auto()
+    OP_METHOD = auto()
+
+
+# Export the members as module constants (the same trick the `re` module uses
+# for its flags) so the VM's dispatch loop can compare against plain globals.
+globals().update(OpCode.__members__)
+
+
+class Chunk:
+    """
+    Unlike clox, operands are not packed into bytes. The code list holds opcodes and
+    their operands as plain ints, and jump operands are absolute offsets into the list.
+    """
+    __slots__ = ("code", "lines", "constants", "constant_index")
+
+    def __init__(self):
+        self.code: list[int] = []
+        self.lines: list[int] = []
+        self.constants: list[Any] = []
+        self.constant_index: dict[tuple[type, str], int] = {}
+
+    def write(self, byte: int, line: int) -> None:
+        self.code.append(byte)
+        self.lines.append(line)
+
+    def add_constant(self, value: Any) -> int:
+        # Constants are deduplicated so that, e.g., every use of the name "fib" in a
+        # function shares one slot. Keying on the repr keeps True apart from 1 and
+        # Decimal("1.0") apart from Decimal("1"), which print differently.
+        key = (type(value), repr(value))
+        index = self.constant_index.get(key)
+        if index is None:
+            index = len(self.constants)
+            self.constants.append(value)
+            self.constant_index[key] = index
+        return index
+
+
+class FunctionProto:
+    """
+    The compile time half of a Lox function: its bytecode and how many upvalues the
+    closures created from it need to capture.
+    """
+    __slots__ = ("name", "arity", "chunk", "upvalue_count")
+
+    def __init__(self, name: str | None, arity: int = 0):
+        self.name = name
+        self.arity = arity
+        self.chunk = Chunk()
+        self.upvalue_count = 0
+
+    def __str__(self) -> str:
+        if self.name is None:
+            return "<script>"
+        return f"<fn {self.name}>"
@@ -0,0 +1,672 @@
+from __future__ import annotations
+import weakref
+from operator import gt, ge, lt, le, sub, mul
+from typing import Any, Callable
+
+from environment import Environment, GlobalEnvironment
+from error import Diagnostics, NativeError, RunTimeError
+from output import Output
+from expr import Visitor as ExprVisitor, Expr, Assign, Binary, Call, Get, Grouping, Literal, Logical, Set, Super, This, Unary, Variable
+from lox_callable import NEXT, LoxCallable, Memo, TailCall
+from inline_cache import InlineCache, DEBUG_PRINT_INLINE_CACHES, print_inline_caches
+from lox_class import NO_FIELD, LoxClass, LoxInstance
+from natives import natives
+from number_backend import NumberBackend, DECIMAL
+from program import Program
+from stmt import Visitor as StmtVisitor, Stmt, Block, Class, Expression, Function, If, Print, Return, Var, While
+from token_type import Token, TokenType
+
+# A compiled expression evaluates itself in the given environment.
+ExprFn = Callable[[Environment], Any]
+# A compiled statement returns NEXT or a return value, as `Interpreter.execute` does.
+StmtFn = Callable[[Environment], Any]
+
+
+class CompiledFunction(LoxCallable):
+    """
+    The closure backend's counterpart to `LoxFunction`. Its body has already been
+    compiled, and `return` is signalled through the body's result instead of an exception.
+    """
+    def __init__(self, name: str, params: list[str], body: StmtFn, closure: Environment, is_initializer: bool = False,
+                 callees: frozenset[str] | None = None):
+        self.name = name
+        self.params = params
+        self.body = body
+        self.closure = closure
+        self.is_initializer = is_initializer
+        self.callees = callees # the globals it calls, if pure but for them
+
+    def arity(self) -> int:
+        return len(self.params)
+
+    def bind(self, instance: LoxInstance) -> CompiledFunction:
+        environment = Environment(self.closure, [instance])
+        return CompiledFunction(self.name, self.params, self.body, environment, self.is_initializer)
+
+    def invoke(self, interpreter: Any, instance: LoxInstance, arguments: list[Any]) -> Any:
+        result = self.body(Environment(Environment(self.closure, [instance]), arguments))
+        while result.__class__ is TailCall:
+            result = result.body(result.environment)
+
+        if self.is_initializer:
+            return instance
+        if result is NEXT:
+            return None
+        return result
+
+    def call(self, interpreter: Any, arguments: list[Any]) -> Any:
+        result = self.body(Environment(self.closure, arguments))
+        while result.__class__ is TailCall:
+            result = result.body(result.environment)
+
+        if self.is_initializer:
+            return self.closure.values[0]
+        if result is NEXT:
+            return None
+        return result
+
+    def __str__(self) -> str:
+        return f"<fn {self.name}>"
+
+
+class ClosureCompiler(ExprVisitor[ExprFn], StmtVisitor[StmtFn]):
+    """
+    Turns a resolved AST into a tree of Python closures, one per node.
+
+    Every decision the tree walker makes on each visit (which node type this is, which
+    operator, how far up the environment chain a variable lives) is made here once,
+    when the closure for the node is built. Running the program is then just a matter
+    of calling the closures.
+    """
+    def __init__(self, interpreter: ClosureInterpreter):
+        self.interpreter = interpreter
+        self.globals = interpreter.globals
+        self.locals = interpreter.locals
+        self.numbers = interpreter.numbers
+        # Zero while compiling top level code, whose declarations are globals.
+        self.scope_depth = 0
+
+    def compile(self, statements: list[Stmt]) -> list[StmtFn]:
+        return [self.compile_stmt(statement) for statement in statements]
+
+    def compile_stmt(self, stmt: Stmt) -> StmtFn:
+        return stmt.accept(self)
+
+    def compile_expr(self, expr: Expr) -> ExprFn:
+        return expr.accept(self)
+
+    def compile_body(self, statements: list[Stmt]) -> StmtFn:
+        """
+        Compiles a sequence of statements that run in an environment the caller creates.
+        """
+        self.scope_depth += 1
+        compiled = tuple(self.compile(statements))
+        self.scope_depth -= 1
+
+        if len(compiled) == 1:
+            return compiled[0]
+
+        def body(environment: Environment) -> Any:
+            for statement in compiled:
+                result = statement(environment)
+                if result is not NEXT:
+                    return result
+            return NEXT
+        return body
+
+    def visit_block_stmt(self, stmt: Block) -> StmtFn:
+        body = self.compile_body(stmt.statements)
+
+        def block(environment: Environment) -> Any:
+            return body(Environment(environment))
+        return block
+
+    def visit_class_stmt(self, stmt: Class) -> StmtFn:
+        name = stmt.name.lexeme
+        superclass_fn = None if stmt.superclass is None else self.compile_expr(stmt.superclass)
+        superclass_token = None if stmt.superclass is None else stmt.superclass.name
+        methods = [
+            (method.name.lexeme, [param.lexeme for param in method.params], self.compile_body(method.body))
+            for method in stmt.methods
+        ]
+        define = self.definition(name)
+
+        def class_declaration(environment: Environment) -> Any:
+            superclass = None
+            if superclass_fn is not None:
+                superclass = superclass_fn(environment)
+                if not isinstance(superclass, LoxClass):
+                    raise RunTimeError(superclass_token, "Superclass must be a class.")
+
+            method_environment = environment
+            if superclass is not None:
+                method_environment = Environment(environment, [superclass])
+
+            klass = LoxClass(name, superclass, {
+                method_name: CompiledFunction(method_name, params, body, method_environment, method_name == "init")
+                for method_name, params, body in methods
+            })
+            define(environment, klass)
+            return NEXT
+        return class_declaration
+
+    def visit_expression_stmt(self, stmt: Expression) -> StmtFn:
+        expression = self.compile_expr(stmt.expression)
+
+        def expression_statement(environment: Environment) -> Any:
+            expression(environment)
+            return NEXT
+        return expression_statement
+
+    def visit_function_stmt(self, stmt: Function) -> StmtFn:
+        name = stmt.name.lexeme
+        params = [param.lexeme for param in stmt.params]
+        body = self.compile_body(stmt.body)
+        callees = self.interpreter.pure_functions.get(stmt)
+
+        define = self.definition(name)
+
+        def function_declaration(environment: Environment) -> Any:
+            define(environment, CompiledFunction(name, params, body, environment, False, callees))
+            return NEXT
+        return function_declaration
+
+    def visit_if_stmt(self, stmt: If) -> StmtFn:
+        condition = self.compile_expr(stmt.condition)
+        then_branch = self.compile_stmt(stmt.then_branch)
+
+        if stmt.else_branch is None:
+            def if_then(environment: Environment) -> Any:
+                value = condition(environment)
+                if value is None or value is False:
+                    return NEXT
+                return then_branch(environment)
+            return if_then
+
+        else_branch = self.compile_stmt(stmt.else_branch)
+
+        def if_then_else(environment: Environment) -> Any:
+            value = condition(environment)
+            if value is None or value is False:
+                return else_branch(environment)
+            return then_branch(environment)
+        return if_then_else
+
+    def visit_print_stmt(self, stmt: Print) -> StmtFn:
+        expression = self.compile_expr(stmt.expression)
+        number_types = self.numbers.types
+        stringify = self.numbers.stringify
+        write_line = self.interpreter.output.write_line
+
+        def print_statement(environment: Environment) -> Any:
+            value = expression(environment)
+            if value is None:
+                write_line("nil")
+            elif value.__class__ in number_types:
+                write_line(stringify(value))
+            else:
+                write_line(str(value))
+            return NEXT
+        return print_statement
+
+    def visit_return_stmt(self, stmt: Return) -> StmtFn:
+        if stmt.value is None:
+            return lambda environment: None
+        if stmt in self.interpreter.tail_calls:
+            return self.tail_call(stmt.value)
+
+        value = self.compile_expr(stmt.value)
+        return value
+
+    def tail_call(self, expr: Call) -> StmtFn:
+        """
+        Compiles a call in tail position. Rather than call a Lox function, it returns the
+        TailCall for the function's trampoline to make.
+        """
+        # Calling a method found through a Get binds it first, unlike `invoke`.
+        callee = self.compile_expr(expr.callee)
+        arguments = tuple(self.compile_expr(argument) for argument in expr.arguments)
+        argc = len(arguments)
+        paren = expr.paren
+        interpreter = self.interpreter
+
+        def tail_call(environment: Environment) -> Any:
+            function = callee(environment)
+            values = [argument(environment) for argument in arguments]
+
+            if function.__class__ is CompiledFunction and not function.is_initializer:
+                if argc != len(function.params):
+                    raise RunTimeError(paren, f"Expected {len(function.params)} arguments but got {argc}.")
+                return TailCall(function.body, Environment(function.closure, values))
+
+            if not isinstance(function, LoxCallable):
+                raise RunTimeError(paren, "Can only call functions and classes.")
+            if argc != function.arity():
+                raise RunTimeError(paren, f"Expected {function.arity()} arguments but got {argc}.")
+            try:
+                return function.call(interpreter, values)
+            except NativeError as error:
+                raise RunTimeError(paren, error.message)
+            except RecursionError:
+                raise RunTimeError(paren, "Stack overflow.") from None
+        return tail_call
+
+    def visit_var_stmt(self, stmt: Var) -> StmtFn:
+        name = stmt.name.lexeme
+        initializer = None if stmt.initializer is None else self.compile_expr(stmt.initializer)
+
+        define = self.definition(name)
+
+        def var_declaration(environment: Environment) -> Any:
+            define(environment, None if initializer is None else initializer(environment))
+            return NEXT
+        return var_declaration
+
+    def visit_while_stmt(self, stmt: While) -> StmtFn:
+        condition = self.compile_expr(stmt.condition)
+        body = self.compile_stmt(stmt.body)
+
+        def while_loop(environment: Environment) -> Any:
+            while True:
+                value = condition(environment)
+                if value is None or value is False:
+                    return NEXT
+                result = body(environment)
+                if result is not NEXT:
+                    return result
+        return while_loop
+
+    def visit_assign_expr(self, expr: Assign) -> ExprFn:
+        name = expr.name.lexeme
+        token = expr.name
+        value = self.compile_expr(expr.value)
+        location = self.locals.get(expr, None)
+
+        if location is None:
+            globals = self.globals
+
+            def assign_global(environment: Environment) -> Any:
+                result = value(environment)
+                globals.assign(token, result)
+                return result
+            return assign_global
+
+        distance, slot = location
+        if distance == 0:
+            def assign_local(environment: Environment) -> Any:
+                result = value(environment)
+                environment.values[slot] = result
+                return result
+            return assign_local
+
+        def assign_enclosing(environment: Environment) -> Any:
+            result = value(environment)
+            environment.ancestor(distance).values[slot] = result
+            return result
+        return assign_enclosing
+
+    def visit_binary_expr(self, expr: Binary) -> ExprFn:
+        left = self.compile_expr(expr.left)
+        right = self.compile_expr(expr.right)
+        operator = expr.operator
+        number_types = self.numbers.types
+
+        match operator.token_type:
+            case TokenType.PLUS:
+                def add(environment: Environment) -> Any:
+                    a = left(environment)
+                    b = right(environment)
+                    if a.__class__ in number_types and b.__class__ in number_types or a.__class__ is b.__class__ is str:
+                        try:
+                            return a + b
+                        except ArithmeticError:
+                            raise RunTimeError(operator, "Number too large.") from None
+                    raise RunTimeError(operator, "Operands must be two strings or two numbers.")
+                return add
+            case TokenType.EQUAL_EQUAL:
+                return lambda environment: left(environment) == right(environment)
+            case TokenType.BANG_EQUAL:
+                return lambda environment: not left(environment) == right(environment)
+
+        # Everything else takes two numbers.
+        if operator.token_type == TokenType.SLASH:
+            divide = self.numbers.divide
+
+            def division(environment: Environment) -> Any:
+                a = left(environment)
+                b = right(environment)
+                if a.__class__ in number_types and b.__class__ in number_types:
+                    try:
+                        return divide(a, b)
+                    except NativeError as error:
+                        raise RunTimeError(operator, error.message)
+                raise RunTimeError(operator, "Operands must be numbers.")
+            return division
+
+        operation = NUMBER_OPERATIONS[operator.token_type]
+
+        def arithmetic(environment: Environment) -> Any:
+            a = left(environment)
+            b = right(environment)
+            if a.__class__ in number_types and b.__class__ in number_types:
+                try:
+                    return operation(a, b)
+                except ArithmeticError:
+                    raise RunTimeError(operator, "Number too large.") from None
+            raise RunTimeError(operator, "Operands must be numbers.")
+        return arithmetic
+
+    def visit_call_expr(self, expr: Call) -> ExprFn:
+        if isinstance(expr.callee, Get):
+            return self.invoke(expr, expr.callee)
+
+        callee = self.compile_expr(expr.callee)
+        arguments = tuple(self.compile_expr(argument) for argument in expr.arguments)
+        argc = len(arguments)
+        paren = expr.paren
+        interpreter = self.interpreter
+
+        def call(environment: Environment) -> Any:
+            function = callee(environment)
+            values = [argument(environment) for argument in arguments]
+
+            if function.__class__ is CompiledFunction:
+                if argc != len(function.params):
+                    raise RunTimeError(paren, f"Expected {len(function.params)} arguments but got {argc}.")
+                try:
+                    return function.call(None, values)
+                except RecursionError:
+                    # Python's stack ran out somewhere inside: this is the Lox call nearest it
+                    # with room left to report it.
+                    raise RunTimeError(paren, "Stack overflow.") from None
+
+            if not isinstance(function, LoxCallable):
+                raise RunTimeError(paren, "Can only call functions and classes.")
+            if argc != function.arity():
+                raise RunTimeError(paren, f"Expected {function.arity()} arguments but got {argc}.")
+            try:
+                return function.call(interpreter, values)
+            except NativeError as error:
+                raise RunTimeError(paren, error.message)
+            except RecursionError:
+                raise RunTimeError(paren, "Stack overflow.") from None
+        return call
+
+    def invoke(self, expr: Call, get: Get) -> ExprFn:
+        """
+        Compiles `object.name(...)` so that calling a method does not bind it first.
+        """
+        object = self.compile_expr(get.object)
+        arguments = tuple(self.compile_expr(argument) for argument in expr.arguments)
+        argc = len(arguments)
+        name = get.name
+        lexeme = name.lexeme
+        paren = expr.paren
+        interpreter = self.interpreter
+        cache = self.inline_cache(get)
+
+        def invoke(environment: Environment) -> Any:
+            instance = object(environment)
+            if not isinstance(instance, LoxInstance):
+                raise RunTimeError(name, "Only instances have properties.")
+
+            function = instance.field(lexeme)
+            if function is not NO_FIELD:
+                values = [argument(environment) for argument in arguments]
+                if not isinstance(function, LoxCallable):
+                    raise RunTimeError(paren, "Can only call functions and classes.")
+                if argc != function.arity():
+                    raise RunTimeError(paren, f"Expected {function.arity()} arguments but got {argc}.")
+                try:
+                    return function.call(interpreter, values)
+                except NativeError as error:
+                    raise RunTimeError(paren, error.message)
+                except RecursionError:
+                    raise RunTimeError(paren, "Stack overflow.") from None
+
+            method = cache.find_method(instance.klass)
+            if method is None:
+                raise RunTimeError(name, f"Undefined property '{lexeme}'.")
+            values = [argument(environment) for argument in arguments]
+            if argc != len(method.params):
+                raise RunTimeError(paren, f"Expected {len(method.params)} arguments but got {argc}.")
+            try:
+                return method.invoke(interpreter, instance, values)
+            except RecursionError:
+                raise RunTimeError(paren, "Stack overflow.") from None
+        return invoke
+
+    def visit_get_expr(self, expr: Get) -> ExprFn:
+        object = self.compile_expr(expr.object)
+        name = expr.name
+        cache = self.inline_cache(expr)
+
+        def get(environment: Environment) -> Any:
+            instance = object(environment)
+            if isinstance(instance, LoxInstance):
+                return instance.get(name, cache)
+            raise RunTimeError(name, "Only instances have properties.")
+        return get
+
+    def inline_cache(self, expr: Get) -> InlineCache:
+        cache = InlineCache(expr.name)
+        self.interpreter.all_inline_caches.add(cache)
+        if DEBUG_PRINT_INLINE_CACHES:
+            # Only kept for the report. The compiled code holds on to its own caches.
+            self.interpreter.inline_caches[expr] = cache
+        return cache
+
+    def visit_grouping_expr(self, expr: Grouping) -> ExprFn:
+        return self.compile_expr(expr.expression)
+
+    def visit_literal_expr(self, expr: Literal) -> ExprFn:
+        value = expr.value
+        return lambda environment: value
+
+    def visit_logical_expr(self, expr: Logical) -> ExprFn:
+        left = self.compile_expr(expr.left)
+        right = self.compile_expr(expr.right)
+
+        if expr.operator.token_type == TokenType.OR:
+            def logical_or(environment: Environment) -> Any:
+                value = left(environment)
+                if value is None or value is False:
+                    return right(environment)
+                return value
+            return logical_or
+
+        def logical_and(environment: Environment) -> Any:
+            value = left(environment)
+            if value is None or value is False:
+                return value
+            return right(environment)
+        return logical_and
+
+    def visit_set_expr(self, expr: Set) -> ExprFn:
+        object = self.compile_expr(expr.object)
+        value = self.compile_expr(expr.value)
+        name = expr.name
+
+        def set(environment: Environment) -> Any:
+            instance = object(environment)
+            if not isinstance(instance, LoxInstance):
+                raise RunTimeError(name, "Only instances have fields.")
+            result = value(environment)
+            instance.set(name, result)
+            return result
+        return set
+
+    def visit_super_expr(self, expr: Super) -> ExprFn:
+        distance, _ = self.locals[expr]
+        method = expr.method
+
+        def super_method(environment: Environment) -> Any:
+            superclass = environment.get_at(distance, 0)
+            instance = environment.get_at(distance - 1, 0)
+            function = superclass.find_method(method.lexeme)
+            if function is None:
+                raise RunTimeError(method, f"Undefined property '{method.lexeme}'.")
+            return function.bind(instance)
+        return super_method
+
+    def visit_this_expr(self, expr: This) -> ExprFn:
+        return self.variable(expr, expr.keyword)
+
+    def visit_unary_expr(self, expr: Unary) -> ExprFn:
+        right = self.compile_expr(expr.right)
+        operator = expr.operator
+
+        if operator.token_type == TokenType.BANG:
+            def logical_not(environment: Environment) -> Any:
+                value = right(environment)
+                return value is None or value is False
+            return logical_not
+
+        number_types = self.numbers.types
+
+        def negate(environment: Environment) -> Any:
+            value = right(environment)
+            if value.__class__ in number_types:
+                return -value
+            raise RunTimeError(operator, "Operand must be a number.")
+        return negate
+
+    def visit_variable_expr(self, expr: Variable) -> ExprFn:
+        return self.variable(expr, expr.name)
+
+    def variable(self, expr: Expr, name: Token) -> ExprFn:
+        lexeme = name.lexeme
+        location = self.locals.get(expr, None)
+
+        if location is None:
+            values = self.globals.values
+
+            def global_variable(environment: Environment) -> Any:
+                try:
+                    return values[lexeme]
+                except KeyError:
+                    raise RunTimeError(name, f"Undefined variable '{lexeme}' during get.") from None
+            return global_variable
+
+        distance, slot = location
+        if distance == 0:
+            return lambda environment: environment.values[slot]
+        if distance == 1:
+            return lambda environment: environment.enclosing.values[slot]
+        return lambda environment: environment.ancestor(distance).values[slot]
+
+    def definition(self, name: str) -> Callable[[Environment, Any], None]:
+        """
+        Returns how a declaration at the current scope depth stores its value: by name
+        in the globals, or in the next slot of the local environment.
+        """
+        if self.scope_depth == 0:
+            values = self.globals.values
+
+            def define_global(environment: Environment, value: Any) -> None:
+                values[name] = value
+            return define_global
+
+        def define_local(environment: Environment, value: Any) -> None:
+            environment.values.append(value)
+        return define_local
+
+
+NUMBER_OPERATIONS: dict[TokenType, Callable[[Any, Any], Any]] = {
+    TokenType.GREATER: gt,
+    TokenType.GREATER_EQUAL: ge,
+    TokenType.LESS: lt,
+    TokenType.LESS_EQUAL: le,
+    TokenType.MINUS: sub,
+    TokenType.STAR: mul,
+}
+
+
+class ClosureInterpreter:
+    """
+    Runs programs through `ClosureCompiler`. It keeps the same resolver interface and
+    globals as `Interpreter`, so it is a drop in replacement in `Lox`.
+    """
+    def __init__(self, numbers: NumberBackend = DECIMAL, diagnostics: Diagnostics | None = None,
+                 output: Output | None = None):
+        self.numbers = numbers
+        self.diagnostics = Diagnostics() if diagnostics is None else diagnostics
+        self.output = Output() if output is None else output
+        self.memo = Memo(numbers)
+        # What every run starts with. See `reset`.
+        self.natives: dict[str, LoxCallable] = {**natives(numbers), "memo": self.memo}
+        self.globals = GlobalEnvironment(dict(self.natives))
+        self.locals: dict[Expr, tuple[int, int]] = {}
+        self.inline_caches: dict[Get, InlineCache] = {}
+        # Every cache the compiled code holds, so that `reset` can clear them.
+        self.all_inline_caches: weakref.WeakSet[InlineCache] = weakref.WeakSet()
+        self.tail_calls: set[Return] = set()
+        self.pure_functions: dict[Function, frozenset[str]] = {}
+
+    def resolve(self, expr: Expr, depth: int, slot: int) -> None:
+        self.locals[expr] = (depth, slot)
+
+    def resolve_tail_call(self, stmt: Return) -> None:
+        self.tail_calls.add(stmt)
+
+    def resolve_pure(self, function: Function, callees: frozenset[str]) -> None:
+        self.pure_functions[function] = callees
+
+    def pure_callees(self, function: LoxCallable) -> frozenset[str] | None:
+        return function.callees if isinstance(function, CompiledFunction) else None
+
+    def release(self, program: Program) -> None:
+        """
+        Forgets the resolutions of a program that has finished running, which the compiled
+        closures no longer need.
+        """
+        for expr, _, _ in program.resolutions:
+            self.locals.pop(expr, None)
+        for stmt in program.tail_calls:
+            self.tail_calls.discard(stmt)
+        for function, _ in program.pure_functions:
+            self.pure_functions.pop(function, None)
+
+    def interpret(self, statements: list[Stmt]) -> None:
+        self.run_prepared(self.prepare(statements))
+
+    def prepare(self, statements: list[Stmt]) -> list[StmtFn]:
+        return ClosureCompiler(self).compile(statements)
+
+    def reset(self, values: dict[str, Any], diagnostics: Diagnostics) -> None:
+        """
+        Starts a fresh run, where only the natives and `values` are defined. The compiled
+        closures hold on to the dict of globals, so it is refilled rather than replaced.
+        """
+        self.globals.values.clear()
+        self.globals.values.update(self.natives)
+        self.globals.values.update(values)
+        self.diagnostics = diagnostics
+        for cache in self.all_inline_caches:
+            cache.clear()
+
+    def call_global(self, name: str, arguments: list[Any]) -> Any:
+        """
+        Calls a global function or class from Python, as `Script.call` does. Raises
+        RunTimeError if that fails.
+        """
+        token = Token(TokenType.IDENTIFIER, name, None, 0)
+        function = self.globals.get(token)
+        if not isinstance(function, LoxCallable):
+            raise RunTimeError(token, "Can only call functions and classes.")
+        if len(arguments) != function.arity():
+            raise RunTimeError(token, f"Expected {function.arity()} arguments but got {len(arguments)}.")
+        try:
+            return function.call(self, arguments)
+        except NativeError as error:
+            raise RunTimeError(token, error.message)
+
+    def run_prepared(self, program: list[StmtFn]) -> None:
+        try:
+            for statement in program:
+                statement(self.globals)
+        except RunTimeError as error:
+            self.diagnostics.runtime_error(error)
+
+        if DEBUG_PRINT_INLINE_CACHES:
+            print_inline_caches(list(self.inline_caches.values()))
@@ -0,0 +1,439 @@
+from __future__ import annotations
+from enum import Enum
+
+from chunk import Chunk, FunctionProto, OpCode
+from expr import Visitor as ExprVisitor, Expr, Assign, Binary, Call, Get, Grouping, Literal, Logical, Set, Super, This, Unary, Variable
+from stmt import Visitor as StmtVisitor, Stmt, Block, Class, Expression, Function, If, Print, Return, Var, While
+from token_type import Token, TokenType
+
+
+class FunctionType(str, Enum):
+    SCRIPT = "script"
+    FUNCTION = "function"
+    INITIALIZER = "initializer"
+    METHOD = "method"
+
+
+class Local:
+    __slots__ = ("name", "depth", "is_captured")
+
+    def __init__(self, name: str, depth: int):
+        self.name = name
+        self.depth = depth
+        self.is_captured = False
+
+
+class FunctionState:
+    """
+    Per function compiler state, the equivalent of clox's `Compiler` struct. These form
+    a linked list through `enclosing` while nested functions are being compiled.
+    """
+    def __init__(self, enclosing: FunctionState | None, function: FunctionProto, function_type: FunctionType):
+        self.enclosing = enclosing
+        self.function = function
+        self.function_type = function_type
+        self.upvalues: list[tuple[bool, int]] = [] # (is_local, index)
+        self.scope_depth = 0
+
+        # Slot zero holds the callee, or `this` inside methods.
+        slot_zero = "this" if function_type in (FunctionType.METHOD, FunctionType.INITIALIZER) else ""
+        self.locals: list[Local] = [Local(slot_zero, 0)]
+
+
+class ClassState:
+    def __init__(self, enclosing: ClassState | None):
+        self.enclosing = enclosing
+        self.has_superclass = False
+
+
+BINARY_OPS = {
+    TokenType.BANG_EQUAL: OpCode.OP_NOT_EQUAL,
+    TokenType.EQUAL_EQUAL: OpCode.OP_EQUAL,
+    TokenType.GREATER: OpCode.OP_GREATER,
+    TokenType.GREATER_EQUAL: OpCode.OP_GREATER_EQUAL,
+    TokenType.LESS: OpCode.OP_LESS,
+    TokenType.LESS_EQUAL: OpCode.OP_LESS_EQUAL,
+    TokenType.PLUS: OpCode.OP_ADD,
+    TokenType.MINUS: OpCode.OP_SUBTRACT,
+    TokenType.STAR: OpCode.OP_MULTIPLY,
+    TokenType.SLASH: OpCode.OP_DIVIDE,
+}
+
+
+class Compiler(ExprVisitor[None], StmtVisitor[None]):
+    """
+    Compiles a resolved AST into bytecode for the VM.
+
+    The parser and resolver have already reported every compile error, so unlike clox's
+    single pass compiler this one never has to. Variable resolution is redone here though,
+    because the VM addresses locals by stack slot and captured variables by upvalue index
+    rather than by environment depth.
+    """
+    def __init__(self):
+        self.current: FunctionState | None = None
+        self.current_class: ClassState | None = None
+        # The line of the statement or expression being compiled, stamped onto every
+        # instruction so that runtime errors can report it.
+        self.line = 0
+
+    def compile(self, statements: list[Stmt]) -> FunctionProto:
+        self.current = FunctionState(None, FunctionProto(None), FunctionType.SCRIPT)
+        for statement in statements:
+            self.compile_stmt(statement)
+        return self.end_function()
+
+    def visit_block_stmt(self, stmt: Block) -> None:
+        self.begin_scope()
+        for statement in stmt.statements:
+            self.compile_stmt(statement)
+        self.end_scope()
+
+    def visit_class_stmt(self, stmt: Class) -> None:
+        self.line = stmt.name.line
+        name_constant = self.identifier_constant(stmt.name)
+        self.declare_variable(stmt.name)
+
+        self.emit(OpCode.OP_CLASS, name_constant)
+        self.define_variable(name_constant)
+
+        class_state = ClassState(self.current_class)
+        self.current_class = class_state
+
+        if stmt.superclass is not None:
+            self.visit_variable_expr(stmt.superclass)
+
+            self.begin_scope()
+            self.add_local("super")
+            self.mark_initialized()
+
+            self.named_variable(stmt.name)
+            self.emit(OpCode.OP_INHERIT)
+            class_state.has_superclass = True
+
+        self.named_variable(stmt.name)
+        for method in stmt.methods:
+            function_type = FunctionType.INITIALIZER if method.name.lexeme == "init" else FunctionType.METHOD
+            self.function(method, function_type)
+            self.line = method.name.line
+            self.emit(OpCode.OP_METHOD, self.identifier_constant(method.name))
+        self.emit(OpCode.OP_POP)
+
+        if class_state.has_superclass:
+            self.end_scope()
+
+        self.current_class = class_state.enclosing
+
+    def visit_expression_stmt(self, stmt: Expression) -> None:
+        self.compile_expr(stmt.expression)
+        self.emit(OpCode.OP_POP)
+
+    def visit_function_stmt(self, stmt: Function) -> None:
+        self.line = stmt.name.line
+        global_constant = self.parse_variable(stmt.name)
+        # A function may refer to itself, so it is usable before its body is compiled.
+        self.mark_initialized()
+        self.function(stmt, FunctionType.FUNCTION)
+        self.define_variable(global_constant)
+
+    def visit_if_stmt(self, stmt: If) -> None:
+        self.compile_expr(stmt.condition)
+        else_jump = self.emit_jump(OpCode.OP_POP_JUMP_IF_FALSE)
+        self.compile_stmt(stmt.then_branch)
+
+        if stmt.else_branch is None:
+            self.patch_jump(else_jump)
+            return
+
+        end_jump = self.emit_jump(OpCode.OP_JUMP)
+        self.patch_jump(else_jump)
+        self.compile_stmt(stmt.else_branch)
+        self.patch_jump(end_jump)
+
+    def visit_print_stmt(self, stmt: Print) -> None:
+        self.compile_expr(stmt.expression)
+        self.emit(OpCode.OP_PRINT)
+
+    def visit_return_stmt(self, stmt: Return) -> None:
+        self.line = stmt.keyword.line
+        if self.current.function_type == FunctionType.INITIALIZER:
+            # The resolver guarantees there is no value to return.
+            self.emit(OpCode.OP_GET_LOCAL, 0)
+        elif stmt.value is None:
+            self.emit(OpCode.OP_NIL)
+        else:
+            self.compile_expr(stmt.value)
+        self.emit(OpCode.OP_RETURN)
+
+    def visit_var_stmt(self, stmt: Var) -> None:
+        self.line = stmt.name.line
+        global_constant = self.parse_variable(stmt.name)
+
+        if stmt.initializer is not None:
+            self.compile_expr(stmt.initializer)
+        else:
+            self.emit(OpCode.OP_NIL)
+
+        self.define_variable(global_constant)
+
+    def visit_while_stmt(self, stmt: While) -> None:
+        loop_start = len(self.current_chunk().code)
+        self.compile_expr(stmt.condition)
+
+        exit_jump = self.emit_jump(OpCode.OP_POP_JUMP_IF_FALSE)
+        self.compile_stmt(stmt.body)
+        self.emit(OpCode.OP_JUMP, loop_start)
+
+        self.patch_jump(exit_jump)
+
+    def visit_assign_expr(self, expr: Assign) -> None:
+        self.compile_expr(expr.value)
+        self.line = expr.name.line
+        self.set_variable(expr.name)
+
+    def visit_binary_expr(self, expr: Binary) -> None:
+        self.compile_expr(expr.left)
+        self.compile_expr(expr.right)
+        self.line = expr.operator.line
+        self.emit(BINARY_OPS[expr.operator.token_type])
+
+    def visit_call_expr(self, expr: Call) -> None:
+        callee = expr.callee
+
+        # Method calls are compiled to a single invoke so that the VM does not have to
+        # allocate a bound method only to call it straight away.
+        if isinstance(callee, Get):
+            self.compile_expr(callee.object)
+            self.compile_arguments(expr.arguments)
+            self.line = expr.paren.line
+            self.emit(OpCode.OP_INVOKE, self.identifier_constant(callee.name), len(expr.arguments))
+            return
+
+        if isinstance(callee, Super):
+            self.named_variable(Token(TokenType.THIS, "this", None, callee.keyword.line))
+            self.compile_arguments(expr.arguments)
+            self.named_variable(callee.keyword)
+            self.line = expr.paren.line
+            self.emit(OpCode.OP_SUPER_INVOKE, self.identifier_constant(callee.method), len(expr.arguments))
+            return
+
+        self.compile_expr(callee)
+        self.compile_arguments(expr.arguments)
+        self.line = expr.paren.line
+        self.emit(OpCode.OP_CALL, len(expr.arguments))
+
+    def visit_get_expr(self, expr: Get) -> None:
+        self.compile_expr(expr.object)
+        self.line = expr.name.line
+        self.emit(OpCode.OP_GET_PROPERTY, self.identifier_constant(expr.name))
+
+    def visit_grouping_expr(self, expr: Grouping) -> None:
+        self.compile_expr(expr.expression)
+
+    def visit_literal_expr(self, expr: Literal) -> None:
+        if expr.value is None:
+            self.emit(OpCode.OP_NIL)
+        elif expr.value is True:
+            self.emit(OpCode.OP_TRUE)
+        elif expr.value is False:
+            self.emit(OpCode.OP_FALSE)
+        else:
+            self.emit(OpCode.OP_CONSTANT, self.make_constant(expr.value))
+
+    def visit_logical_expr(self, expr: Logical) -> None:
+        self.compile_expr(expr.left)
+
+        jump = OpCode.OP_JUMP_IF_TRUE if expr.operator.token_type == TokenType.OR else OpCode.OP_JUMP_IF_FALSE
+        end_jump = self.emit_jump(jump)
+        self.emit(OpCode.OP_POP)
+        self.compile_expr(expr.right)
+        self.patch_jump(end_jump)
+
+    def visit_set_expr(self, expr: Set) -> None:
+        self.compile_expr(expr.object)
+        self.compile_expr(expr.value)
+        self.line = expr.name.line
+        self.emit(OpCode.OP_SET_PROPERTY, self.identifier_constant(expr.name))
+
+    def visit_super_expr(self, expr: Super) -> None:
+        self.line = expr.keyword.line
+        self.named_variable(Token(TokenType.THIS, "this", None, expr.keyword.line))
+        self.named_variable(expr.keyword)
+        self.emit(OpCode.OP_GET_SUPER, self.identifier_constant(expr.method))
+
+    def visit_this_expr(self, expr: This) -> None:
+        self.line = expr.keyword.line
+        self.named_variable(expr.keyword)
+
+    def visit_unary_expr(self, expr: Unary) -> None:
+        self.compile_expr(expr.right)
+        self.line = expr.operator.line
+        if expr.operator.token_type == TokenType.BANG:
+            self.emit(OpCode.OP_NOT)
+        else:
+            self.emit(OpCode.OP_NEGATE)
+
+    def visit_variable_expr(self, expr: Variable) -> None:
+        self.line = expr.name.line
+        self.named_variable(expr.name)
+
+    def compile_stmt(self, stmt: Stmt) -> None:
+        stmt.accept(self)
+
+    def compile_expr(self, expr: Expr) -> None:
+        expr.accept(self)
+
+    def compile_arguments(self, arguments: list[Expr]) -> None:
+        for argument in arguments:
+            self.compile_expr(argument)
+
+    def function(self, declaration: Function, function_type: FunctionType) -> None:
+        function = FunctionProto(declaration.name.lexeme, len(declaration.params))
+        self.current = FunctionState(self.current, function, function_type)
+        self.begin_scope()
+
+        for param in declaration.params:
+            self.add_local(param.lexeme)
+            self.mark_initialized()
+
+        for statement in declaration.body:
+            self.compile_stmt(statement)
+
+        state = self.current
+        self.end_function()
+
+        self.line = declaration.name.line
+        self.emit(OpCode.OP_CLOSURE, self.make_constant(function))
+        for is_local, index in state.upvalues:
+            self.emit(1 if is_local else 0, index)
+
+    def end_function(self) -> FunctionProto:
+        self.emit_return()
+        function = self.current.function
+        function.upvalue_count = len(self.current.upvalues)
+        self.current = self.current.enclosing
+        return function
+
+    def named_variable(self, name: Token) -> None:
+        slot = self.resolve_local(self.current, name.lexeme)
+        if slot != -1:
+            self.emit(OpCode.OP_GET_LOCAL, slot)
+            return
+
+        index = self.resolve_upvalue(self.current, name.lexeme)
+        if index != -1:
+            self.emit(OpCode.OP_GET_UPVALUE, index)
+            return
+
+        self.emit(OpCode.OP_GET_GLOBAL, self.identifier_constant(name))
+
+    def set_variable(self, name: Token) -> None:
+        slot = self.resolve_local(self.current, name.lexeme)
+        if slot != -1:
+            self.emit(OpCode.OP_SET_LOCAL, slot)
+            return
+
+        index = self.resolve_upvalue(self.current, name.lexeme)
+        if index != -1:
+            self.emit(OpCode.OP_SET_UPVALUE, index)
+            return
+
+        self.emit(OpCode.OP_SET_GLOBAL, self.identifier_constant(name))
+
+    def resolve_local(self, state: FunctionState, name: str) -> int:
+        for i in range(len(state.locals) - 1, -1, -1):
+            local = state.locals[i]
+            # Locals still being initialized (depth -1) are skipped so that
+            # `var a = a;` in a nested scope reads the outer `a`. The resolver rejects
+            # this for locals in the same scope.
+            if local.name == name and local.depth != -1:
+                return i
+        return -1
+
+    def resolve_upvalue(self, state: FunctionState, name: str) -> int:
+        if state.enclosing is None:
+            return -1
+
+        local = self.resolve_local(state.enclosing, name)
+        if local != -1:
+            state.enclosing.locals[local].is_captured = True
+            return self.add_upvalue(state, True, local)
+
+        upvalue = self.resolve_upvalue(state.enclosing, name)
+        if upvalue != -1:
+            return self.add_upvalue(state, False, upvalue)
+
+        return -1
+
+    def add_upvalue(self, state: FunctionState, is_local: bool, index: int) -> int:
+        upvalue = (is_local, index)
+        if upvalue in state.upvalues:
+            return state.upvalues.index(upvalue)
+        state.upvalues.append(upvalue)
+        return len(state.upvalues) - 1
+
+    def parse_variable(self, name: Token) -> int:
+        self.declare_variable(name)
+        if self.current.scope_depth > 0:
+            return 0
+        return self.identifier_constant(name)
+
+    def declare_variable(self, name: Token) -> None:
+        if self.current.scope_depth == 0:
+            return
+        self.add_local(name.lexeme)
+
+    def define_variable(self, global_constant: int) -> None:
+        if self.current.scope_depth > 0:
+            self.mark_initialized()
+            return
+        self.emit(OpCode.OP_DEFINE_GLOBAL, global_constant)
+
+    def add_local(self, name: str) -> None:
+        self.current.locals.append(Local(name, -1))
+
+    def mark_initialized(self) -> None:
+        if self.current.scope_depth == 0:
+            return
+        self.current.locals[-1].depth = self.current.scope_depth
+
+    def begin_scope(self) -> None:
+        self.current.scope_depth += 1
+
+    def end_scope(self) -> None:
+        state = self.current
+        state.scope_depth -= 1
+
+        while state.locals and state.locals[-1].depth > state.scope_depth:
+            if state.locals[-1].is_captured:
+                self.emit(OpCode.OP_CLOSE_UPVALUE)
+            else:
+                self.emit(OpCode.OP_POP)
+            state.locals.pop()
+
+    def identifier_constant(self, name: Token) -> int:
+        return self.make_constant(name.lexeme)
+
+    def make_constant(self, value) -> int:
+        return self.current_chunk().add_constant(value)
+
+    def current_chunk(self) -> Chunk:
+        return self.current.function.chunk
+
+    def emit(self, *codes: int) -> None:
+        chunk = self.current_chunk()
+        for code in codes:
+            chunk.write(code, self.line)
+
+    def emit_jump(self, instruction: OpCode) -> int:
+        self.emit(instruction, -1)
+        return len(self.current_chunk().code) - 1
+
+    def patch_jump(self, offset: int) -> None:
+        self.current_chunk().code[offset] = len(self.current_chunk().code)
+
+    def emit_return(self) -> None:
+        if self.current.function_type == FunctionType.INITIALIZER:
+            self.emit(OpCode.OP_GET_LOCAL, 0)
+        else:
+            self.emit(OpCode.OP_NIL)
+        self.emit(OpCode.OP_RETURN)
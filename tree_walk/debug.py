@@ -0,0 +1,66 @@
+from chunk import Chunk, FunctionProto, OpCode
+
+CONSTANT_INSTRUCTIONS = {
+    OpCode.OP_CONSTANT, OpCode.OP_GET_GLOBAL, OpCode.OP_DEFINE_GLOBAL, OpCode.OP_SET_GLOBAL,
+    OpCode.OP_GET_PROPERTY, OpCode.OP_SET_PROPERTY, OpCode.OP_GET_SUPER, OpCode.OP_CLASS,
+    OpCode.OP_METHOD,
+}
+BYTE_INSTRUCTIONS = {
+    OpCode.OP_GET_LOCAL, OpCode.OP_SET_LOCAL, OpCode.OP_GET_UPVALUE, OpCode.OP_SET_UPVALUE,
+    OpCode.OP_CALL,
+}
+JUMP_INSTRUCTIONS = {
+    OpCode.OP_JUMP, OpCode.OP_JUMP_IF_FALSE, OpCode.OP_JUMP_IF_TRUE, OpCode.OP_POP_JUMP_IF_FALSE,
+}
+INVOKE_INSTRUCTIONS = {OpCode.OP_INVOKE, OpCode.OP_SUPER_INVOKE}
+
+
+def disassemble_chunk(chunk: Chunk, name: str) -> None:
+    print(f"== {name} ==")
+    offset = 0
+    while offset < len(chunk.code):
+        offset = disassemble_instruction(chunk, offset)
+
+    # Nested functions live in the constant table.
+    for constant in chunk.constants:
+        if isinstance(constant, FunctionProto):
+            disassemble_chunk(constant.chunk, str(constant))
+
+
+def disassemble_instruction(chunk: Chunk, offset: int) -> int:
+    line = f"{offset:04d} "
+    if offset > 0 and chunk.lines[offset] == chunk.lines[offset - 1]:
+        line += "   | "
+    else:
+        line += f"{chunk.lines[offset]:4d} "
+
+    instruction = OpCode(chunk.code[offset])
+    name = instruction.name
+
+    if instruction in CONSTANT_INSTRUCTIONS:
+        constant = chunk.code[offset + 1]
+        print(f"{line}{name:<16} {constant:4d} '{chunk.constants[constant]}'")
+        return offset + 2
+    if instruction in BYTE_INSTRUCTIONS:
+        print(f"{line}{name:<16} {chunk.code[offset + 1]:4d}")
+        return offset + 2
+    if instruction in JUMP_INSTRUCTIONS:
+        print(f"{line}{name:<16} {offset:4d} -> {chunk.code[offset + 1]}")
+        return offset + 2
+    if instruction in INVOKE_INSTRUCTIONS:
+        constant = chunk.code[offset + 1]
+        print(f"{line}{name:<16} ({chunk.code[offset + 2]} args) {constant:4d} '{chunk.constants[constant]}'")
+        return offset + 3
+    if instruction == OpCode.OP_CLOSURE:
+        constant = chunk.code[offset + 1]
+        function = chunk.constants[constant]
+        print(f"{line}{name:<16} {constant:4d} {function}")
+        offset += 2
+        for _ in range(function.upvalue_count):
+            kind = "local" if chunk.code[offset] else "upvalue"
+            print(f"{offset:04d}    |                     {kind} {chunk.code[offset + 1]}")
+            offset += 2
+        return offset
+
+    print(f"{line}{name}")
+    return offset + 1
@@ -5,19 +5,19 @@ from token_type import Token
 from error import RunTimeError
 
 class Environment:
-    def __init__(self, enclosing: Environment | None = None):
-        self.values = {}
+    """
+    A local scope. The resolver numbers the variables of each scope in declaration
+    order, and declarations run in that same order, so `define` just appends and every
+    variable is found by (distance, slot) without hashing its name.
+    """
+    __slots__ = ("values", "enclosing")
+
+    def __init__(self, enclosing: Environment | GlobalEnvironment | None = None, values: list[Any] | None = None):
+        self.values: list[Any] = [] if values is None else values
         self.enclosing = enclosing
 
-    def get(self, name: Token) -> Any:
-        if name.lexeme in self.values:
-            return self.values[name.lexeme]
-        if self.enclosing != None:
-            return self.enclosing.get(name)
-        raise RunTimeError(name, f"Undefined variable '{name.lexeme}' during get.")
-
-    def get_at(self, distance: int, name: str) -> Any:
-        return self.ancestor(distance).values[name]
+    def get_at(self, distance: int, slot: int) -> Any:
+        return self.ancestor(distance).values[slot]
 
     def ancestor(self, distance: int) -> Environment:
         environment = self
@@ -25,6 +25,28 @@ class Environment:
             environment = environment.enclosing
         return environment
 
+    def define(self, value: Any) -> None:
+        self.values.append(value)
+
+    def assign_at(self, distance: int, slot: int, value: Any) -> None:
+        self.ancestor(distance).values[slot] = value
+
+
+class GlobalEnvironment:
+    """
+    Globals are late bound (a function may use a global declared after it) and can be
+    redeclared, so unlike locals they are looked up by name.
+    """
+    __slots__ = ("values",)
+
+    def __init__(self, values: dict[str, Any] | None = None):
+        self.values: dict[str, Any] = {} if values is None else values
+
+    def get(self, name: Token) -> Any:
+        if name.lexeme in self.values:
+            return self.values[name.lexeme]
+        raise RunTimeError(name, f"Undefined variable '{name.lexeme}' during get.")
+
     def define(self, name: str, value: Any) -> None:
         self.values[name] = value
 
@@ -32,10 +54,4 @@ class Environment:
         if name.lexeme in self.values:
             self.values[name.lexeme] = value
             return
-        if self.enclosing != None:
-            self.enclosing.assign(name, value)
-            return
         raise RunTimeError(name, f"Undefined variable '{name.lexeme}' during assignment.")
-
-    def assign_at(self, distance: int, name: Token, value: Any) -> None:
-        self.ancestor(distance).values[name.lexeme] = value
\ No newline at end of file
@@ -1,4 +1,6 @@
-from typing import Any
+import sys
+from typing import TextIO
+
 from token_type import Token, TokenType
 
 class ParseError(Exception):
@@ -12,38 +14,47 @@ class RunTimeError(RuntimeError):
         self.message = message
         self.token = token
 
-class ReturnError(RunTimeError):
+class NativeError(Exception):
+    """
+    Raised by a native function, or a number backend's `divide`. The engine reports it
+    as a runtime error at the call or the operator.
     """
-    This "error" isn't really an error. It is purely used to signal a return from a function to the interpreter.
-    As such, we are able to use the Python call stack for control flow to "break out of" functions.
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.message = message
 
-    It probably shouldn't be here, but it is.
+class Diagnostics:
     """
-    def __init__(self, value: Any):
-        super().__init__(None, "")
-        self.value = value
+    The errors of one session: whether there have been any, which decides the exit
+    status, and where they are reported. Every session has its own, so that sessions
+    running side by side, even on different threads, never see each other's errors.
 
-class Error:
-    had_error = False
-    had_runtime_error = False
+    Errors are written to `output`, or to whatever `sys.stdout` is at the time if it
+    is None, and flushed at once, along with whatever was printed before them.
+    """
+    def __init__(self, output: TextIO | None = None):
+        self.output = output
+        self.had_error = False
+        self.had_runtime_error = False
 
-    @classmethod
-    def error(cls, line: int, message: str):
-        cls.report(line, "", message)
+    def error(self, line: int, message: str):
+        self.report(line, "", message)
 
-    @classmethod
-    def error_token(cls, token: Token, message: str):
+    def error_token(self, token: Token, message: str):
         if token.token_type == TokenType.EOF:
-            cls.report(token.line, " at end", message)
+            self.report(token.line, " at end", message)
         else:
-            cls.report(token.line, f" at '{token.lexeme}'", message)
+            self.report(token.line, f" at '{token.lexeme}'", message)
+
+    def runtime_error(self, error: RunTimeError):
+        print(f"{error.message}\n[line {error.token.line}]", file=self.output)
+        self.flush()
+        self.had_runtime_error = True
 
-    @classmethod
-    def runtime_error(cls, error: RunTimeError):
-        print(f"{error.message}\n[line {error.token.line}]")
-        cls.had_runtime_error = True
+    def report(self, line: int, where: str, message: str):
+        print(f"[line {line}] Error {where}: {message}", file=self.output)
+        self.flush()
+        self.had_error = True
 
-    @classmethod
-    def report(cls, line: int, where: str, message: str):
-        print(f"[line {line}] Error {where}: {message}")
-        cls.had_error = True
\ No newline at end of file
+    def flush(self):
+        (sys.stdout if self.output is None else self.output).flush()
\ No newline at end of file
@@ -10,11 +10,15 @@ from token_type import Token
 T = TypeVar('T')
 
 class Expr(ABC):
+	__slots__ = ()
+
 	@abstractmethod
 	def accept(self, visitor: 'Visitor[T]') -> T:
 		pass
 
 class Assign(Expr):
+	__slots__ = ('name', 'value')
+
 	def __init__(self, name: Token, value: Expr):
 		self.name = name
 		self.value = value
@@ -23,6 +27,8 @@ class Assign(Expr):
 		return visitor.visit_assign_expr(self)
 
 class Binary(Expr):
+	__slots__ = ('left', 'operator', 'right')
+
 	def __init__(self, left: Expr, operator: Token, right: Expr):
 		self.left = left
 		self.operator = operator
@@ -32,6 +38,8 @@ class Binary(Expr):
 		return visitor.visit_binary_expr(self)
 
 class Call(Expr):
+	__slots__ = ('callee', 'paren', 'arguments')
+
 	def __init__(self, callee: Expr, paren: Token, arguments: list[Expr]):
 		self.callee = callee
 		self.paren = paren
@@ -41,6 +49,8 @@ class Call(Expr):
 		return visitor.visit_call_expr(self)
 
 class Get(Expr):
+	__slots__ = ('object', 'name')
+
 	def __init__(self, object: Expr, name: Token):
 		self.object = object
 		self.name = name
@@ -49,6 +59,8 @@ class Get(Expr):
 		return visitor.visit_get_expr(self)
 
 class Grouping(Expr):
+	__slots__ = ('expression',)
+
 	def __init__(self, expression: Expr):
 		self.expression = expression
 
@@ -56,6 +68,8 @@ class Grouping(Expr):
 		return visitor.visit_grouping_expr(self)
 
 class Literal(Expr):
+	__slots__ = ('value',)
+
 	def __init__(self, value: Any):
 		self.value = value
 
@@ -63,6 +77,8 @@ class Literal(Expr):
 		return visitor.visit_literal_expr(self)
 
 class Logical(Expr):
+	__slots__ = ('left', 'operator', 'right')
+
 	def __init__(self, left: Expr, operator: Token, right: Expr):
 		self.left = left
 		self.operator = operator
@@ -72,6 +88,8 @@ class Logical(Expr):
 		return visitor.visit_logical_expr(self)
 
 class Set(Expr):
+	__slots__ = ('object', 'name', 'value')
+
 	def __init__(self, object: Expr, name: Token, value: Expr):
 		self.object = object
 		self.name = name
@@ -81,6 +99,8 @@ class Set(Expr):
 		return visitor.visit_set_expr(self)
 
 class Super(Expr):
+	__slots__ = ('keyword', 'method')
+
 	def __init__(self, keyword: Token, method: Token):
 		self.keyword = keyword
 		self.method = method
@@ -89,6 +109,8 @@ class Super(Expr):
 		return visitor.visit_super_expr(self)
 
 class This(Expr):
+	__slots__ = ('keyword',)
+
 	def __init__(self, keyword: Token):
 		self.keyword = keyword
 
@@ -96,6 +118,8 @@ class This(Expr):
 		return visitor.visit_this_expr(self)
 
 class Unary(Expr):
+	__slots__ = ('operator', 'right')
+
 	def __init__(self, operator: Token, right: Expr):
 		self.operator = operator
 		self.right = right
@@ -104,6 +128,8 @@ class Unary(Expr):
 		return visitor.visit_unary_expr(self)
 
 class Variable(Expr):
+	__slots__ = ('name',)
+
 	def __init__(self, name: Token):
 		self.name = name
 
@@ -27,17 +27,20 @@ class GenerateAST:
             "Expression: Expr expression",
             "Function: Token name, list[Token] params, list[Stmt] body",
             "If: Expr condition, Stmt then_branch, Stmt else_branch",
-            "Print: Expr expression",
+            "Print: Token keyword, Expr expression",
             "Return: Token keyword, Expr value",
             "Var: Token name, Expr initializer",
             "While: Expr condition, Stmt body",
         ],
         imports=[
             ("expr", ["Expr", "Variable"]),
-        ]
+        ],
+        # So an engine can tell when nothing can call a function any more.
+        weak_referenceable=["Function"],
         )
 
-    def define_ast(self, output_dir: str, base_name: str, types: list[str], imports: list[tuple[str, list[str]]]=[]):
+    def define_ast(self, output_dir: str, base_name: str, types: list[str], imports: list[tuple[str, list[str]]]=[],
+                   weak_referenceable: list[str]=[]):
         path = f"{output_dir}/{base_name.lower()}.py"
         with open(path, "w") as f:
             f.write("'''\nThis code is generated automatically by generate_ast.py\n'''\n\n")
@@ -47,8 +50,10 @@ class GenerateAST:
             for imp in imports:
                 f.write(f"from {imp[0]} import {', '.join(imp[1])}\n")
             f.write("\nT = TypeVar('T')\n\n")
-            # Abstract base class
+            # Abstract base class. ABC has empty __slots__ too, so with __slots__ on every
+            # class the nodes have no instance __dict__.
             f.write(f"class {base_name}(ABC):\n")
+            f.write("\t__slots__ = ()\n\n")
             f.write("\t@abstractmethod\n\tdef accept(self, visitor: 'Visitor[T]') -> T:\n\t\tpass\n\n")
 
             # The AST classes
@@ -56,25 +61,32 @@ class GenerateAST:
                 split_type = type.split(":")
                 class_name = split_type[0].strip()
                 fields = split_type[1].strip()
-                self.define_type(f, base_name, class_name, fields)
+                self.define_type(f, base_name, class_name, fields, class_name in weak_referenceable)
 
             # The Visitor type
             self.define_visitor(f, base_name, types)
 
-    def define_type(self, f: TextIOWrapper, base_name: str, class_name: str, fields: str):
+    def define_type(self, f: TextIOWrapper, base_name: str, class_name: str, fields: str, weak_referenceable: bool):
         f.write(f"class {class_name}({base_name}):\n")
 
-        # Constructor
         field_split = fields.split(",")
-        parsed_fields = [f"{field.strip().split(" ")[1].strip()}: {field.strip().split(" ")[0].strip()}" for field in field_split]
+        names = [field.strip().split(" ")[1].strip() for field in field_split]
+        annotations = [field.strip().split(" ")[0].strip() for field in field_split]
+        parsed_fields = [f"{name}: {annotation}" for name, annotation in zip(names, annotations)]
         print(field_split)
         print(parsed_fields)
+
+        # Slots
+        slots = names + ["__weakref__"] if weak_referenceable else names
+        f.write(f"\t__slots__ = {tuple(slots)!r}\n\n")
+
+        # Constructor
         fields = ", ".join(parsed_fields)
         f.write(f"\tdef __init__(self, {fields}):\n")
 
         # Store fields
-        for field in parsed_fields:
-            f.write(f"\t\tself.{field.split(':')[0].strip()} = {field.split(':')[0].strip()}\n")
+        for name in names:
+            f.write(f"\t\tself.{name} = {name}\n")
 
         f.write("\n")
 
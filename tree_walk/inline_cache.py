@@ -0,0 +1,61 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+from token_type import Token
+
+if TYPE_CHECKING:
+    from lox_callable import LoxCallable
+    from lox_class import LoxClass
+
+DEBUG_PRINT_INLINE_CACHES = False
+
+# A call site that has seen more receiver classes than this is megamorphic, and looks
+# methods up the slow way from then on.
+POLYMORPHIC_LIMIT = 4
+
+
+class InlineCache:
+    """
+    Remembers, for one property access or method call site, which method each receiver
+    class resolved the name to, so repeated lookups skip the walk up the superclass chain.
+
+    Classes never change once created, so an entry never goes stale. Fields are not
+    cached: they belong to the instance and shadow methods, so callers check the
+    instance's fields before asking the cache.
+
+    An entry does keep its class alive, though, so engines `clear` their caches once
+    a run is over, rather than hold on to its classes and fill up with them.
+    """
+    __slots__ = ("name", "line", "entries", "hits", "misses", "__weakref__")
+
+    def __init__(self, name: Token):
+        self.name = name.lexeme
+        self.line = name.line
+        self.entries: dict[LoxClass, LoxCallable | None] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def find_method(self, klass: LoxClass) -> LoxCallable | None:
+        entries = self.entries
+        if klass in entries:
+            self.hits += 1
+            return entries[klass]
+
+        self.misses += 1
+        method = klass.find_method(self.name)
+        if len(entries) < POLYMORPHIC_LIMIT:
+            entries[klass] = method
+        return method
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def __str__(self) -> str:
+        state = "megamorphic" if len(self.entries) >= POLYMORPHIC_LIMIT else f"{len(self.entries)} classes"
+        return f"[line {self.line}] .{self.name}: {self.hits} hits, {self.misses} misses, {state}"
+
+
+def print_inline_caches(caches: list[InlineCache]) -> None:
+    for cache in sorted(caches, key=lambda cache: cache.line):
+        print(cache)
+    print(f"{sum(cache.hits for cache in caches)} hits, {sum(cache.misses for cache in caches)} misses")
@@ -1,27 +1,89 @@
-from decimal import Decimal
-from typing import Any
+import weakref
+from typing import Any, Iterable
 
-from error import RunTimeError, Error, ReturnError
-from environment import Environment
+from error import RunTimeError, NativeError, Diagnostics
+from output import Output
+from environment import Environment, GlobalEnvironment
 from expr import Visitor as ExprVisitor, Literal, Grouping, Expr, Unary, Binary, Variable, Assign, Logical, Call, Get, Set, This, Super
 from stmt import Visitor as StmtVisitor, Expression, Print, Stmt, Var, Block, If, While, Function, Return, Class
 from token_type import TokenType, Token
-from lox_callable import LoxCallable, Clock, LoxFunction
-from lox_class import LoxClass, LoxInstance
+from lox_callable import NEXT, LoxCallable, Memo, LoxFunction, TailCall
+from lox_class import NO_FIELD, LoxClass, LoxInstance
+from natives import natives
+from number_backend import NumberBackend, DECIMAL
+from inline_cache import InlineCache, DEBUG_PRINT_INLINE_CACHES, print_inline_caches
+from program import Program, walk
 
 class Interpreter(ExprVisitor[Any], StmtVisitor[Any]):
-    def __init__(self):
-        self.globals = Environment()
-        self.globals.define("clock", Clock())
-        self.environment = self.globals
-        self.locals: dict[Expr, int] = {}
+    # What functions and classes are made of. Subclasses can swap in their own.
+    function_type = LoxFunction
+    class_type = LoxClass
+
+    def __init__(self, numbers: NumberBackend = DECIMAL, diagnostics: Diagnostics | None = None,
+                 output: Output | None = None):
+        self.numbers = numbers
+        self.number_types = numbers.types
+        self.diagnostics = Diagnostics() if diagnostics is None else diagnostics
+        # Where `print` writes.
+        self.output = Output() if output is None else output
+        self.memo = Memo(numbers)
+        # What every run starts with. See `reset`.
+        self.natives: dict[str, LoxCallable] = {**natives(numbers), "memo": self.memo}
+        self.globals = GlobalEnvironment(dict(self.natives))
+        self.environment: Environment | GlobalEnvironment = self.globals
+        self.locals: dict[Expr, tuple[int, int]] = {} # (distance, slot)
+        self.inline_caches: dict[Get, InlineCache] = {}
+        self.tail_calls: set[Return] = set()
+        # Weak, so that declarations can still be released once unreachable.
+        self.pure_functions: weakref.WeakKeyDictionary[Function, frozenset[str]] = weakref.WeakKeyDictionary()
 
     def interpret(self, statements: list[Stmt]) -> None:
+        self.run_prepared(self.prepare(statements))
+
+    def prepare(self, statements: list[Stmt]) -> list[Stmt]:
+        """
+        Turns resolved statements into what `run_prepared` runs, which a `Script` does
+        once and then runs as often as it likes. The tree-walker runs them as they are.
+        """
+        return statements
+
+    def reset(self, values: dict[str, Any], diagnostics: Diagnostics) -> None:
+        """
+        Starts a fresh run, where only the natives and `values` are defined.
+        """
+        self.globals = self.environment = GlobalEnvironment({**self.natives, **values})
+        self.diagnostics = diagnostics
+        self.clear_inline_caches()
+
+    def clear_inline_caches(self) -> None:
+        for cache in self.inline_caches.values():
+            cache.clear()
+
+    def call_global(self, name: str, arguments: list[Any]) -> Any:
+        """
+        Calls a global function or class from Python, as `Script.call` does. Raises
+        RunTimeError if that fails.
+        """
+        token = Token(TokenType.IDENTIFIER, name, None, 0)
+        function = self.globals.get(token)
+        if not isinstance(function, LoxCallable):
+            raise RunTimeError(token, "Can only call functions and classes.")
+        if len(arguments) != function.arity():
+            raise RunTimeError(token, f"Expected {function.arity()} arguments but got {len(arguments)}.")
+        try:
+            return function.call(self, arguments)
+        except NativeError as error:
+            raise RunTimeError(token, error.message)
+
+    def run_prepared(self, statements: list[Stmt]) -> None:
         try:
             for statement in statements:
                 self.execute(statement)
         except RunTimeError as error:
-            Error.runtime_error(error)
+            self.diagnostics.runtime_error(error)
+
+        if DEBUG_PRINT_INLINE_CACHES:
+            print_inline_caches(list(self.inline_caches.values()))
 
     def visit_literal_expr(self, expr: Literal) -> Any:
         return expr.value
@@ -37,7 +99,7 @@ class Interpreter(ExprVisitor[Any], StmtVisitor[Any]):
                 return not self.is_truthy(right)
             case TokenType.MINUS:
                 self.check_number_operand(expr.operator, right)
-                return -Decimal(right)
+                return -right
 
         return None # unreachable
 
@@ -45,99 +107,111 @@ class Interpreter(ExprVisitor[Any], StmtVisitor[Any]):
         left = self.evaluate(expr.left)
         right = self.evaluate(expr.right)
 
-        match expr.operator.token_type:
-            case TokenType.GREATER:
-                self.check_number_operands(expr.operator, left, right)
-                return Decimal(left) > Decimal(right)
-            case TokenType.GREATER_EQUAL:
-                self.check_number_operands(expr.operator, left, right)
-                return Decimal(left) >= Decimal(right)
-            case TokenType.LESS:
-                self.check_number_operands(expr.operator, left, right)
-                return Decimal(left) < Decimal(right)
-            case TokenType.LESS_EQUAL:
-                self.check_number_operands(expr.operator, left, right)
-                return Decimal(left) <= Decimal(right)
-            case TokenType.MINUS:
-                self.check_number_operands(expr.operator, left, right)
-                return Decimal(left) - Decimal(right)
-            case TokenType.BANG_EQUAL:
-                return not self.is_equal(left, right)
-            case TokenType.EQUAL_EQUAL:
-                return self.is_equal(left, right)
-            case TokenType.PLUS:
-                if isinstance(left, str) and isinstance(right, str):
-                    return left + right
-                if isinstance(left, Decimal) and isinstance(right, Decimal):
-                    return left + right
-                raise RunTimeError(expr.operator, "Operands must be two strings or two numbers.")
-            case TokenType.SLASH:
-                self.check_number_operands(expr.operator, left, right)
-                return Decimal(left) / Decimal(right)
-            case TokenType.STAR:
-                self.check_number_operands(expr.operator, left, right)
-                return Decimal(left) * Decimal(right)
-            
+        try:
+            match expr.operator.token_type:
+                case TokenType.GREATER:
+                    self.check_number_operands(expr.operator, left, right)
+                    return left > right
+                case TokenType.GREATER_EQUAL:
+                    self.check_number_operands(expr.operator, left, right)
+                    return left >= right
+                case TokenType.LESS:
+                    self.check_number_operands(expr.operator, left, right)
+                    return left < right
+                case TokenType.LESS_EQUAL:
+                    self.check_number_operands(expr.operator, left, right)
+                    return left <= right
+                case TokenType.MINUS:
+                    self.check_number_operands(expr.operator, left, right)
+                    return left - right
+                case TokenType.BANG_EQUAL:
+                    return not self.is_equal(left, right)
+                case TokenType.EQUAL_EQUAL:
+                    return self.is_equal(left, right)
+                case TokenType.PLUS:
+                    if isinstance(left, str) and isinstance(right, str):
+                        return left + right
+                    if left.__class__ in self.number_types and right.__class__ in self.number_types:
+                        return left + right
+                    raise RunTimeError(expr.operator, "Operands must be two strings or two numbers.")
+                case TokenType.SLASH:
+                    self.check_number_operands(expr.operator, left, right)
+                    try:
+                        return self.numbers.divide(left, right)
+                    except NativeError as error:
+                        raise RunTimeError(expr.operator, error.message)
+                case TokenType.STAR:
+                    self.check_number_operands(expr.operator, left, right)
+                    return left * right
+        except ArithmeticError:
+            # Only from `+`, `-` and `*`, with ints or decimals too large to represent.
+            raise RunTimeError(expr.operator, "Number too large.") from None
+
         return None # unreachable
 
-    def visit_class_stmt(self, stmt: Class) -> None:
+    def visit_class_stmt(self, stmt: Class) -> Any:
         superclass = None
         if stmt.superclass is not None:
             superclass = self.evaluate(stmt.superclass)
             if not isinstance(superclass, LoxClass):
                 raise RunTimeError(stmt.superclass.name, "Superclass must be a class.")
-        self.environment.define(stmt.name.lexeme, None)
 
         if stmt.superclass is not None:
-            self.environment = Environment(self.environment)
-            self.environment.define("super", superclass)
+            self.environment = Environment(self.environment, [superclass])
 
         methods: dict[str, LoxFunction] = {}
         for method in stmt.methods:
-            function = LoxFunction(method, self.environment, method.name.lexeme == "init")
+            function = self.function_type(method, self.environment, method.name.lexeme == "init")
             methods[method.name.lexeme] = function
 
-        klass = LoxClass(stmt.name.lexeme, superclass, methods)
+        klass = self.class_type(stmt.name.lexeme, superclass, methods)
 
         if superclass is not None:
             self.environment = self.environment.enclosing
 
-        self.environment.assign(stmt.name, klass)
+        # The methods only look the class up once they are called, by which time it
+        # has been defined, so there is no need to define it as nil first.
+        self.define(stmt.name, klass)
+        return NEXT
 
-    def visit_expression_stmt(self, stmt: Expression) -> None:
+    def visit_expression_stmt(self, stmt: Expression) -> Any:
         self.evaluate(stmt.expression)
+        return NEXT
 
-    def visit_print_stmt(self, stmt: Print) -> None:
+    def visit_print_stmt(self, stmt: Print) -> Any:
         value = self.evaluate(stmt.expression)
-        print(self.stringify(value))
+        self.output.write_line(self.stringify(value))
+        return NEXT
 
-    def visit_var_stmt(self, stmt: Var) -> None:
+    def visit_var_stmt(self, stmt: Var) -> Any:
         value = None
         if stmt.initializer != None:
             value = self.evaluate(stmt.initializer)
 
-        self.environment.define(stmt.name.lexeme, value)
+        self.define(stmt.name, value)
+        return NEXT
 
     def visit_variable_expr(self, expr: Variable) -> Any:
         return self.lookup_variable(expr.name, expr)
 
     def visit_assign_expr(self, expr: Assign) -> Any:
         value = self.evaluate(expr.value)
-        distance = self.locals.get(expr, None)
-        if distance is not None:
-            self.environment.assign_at(distance, expr.name, value)
+        location = self.locals.get(expr, None)
+        if location is not None:
+            self.environment.assign_at(location[0], location[1], value)
         else:
             self.globals.assign(expr.name, value)
         return value
 
-    def visit_block_stmt(self, stmt: Block) -> None:
-        self.execute_block(stmt.statements, Environment(self.environment))
+    def visit_block_stmt(self, stmt: Block) -> Any:
+        return self.execute_block(stmt.statements, Environment(self.environment))
 
-    def visit_if_stmt(self, stmt: If) -> None:
+    def visit_if_stmt(self, stmt: If) -> Any:
         if self.is_truthy(self.evaluate(stmt.condition)):
-            self.execute(stmt.then_branch)
+            return self.execute(stmt.then_branch)
         elif stmt.else_branch != None:
-            self.execute(stmt.else_branch)
+            return self.execute(stmt.else_branch)
+        return NEXT
 
     def visit_logical_expr(self, expr: Logical) -> Any:
         left = self.evaluate(expr.left)
@@ -149,13 +223,47 @@ class Interpreter(ExprVisitor[Any], StmtVisitor[Any]):
 
         return self.evaluate(expr.right)
 
-    def visit_while_stmt(self, stmt: While) -> None:
+    def visit_while_stmt(self, stmt: While) -> Any:
         while self.is_truthy(self.evaluate(stmt.condition)):
-            self.execute(stmt.body)
+            result = self.execute(stmt.body)
+            if result is not NEXT:
+                return result
+        return NEXT
 
     def visit_call_expr(self, expr: Call) -> Any:
-        callee = self.evaluate(expr.callee)
+        if expr.callee.__class__ is Get:
+            return self.invoke(expr, expr.callee)
+
+        return self.call(expr, self.evaluate(expr.callee))
+
+    def invoke(self, expr: Call, get: Get) -> Any:
+        """
+        Calls `object.name(...)` without binding the method to the object first.
+        """
+        object = self.evaluate(get.object)
+
+        if not isinstance(object, LoxInstance):
+            raise RunTimeError(get.name, "Only instances have properties.")
+
+        field = object.field(get.name.lexeme)
+        if field is not NO_FIELD:
+            return self.call(expr, field)
+
+        method = self.inline_cache(get).find_method(object.klass)
+        if method is None:
+            raise RunTimeError(get.name, f"Undefined property '{get.name.lexeme}'.")
+
+        arguments = [self.evaluate(argument) for argument in expr.arguments]
+
+        if len(arguments) != method.arity():
+            raise RunTimeError(expr.paren, f"Expected {method.arity()} arguments but got {len(arguments)}.")
+
+        try:
+            return method.invoke(self, object, arguments)
+        except RecursionError:
+            raise RunTimeError(expr.paren, "Stack overflow.") from None
 
+    def call(self, expr: Call, callee: Any) -> Any:
         arguments = []
         for argument in expr.arguments:
             arguments.append(self.evaluate(argument))
@@ -168,15 +276,30 @@ class Interpreter(ExprVisitor[Any], StmtVisitor[Any]):
         if len(arguments) != function.arity():
             raise RunTimeError(expr.paren, f"Expected {function.arity()} arguments but got {len(arguments)}.")
 
-        return function.call(self, arguments)
+        try:
+            return function.call(self, arguments)
+        except NativeError as error:
+            raise RunTimeError(expr.paren, error.message)
+        except RecursionError:
+            # Python's stack ran out somewhere inside: this is the Lox call nearest it
+            # with room left to report it.
+            raise RunTimeError(expr.paren, "Stack overflow.") from None
 
     def visit_get_expr(self, expr: Get) -> Any:
         object = self.evaluate(expr.object)
 
-        if isinstance(object, LoxInstance):
-            return object.get(expr.name)
+        if not isinstance(object, LoxInstance):
+            raise RunTimeError(expr.name, "Only instances have properties.")
 
-        raise RunTimeError(expr.name, "Only instances have properties.")
+        # Only look the cache up when there is no field, as most gets read fields.
+        field = object.field(expr.name.lexeme)
+        if field is not NO_FIELD:
+            return field
+
+        method = self.inline_cache(expr).find_method(object.klass)
+        if method is None:
+            raise RunTimeError(expr.name, f"Undefined property '{expr.name.lexeme}'.")
+        return method.bind(object)
 
     def visit_set_expr(self, expr: Set) -> Any:
         object = self.evaluate(expr.object)
@@ -189,10 +312,10 @@ class Interpreter(ExprVisitor[Any], StmtVisitor[Any]):
         return value
 
     def visit_super_expr(self, expr: Super) -> Any:
-        distance = self.locals.get(expr, 0)
-        superclass: LoxClass = self.environment.get_at(distance, "super")
+        distance, _ = self.locals[expr]
+        superclass: LoxClass = self.environment.get_at(distance, 0)
 
-        object: LoxInstance = self.environment.get_at(distance - 1, "this")
+        object: LoxInstance = self.environment.get_at(distance - 1, 0)
 
         method = superclass.find_method(expr.method.lexeme)
         
@@ -204,41 +327,132 @@ class Interpreter(ExprVisitor[Any], StmtVisitor[Any]):
     def visit_this_expr(self, expr: This) -> Any:
         return self.lookup_variable(expr.keyword, expr)
 
-    def visit_function_stmt(self, stmt: Function) -> None:
-        function = LoxFunction(stmt, self.environment, False)
-        self.environment.define(stmt.name.lexeme, function)
+    def visit_function_stmt(self, stmt: Function) -> Any:
+        function = self.function_type(stmt, self.environment, False)
+        self.define(stmt.name, function)
+        return NEXT
 
-    def visit_return_stmt(self, stmt: Return) -> None:
+    def visit_return_stmt(self, stmt: Return) -> Any:
         value = None
         if stmt.value is not None:
+            if stmt in self.tail_calls:
+                return self.tail_call(stmt.value)
             value = self.evaluate(stmt.value)
 
-        raise ReturnError(value)
+        return value
+
+    def tail_call(self, expr: Call) -> Any:
+        """
+        Evaluates the callee and arguments of a call in tail position. Rather than call a
+        Lox function, it returns the TailCall for the function's trampoline to make.
+        """
+        # Calling a method found through a Get binds it first, unlike `invoke`.
+        callee = self.evaluate(expr.callee)
+        arguments = [self.evaluate(argument) for argument in expr.arguments]
+
+        if not isinstance(callee, LoxCallable):
+            raise RunTimeError(expr.paren, "Can only call functions and classes.")
+        if len(arguments) != callee.arity():
+            raise RunTimeError(expr.paren, f"Expected {callee.arity()} arguments but got {len(arguments)}.")
+
+        if isinstance(callee, LoxFunction) and not callee.is_initializer:
+            return self.tail_call_function(callee, arguments)
+        try:
+            return callee.call(self, arguments)
+        except NativeError as error:
+            raise RunTimeError(expr.paren, error.message)
+        except RecursionError:
+            raise RunTimeError(expr.paren, "Stack overflow.") from None
+
+    def tail_call_function(self, function: LoxFunction, arguments: list[Any]) -> TailCall:
+        return TailCall(function.declaration.body, Environment(function.closure, arguments))
 
     def evaluate(self, expr: Expr) -> Any:
         return expr.accept(self)
 
-    def execute(self, stmt: Stmt) -> None:
-        stmt.accept(self)
+    def execute(self, stmt: Stmt) -> Any:
+        """
+        Returns NEXT when execution should carry on with the next statement, and
+        otherwise the value of the `return` that ended the function.
+        """
+        return stmt.accept(self)
 
-    def execute_block(self, statements: list[Stmt], environment: Environment) -> None:
+    def execute_block(self, statements: list[Stmt], environment: Environment) -> Any:
         previous = self.environment
         try:
             self.environment = environment
             for statement in statements:
-                self.execute(statement)
+                result = self.execute(statement)
+                if result is not NEXT:
+                    return result
+            return NEXT
         finally:
             self.environment = previous
 
-    def resolve(self, expr: Expr, depth: int) -> None:
-        self.locals[expr] = depth
+    def define(self, name: Token, value: Any) -> None:
+        if self.environment is self.globals:
+            self.globals.define(name.lexeme, value)
+        else:
+            self.environment.define(value)
+
+    def inline_cache(self, expr: Get) -> InlineCache:
+        cache = self.inline_caches.get(expr)
+        if cache is None:
+            cache = self.inline_caches[expr] = InlineCache(expr.name)
+        return cache
+
+    def resolve(self, expr: Expr, depth: int, slot: int) -> None:
+        self.locals[expr] = (depth, slot)
+
+    def resolve_tail_call(self, stmt: Return) -> None:
+        self.tail_calls.add(stmt)
+
+    def resolve_pure(self, function: Function, callees: frozenset[str]) -> None:
+        self.pure_functions[function] = callees
+
+    def pure_callees(self, function: LoxCallable) -> frozenset[str] | None:
+        """
+        The globals a function calls if the resolver found it pure but for them, else None.
+        """
+        if isinstance(function, LoxFunction):
+            return self.pure_functions.get(function.declaration)
+        return None
+
+    def release(self, program: Program) -> None:
+        """
+        Forgets the resolutions and inline caches of a program that has finished running.
+        Those inside the functions it defined are forgotten once nothing can call them.
+        The other caches are emptied, as the classes they hold would keep their
+        methods, and so those functions, callable forever.
+        """
+        self.release_nodes(program.transient_nodes())
+        self.clear_inline_caches()
+
+    def release_nodes(self, nodes: Iterable[Expr | Stmt]) -> None:
+        for node in nodes:
+            self.locals.pop(node, None)
+            self.inline_caches.pop(node, None)
+            self.tail_calls.discard(node)
+            if isinstance(node, Function):
+                self.release_when_unreachable(node)
+
+    def release_when_unreachable(self, function: Function) -> None:
+        # The finalizer holds the body, but not the declaration. That is only kept
+        # alive by the LoxFunctions made from it, and by enclosing declarations.
+        finalizer = weakref.finalize(function, self.release_body, function.body)
+        finalizer.atexit = False
+
+    def release_body(self, body: list[Stmt]) -> None:
+        self.release_nodes(walk(body))
 
     def lookup_variable(self, name: Token, expr: Expr) -> Any:
-        distance = self.locals.get(expr, None)
-        if distance is not None:
-            return self.environment.get_at(distance, name.lexeme)
-        else:
+        location = self.locals.get(expr, None)
+        if location is None:
             return self.globals.get(name)
+        distance, slot = location
+        if distance == 0:
+            return self.environment.values[slot]
+        return self.environment.ancestor(distance).values[slot]
 
     def is_truthy(self, value: Any) -> bool:
         if value is None: return False
@@ -252,12 +466,12 @@ class Interpreter(ExprVisitor[Any], StmtVisitor[Any]):
         return left == right
 
     def check_number_operand(self, operator: Token, operand: Any) -> None:
-        if isinstance(operand, Decimal):
+        if operand.__class__ in self.number_types:
             return
         raise RunTimeError(operator, "Operand must be a number.")
 
     def check_number_operands(self, operator: Token, left: Any, right: Any) -> None:
-        if isinstance(left, Decimal) and isinstance(right, Decimal):
+        if left.__class__ in self.number_types and right.__class__ in self.number_types:
             return
 
         raise RunTimeError(operator, "Operands must be numbers.")
@@ -265,5 +479,6 @@ class Interpreter(ExprVisitor[Any], StmtVisitor[Any]):
     def stringify(self, object):
         if object is None:
             return "nil"
-        else:
-            return str(object)
\ No newline at end of file
+        if object.__class__ in self.number_types:
+            return self.numbers.stringify(object)
+        return str(object)
\ No newline at end of file
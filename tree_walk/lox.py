@@ -1,24 +1,79 @@
+import argparse
+import atexit
+import io
+import json
+import os
 import sys
+import time
+import traceback
+import tracemalloc
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from itertools import count, islice
+from typing import Any, Iterable, Iterator, TextIO
 
 from ast_printer import AstPrinter
-from error import Error
+from error import Diagnostics, RunTimeError
 from parser import Parser
-from scanner import Scanner
+from scanner import RegexScanner
 from interpreter import Interpreter
+from lox_collections import python_value, stringify
 from resolver import Resolver
+from vm import VM
+from closure_compiler import ClosureInterpreter
+from transpiler import TranspilingInterpreter
+from number_backend import NUMBER_BACKENDS
+from optimizer import Optimizer
+from output import DEFAULT_BUFFER_SIZE, Output
+from program import Program
+from profiler import ProfilingInterpreter
+from program_cache import ProgramCache
+from script import Script
+from stmt import Stmt
+
+ENGINES = {
+    "tree": Interpreter,
+    "closure": ClosureInterpreter,
+    "vm": VM,
+    "python": TranspilingInterpreter,
+}
 
 class Lox:
-    def __init__(self):
-        self.interpreter = Interpreter()
+    def __init__(self, engine: str = "tree", numbers: str = "decimal", optimize: int = 1, cache: bool = False,
+                 profile: bool = False, stdout: TextIO | Output | None = None,
+                 buffer_size: int = DEFAULT_BUFFER_SIZE, line_buffered: bool = False):
+        self.numbers = NUMBER_BACKENDS[numbers]
+        # Everything a session prints, including its errors, goes through one buffered
+        # `Output` to `stdout`, which is whatever sys.stdout is at the time when None.
+        # Sessions share no mutable state, so separate ones may run on separate threads.
+        self.output = stdout if isinstance(stdout, Output) else Output(stdout, buffer_size, line_buffered)
+        self.diagnostics = Diagnostics(self.output)
+        # Profiling swaps in an instrumented tree-walker, so that the others pay nothing for it.
+        self.engine_class = ProfilingInterpreter if profile else ENGINES[engine]
+        self.interpreter = self.engine_class(self.numbers, self.diagnostics, self.output)
+        # The passes run between resolving and interpreting, in order.
+        self.optimizers: list[Optimizer] = [Optimizer(self.numbers)] if optimize >= 1 else []
+        self.cache = ProgramCache(options=f"{numbers} -O{optimize}") if cache else None
+        self.resolver = Resolver(None, self.diagnostics)
 
     def run_file(self, path: str):
         with open(path, "r") as f:
             file = f.read()
-        self.run(file)
 
-        if Error.had_error:
+        program = None if self.cache is None else self.cache.load(file)
+        if program is None:
+            program = self.compile_source(file)
+            if program is not None and self.cache is not None:
+                self.cache.store(file, program)
+        if program is not None:
+            try:
+                self.execute(program)
+            finally:
+                self.output.flush()
+
+        if self.diagnostics.had_error:
             sys.exit(65)
-        if Error.had_runtime_error:
+        if self.diagnostics.had_runtime_error:
             sys.exit(70)
 
     def run_prompt(self):
@@ -30,40 +85,409 @@ class Lox:
             try:
                 self.run(line)
             except Exception as e:
-                print(e)
-            Error.had_error = False
+                # Like running out of Python stack. It goes where the session's errors do.
+                print(e, file=self.output)
+                self.output.flush()
+            self.diagnostics.had_error = False
 
     def run(self, source: str):
-        scanner = Scanner(source)
-        tokens = scanner.scan_tokens()
-        parser = Parser(tokens)
+        """
+        Runs source in the session so far, like a line typed at the prompt. The engine
+        then releases what it kept about the source, so that only the functions and
+        classes it defined stay in memory.
+        """
+        program = self.compile_source(source)
+        if program is not None:
+            try:
+                self.execute(program)
+            finally:
+                self.output.flush()
+            self.interpreter.release(program)
+
+    def compile(self, source: str) -> Script | None:
+        """
+        Compiles source once into a `Script` that can be run many times, each time with
+        fresh globals, without touching the session. Returns None, having reported the
+        errors, if the source does not compile.
+        """
+        program = self.compile_source(source)
+        if program is None:
+            return None
+        output = Output(None, self.output.buffer_size)
+        return Script(self.engine_class(self.numbers, None, output), program, self.numbers)
+
+    def compile_source(self, source: str) -> Program | None:
+        """
+        Returns None, having reported the errors, if the source does not compile. Only
+        this source's errors count, though the session still remembers earlier ones.
+        """
+        had_error = self.diagnostics.had_error
+        self.diagnostics.had_error = False
+        try:
+            scanner = RegexScanner(source, self.numbers, self.diagnostics)
+            tokens = scanner.scan_tokens()
+            parser = Parser(tokens, self.diagnostics)
+
+            statements = parser.parse()
+
+            if self.diagnostics.had_error:
+                # stop if there was a syntax error
+                return None
 
-        statements = parser.parse()
+            return self.compile_statements(statements)
+        finally:
+            self.diagnostics.had_error = self.diagnostics.had_error or had_error
 
-        if Error.had_error:
-            # stop if there was a syntax error
-            return
-        
-        resolver = Resolver(self.interpreter)
-        resolver.resolve_statements(statements)
+    def compile_statements(self, statements: list[Stmt]) -> Program | None:
+        """
+        Resolves and optimizes parsed statements. Returns None, having reported the
+        errors, if they do not resolve.
+        """
+        program = Program()
+        self.resolver.resolve_program(program, statements)
 
-        if Error.had_error:
+        if self.diagnostics.had_error:
             # stop if there was a resolution error
-            return
+            return None
+
+        for optimizer in self.optimizers:
+            statements = optimizer.optimize(statements)
 
         # print(AstPrinter().print(expression))
-        self.interpreter.interpret(statements)
+        program.statements = statements
+        return program
 
-if __name__ == "__main__":
-    lox = Lox()
-    args = sys.argv[1:]
-    
-    if len(args) > 1:
-        print("Usage: python3 lox.py [script]")
+    def stream_file(self, path: str):
+        """
+        Runs each top-level declaration as soon as it has been parsed, instead of first
+        scanning and parsing the whole file. The file is read a line at a time, so only
+        one declaration's source, tokens and tree are in memory at once, plus the
+        functions and classes defined so far.
+
+        A syntax error stops the script at that declaration rather than before it
+        starts, but parsing carries on to report any others.
+        """
+        with open(path, "r") as f:
+            parser = Parser(RegexScanner("", self.numbers, self.diagnostics).scan_lines(f), self.diagnostics)
+            try:
+                for declaration in parser.declarations():
+                    if self.diagnostics.had_error or self.diagnostics.had_runtime_error:
+                        continue
+                    program = self.compile_statements([declaration])
+                    if program is not None:
+                        self.execute(program)
+                        self.interpreter.release(program)
+            finally:
+                self.output.flush()
+
+        if self.diagnostics.had_error:
+            sys.exit(65)
+        if self.diagnostics.had_runtime_error:
+            sys.exit(70)
+
+    def execute(self, program: Program):
+        program.load(self.interpreter)
+        self.interpreter.interpret(program.statements)
+
+    def print_optimizer_stats(self):
+        for optimizer in self.optimizers:
+            print(optimizer.report())
+
+    def print_memo_stats(self):
+        print(self.interpreter.memo.report())
+
+    def write_profile(self, prefix: str):
+        profile = self.interpreter.profile
+        profile.finish()
+        with open(f"{prefix}.txt", "w") as f:
+            f.write(profile.report())
+        with open(f"{prefix}.folded", "w") as f:
+            f.write(profile.collapsed_stacks())
+        print(f"Wrote the profile to {prefix}.txt and {prefix}.folded")
+
+    def print_memory_stats(self):
+        current, peak = tracemalloc.get_traced_memory()
+        print(f"{current / 1024:.0f} KiB in use, {peak / 1024:.0f} KiB at peak")
+
+
+class JobResult:
+    __slots__ = ("path", "status", "output", "seconds")
+
+    def __init__(self, path: str, status: int, output: str, seconds: float):
+        self.path = path
+        self.status = status
+        self.output = output
+        self.seconds = seconds
+
+
+# How each worker process of a batch runs its jobs, set by `start_worker`.
+worker_options: dict[str, Any] = {}
+worker_stream = False
+
+
+def start_worker(options: dict[str, Any], stream: bool) -> None:
+    """
+    Gets a batch worker process ready. Running a tiny script once does the one-off
+    work of the first run, like importing modules and compiling regular expressions,
+    before any job is timed.
+    """
+    global worker_options, worker_stream
+    worker_options = options
+    worker_stream = stream
+    Lox(**options, stdout=io.StringIO()).run("var warm = 1;")
+
+
+def run_job(path: str) -> JobResult:
+    """
+    Runs a script in a session of its own, capturing what it prints and its exit status.
+    """
+    output = io.StringIO()
+    status = 0
+    start_time = time.perf_counter()
+    try:
+        lox = Lox(**worker_options, stdout=output)
+        if worker_stream:
+            lox.stream_file(path)
+        else:
+            lox.run_file(path)
+    except SystemExit as exit:
+        status = exit.code
+    except OSError as error:
+        print(error, file=output)
+        status = 66
+    except Exception:
+        # Like running out of Python stack. One job failing must not stop the batch.
+        traceback.print_exc(file=output)
+        status = 70
+    return JobResult(path, status, output.getvalue(), time.perf_counter() - start_time)
+
+
+def run_batch(paths: list[str], jobs: int, options: dict[str, Any], stream: bool = False) -> int:
+    """
+    Runs independent scripts on `jobs` worker processes. Each script's output is
+    printed as a whole once it finishes, in the order they finish, after a line with
+    its exit status. A summary goes to stderr. Returns the highest exit status.
+    """
+    statuses = []
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(jobs, initializer=start_worker, initargs=(options, stream)) as pool:
+        for future in as_completed([pool.submit(run_job, path) for path in paths]):
+            result = future.result()
+            statuses.append(result.status)
+            sys.stdout.write(f"==> {result.path} (exit {result.status}, {result.seconds:.2f}s)\n{result.output}")
+            sys.stdout.flush()
+    seconds = time.perf_counter() - start_time
+
+    failed = sum(1 for status in statuses if status)
+    print(f"{len(paths)} scripts in {seconds:.2f}s ({len(paths) / seconds:.1f} per second) on {jobs} "
+          f"{'process' if jobs == 1 else 'processes'}, {failed} failed", file=sys.stderr)
+    return max(statuses, default=0)
+
+
+class MapResult:
+    __slots__ = ("output", "status", "errors")
+
+    def __init__(self, output: str, status: int = 0, errors: str = ""):
+        self.output = output
+        self.status = status
+        self.errors = errors
+
+
+# The script each record goes through in a --map process, set by `start_mapper`.
+mapper: Script | None = None
+mapper_status = 0
+
+
+def start_mapper(source: str, options: dict[str, Any]) -> None:
+    """
+    Compiles a --map script and runs its top level, which defines `transform` and
+    whatever it needs. What the script prints goes to stderr, as stdout is for records.
+    """
+    global mapper, mapper_status
+    mapper = Lox(**options, stdout=sys.stderr).compile(source)
+    if mapper is None:
+        mapper_status = 65
+    elif not mapper.run(stdout=sys.stderr):
+        mapper_status = 70
+
+
+def map_chunk(lines: list[str], first_line: int) -> MapResult:
+    """
+    Runs each line of JSON through `transform`, stopping at the first that fails.
+    """
+    if mapper_status:
+        return MapResult("", mapper_status)
+    output = []
+    numbers = mapper.numbers
+    for line_number, line in enumerate(lines, first_line):
+        if line.isspace():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as error:
+            return MapResult("".join(output), 65, f"Input line {line_number}: {error}\n")
+        try:
+            result = mapper.call("transform", [record])
+        except RunTimeError as error:
+            # Errors from outside the script, like a missing `transform`, have no line.
+            where = f"[line {error.token.line}]\n" if error.token.line else ""
+            return MapResult("".join(output), 70, f"Input line {line_number}: {error.message}\n{where}")
+        if result is None:
+            continue
+        try:
+            output.append(json.dumps(python_value(result, numbers)) + "\n")
+        except (TypeError, ValueError):
+            return MapResult("".join(output), 70, f"Input line {line_number}: Can't write {stringify(result)} as JSON.\n")
+    return MapResult("".join(output))
+
+
+def run_map(path: str, options: dict[str, Any], jobs: int | None, chunk_size: int) -> int:
+    """
+    Runs each line of JSON on stdin through the script's `transform(record)`, and
+    writes what it returns to stdout as a line of JSON, or nothing if it returns nil.
+
+    Input is read lazily and handled `chunk_size` lines at a time, and each chunk's
+    output is written at once. With `jobs`, chunks are spread over that many worker
+    processes, but still written in input order, and only a couple of chunks per
+    worker are read ahead, so memory stays bounded however long the input is.
+    Returns the exit status: 65 for bad JSON, 70 when a record fails.
+    """
+    with open(path, "r") as f:
+        source = f.read()
+    chunks = zip(iter(lambda: list(islice(sys.stdin, chunk_size)), []), count(1, chunk_size))
+
+    if jobs is None:
+        start_mapper(source, options)
+        return write_chunks(map_chunk(lines, first_line) for lines, first_line in chunks)
+
+    # Report compile errors once, rather than from every worker.
+    if Lox(**options, stdout=sys.stderr).compile(source) is None:
+        return 65
+    with ProcessPoolExecutor(jobs, initializer=start_mapper, initargs=(source, options)) as pool:
+        pending: deque[Future[MapResult]] = deque()
+
+        def results() -> Iterator[MapResult]:
+            for lines, first_line in chunks:
+                pending.append(pool.submit(map_chunk, lines, first_line))
+                if len(pending) >= 2 * jobs:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+        status = write_chunks(results())
+        pool.shutdown(cancel_futures=True)
+    return status
+
+
+def write_chunks(results: Iterable[MapResult]) -> int:
+    for result in results:
+        sys.stdout.write(result.output)
+        if result.status:
+            sys.stdout.flush()
+            sys.stderr.write(result.errors)
+            return result.status
+    return 0
+
+
+class ArgumentParser(argparse.ArgumentParser):
+    def error(self, message: str):
+        self.print_usage()
+        print(message)
         sys.exit(64)
-    elif len(args) == 1:
-        print(f"Running file {args[0]}")
-        lox.run_file(args[0])
+
+
+if __name__ == "__main__":
+    arg_parser = ArgumentParser(prog="python3 lox.py")
+    arg_parser.add_argument("scripts", nargs="*", metavar="script")
+    arg_parser.add_argument("--engine", choices=ENGINES, default="tree",
+                            help="tree walks the AST, closure compiles it to Python closures, vm to bytecode "
+                                 "and python to Python source")
+    arg_parser.add_argument("--numbers", choices=NUMBER_BACKENDS, default="decimal",
+                            help="represent numbers as exact decimals, IEEE floats, or ints until a "
+                                 "value is not integral")
+    arg_parser.add_argument("-O", dest="optimize", type=int, choices=[0, 1], default=1,
+                            help="-O0 runs the program as written, -O1 folds constants and removes dead code first")
+    arg_parser.add_argument("--optimizer-stats", action="store_true",
+                            help="print what the optimizer changed when the program ends")
+    arg_parser.add_argument("--no-cache", dest="cache", action="store_false",
+                            help="always compile the script instead of reusing a cached copy from ~/.cache/lox (or $LOX_CACHE_DIR)")
+    arg_parser.add_argument("--memory-stats", action="store_true",
+                            help="print how much memory the session used when it ends (slows it down)")
+    arg_parser.add_argument("--profile", action="store_true",
+                            help="time every function and class and count every line's statements with the tree "
+                                 "engine, writing a report and a collapsed stack file for flame graphs at exit")
+    arg_parser.add_argument("--profile-output", default="lox-profile", metavar="PREFIX",
+                            help="where --profile writes, as PREFIX.txt and PREFIX.folded (default: lox-profile)")
+    arg_parser.add_argument("--memo-stats", action="store_true",
+                            help="print each memoized function's cache hits and misses when the program ends")
+    arg_parser.add_argument("--stream", action="store_true",
+                            help="run each top-level declaration as soon as it is parsed, so huge scripts "
+                                 "never have to be in memory as a whole")
+    arg_parser.add_argument("--jobs", "-j", type=int, metavar="N",
+                            help="run the scripts as a batch on N processes (default: one per CPU), each "
+                                 "in a session of its own, printing each one's output when it finishes")
+    arg_parser.add_argument("--buffer-size", type=int, default=DEFAULT_BUFFER_SIZE, metavar="N",
+                            help="write printed lines out once N characters of them have built up "
+                                 f"(default: {DEFAULT_BUFFER_SIZE}, 0 writes each line at once)")
+    arg_parser.add_argument("--line-buffered", action="store_true",
+                            help="write out and flush every printed line, as is done anyway when stdout is a terminal")
+    arg_parser.add_argument("--map", action="store_true",
+                            help="run each line of JSON on stdin through the script's transform(record), writing "
+                                 "what it returns to stdout as JSON, on N processes with --jobs")
+    arg_parser.add_argument("--chunk-size", type=int, default=1000, metavar="N",
+                            help="how many lines --map reads and hands to a process at a time (default: 1000)")
+    args = arg_parser.parse_args()
+
+    if args.profile and args.engine != "tree":
+        arg_parser.error("--profile only works with the tree engine")
+    if args.memo_stats and args.engine not in ("tree", "closure"):
+        arg_parser.error("--memo-stats only works with the tree and closure engines")
+
+    if args.map:
+        if len(args.scripts) != 1:
+            arg_parser.error("--map needs exactly one script")
+        if args.jobs is not None and args.jobs < 1:
+            arg_parser.error("--jobs must be at least 1")
+        if args.chunk_size < 1:
+            arg_parser.error("--chunk-size must be at least 1")
+        for flag in ("optimizer_stats", "memory_stats", "profile", "memo_stats", "stream"):
+            if getattr(args, flag):
+                arg_parser.error(f"--{flag.replace('_', '-')} doesn't work with --map")
+        options = {"engine": args.engine, "numbers": args.numbers, "optimize": args.optimize}
+        sys.exit(run_map(args.scripts[0], options, args.jobs, args.chunk_size))
+
+    if args.jobs is not None or len(args.scripts) > 1:
+        if args.jobs is not None and args.jobs < 1:
+            arg_parser.error("--jobs must be at least 1")
+        if not args.scripts:
+            arg_parser.error("--jobs needs scripts to run")
+        for flag in ("optimizer_stats", "memory_stats", "profile", "memo_stats"):
+            if getattr(args, flag):
+                arg_parser.error(f"--{flag.replace('_', '-')} only works with a single script")
+        options = {"engine": args.engine, "numbers": args.numbers, "optimize": args.optimize, "cache": args.cache}
+        sys.exit(run_batch(args.scripts, args.jobs or os.cpu_count() or 1, options, args.stream))
+
+    if args.buffer_size < 0:
+        arg_parser.error("--buffer-size can't be negative")
+    lox = Lox(args.engine, args.numbers, args.optimize, args.cache, args.profile,
+              buffer_size=args.buffer_size, line_buffered=args.line_buffered or sys.stdout.isatty())
+    if args.optimizer_stats:
+        # run_file exits early on errors, so report from an exit handler.
+        atexit.register(lox.print_optimizer_stats)
+    if args.profile:
+        atexit.register(lox.write_profile, args.profile_output)
+    if args.memo_stats:
+        atexit.register(lox.print_memo_stats)
+    if args.memory_stats:
+        tracemalloc.start()
+        atexit.register(lox.print_memory_stats)
+
+    if args.scripts:
+        print(f"Running file {args.scripts[0]}")
+        if args.stream:
+            lox.stream_file(args.scripts[0])
+        else:
+            lox.run_file(args.scripts[0])
     else:
         print("Running prompt")
-        lox.run_prompt()
\ No newline at end of file
+        lox.run_prompt()
@@ -1,17 +1,37 @@
 from __future__ import annotations
+import weakref
 from abc import ABC, abstractmethod
-from decimal import Decimal
+from collections import OrderedDict
 from time import time
-from typing import Any, TYPE_CHECKING
+from typing import Any, Callable, TYPE_CHECKING
 
-from error import ReturnError
 from environment import Environment
+from error import NativeError
+from number_backend import NumberBackend, DECIMAL
 from stmt import Function
 
 if TYPE_CHECKING:
     from interpreter import Interpreter
     from lox_class import LoxInstance
 
+# Executing a statement returns NEXT when execution should carry on with the next
+# statement, and otherwise the value of the `return` that ended the function.
+NEXT = object()
+
+
+class TailCall:
+    """
+    What a function's body returns instead of making a call in tail position: the body
+    of the function being called, and the environment to run it in. The function whose
+    body returned it makes the call in a loop (a trampoline), so a chain of tail calls
+    takes no more Python stack than a single call.
+    """
+    __slots__ = ("body", "environment")
+
+    def __init__(self, body: Any, environment: Environment):
+        self.body = body
+        self.environment = environment
+
 class LoxCallable(ABC):
     @abstractmethod
     def call(self, interpreter: 'Interpreter', arguments: list[Any]) -> Any:
@@ -23,19 +43,174 @@ class LoxCallable(ABC):
 
 
 class Clock(LoxCallable):
-    def __init__(self):
+    def __init__(self, numbers: NumberBackend = DECIMAL):
         self.start_time = time()
+        self.from_float = numbers.from_float
     
     def arity(self) -> int:
         return 0
     
     def call(self, interpreter: 'Interpreter', arguments: list[Any]) -> Any:
-        return Decimal(time() - self.start_time)
+        return self.from_float(time() - self.start_time)
     
     def __str__(self) -> str:
         return "<native fn 'clock'>"
 
 
+class NativeFunction(LoxCallable):
+    """
+    A native that is just a Python function of its arguments.
+    """
+    def __init__(self, name: str, arity: int, function: Callable[..., Any]):
+        self.name = name
+        self.function = function
+        self.parameters = arity
+
+    def arity(self) -> int:
+        return self.parameters
+
+    def call(self, interpreter: 'Interpreter', arguments: list[Any]) -> Any:
+        return self.function(*arguments)
+
+    def __str__(self) -> str:
+        return f"<native fn '{self.name}'>"
+
+
+class Memo(LoxCallable):
+    """
+    The `memo` native: `fib = memo(fib);` caches what `fib` returns for each list of
+    arguments. Only functions the resolver found to be pure can be memoized (see
+    `Resolver.resolve_function`), and only calls whose arguments and result are
+    numbers, strings, booleans or nil are cached, so that memoizing never changes
+    what a program does.
+
+    A pure function may still call globals, which are late bound, so what they hold
+    when `memo` is called must be pure too, and so on for what those call. A global
+    redefined afterwards is not checked again.
+    """
+    def __init__(self, numbers: NumberBackend = DECIMAL):
+        self.numbers = numbers
+        # Kept for --memo-stats, without keeping the functions alive.
+        self.functions: weakref.WeakSet[MemoizedFunction] = weakref.WeakSet()
+
+    def arity(self) -> int:
+        return 1
+
+    def call(self, interpreter: 'Interpreter', arguments: list[Any]) -> Any:
+        function = arguments[0]
+        if isinstance(function, MemoizedFunction):
+            return function
+        if not isinstance(function, LoxCallable):
+            raise NativeError("Can only memoize functions.")
+        if not self.is_pure(interpreter, function):
+            raise NativeError(f"Can't memoize {function}, as it may not be pure.")
+
+        memoized = MemoizedFunction(function, self.numbers)
+        self.functions.add(memoized)
+        return memoized
+
+    @staticmethod
+    def is_pure(interpreter: 'Interpreter', function: LoxCallable) -> bool:
+        globals = interpreter.globals.values
+        seen = set()
+        pending = [function]
+        while pending:
+            function = pending.pop()
+            if isinstance(function, MemoizedFunction):
+                function = function.function
+            # Natives but `clock` only change what they are passed, which a pure
+            # function either made itself or was passed, and then its call isn't cached.
+            if id(function) in seen or isinstance(function, (Memo, NativeFunction)):
+                continue
+            seen.add(id(function))
+            callees = interpreter.pure_callees(function)
+            if callees is None:
+                return False
+            for name in callees:
+                if name not in globals:
+                    return False
+                pending.append(globals[name])
+        return True
+
+    def report(self) -> str:
+        lines = []
+        for function in sorted(self.functions, key=str):
+            calls = function.hits + function.misses
+            rate = function.hits / calls if calls else 0
+            lines.append(f"{function}: {function.hits} hits, {function.misses} misses ({rate:.0%}), "
+                         f"{function.uncached} uncached, {function.evictions} evicted, {len(function.cache)} cached")
+        return "\n".join(lines)
+
+    def __str__(self) -> str:
+        return "<native fn 'memo'>"
+
+
+class MemoizedFunction(LoxCallable):
+    """
+    A function with a cache of its results in front of it, evicting the least recently
+    used when it holds `max_size` of them.
+    """
+    max_size = 1024
+
+    def __init__(self, function: LoxCallable, numbers: NumberBackend = DECIMAL):
+        self.function = function
+        self.number_types = numbers.types
+        self.cache: OrderedDict[tuple, Any] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0 # calls with arguments or a result that can't be cached
+        self.evictions = 0
+
+    def arity(self) -> int:
+        return self.function.arity()
+
+    def call(self, interpreter: 'Interpreter', arguments: list[Any]) -> Any:
+        key = self.key(arguments)
+        if key is None:
+            self.uncached += 1
+            return self.function.call(interpreter, arguments)
+
+        cache = self.cache
+        if key in cache:
+            self.hits += 1
+            cache.move_to_end(key)
+            return cache[key]
+
+        result = self.function.call(interpreter, arguments)
+        if self.key([result]) is None:
+            self.uncached += 1
+            return result
+
+        self.misses += 1
+        cache[key] = result
+        if len(cache) > self.max_size:
+            cache.popitem(last=False)
+            self.evictions += 1
+        return result
+
+    def key(self, values: list[Any]) -> tuple | None:
+        """
+        What the values are cached under, or None if they can't be, like instances,
+        whose fields can change from one call to the next.
+        """
+        key = []
+        for value in values:
+            value_class = value.__class__
+            if value_class in self.number_types:
+                # 1 and 1.0, or 0 and -0, are equal but don't print or divide the same.
+                key.append(repr(value))
+            elif value_class is str or value_class is bool or value is None:
+                key.append(value)
+            else:
+                return None
+            # So that true and 1, or "1" and 1, are told apart.
+            key.append(value_class)
+        return tuple(key)
+
+    def __str__(self) -> str:
+        return str(self.function)
+
+
 class LoxFunction(LoxCallable):
     def __init__(self, declaration: Function, closure: Environment, is_initializer: bool = False):
         self.is_initializer = is_initializer
@@ -47,26 +222,38 @@ class LoxFunction(LoxCallable):
         return len(self.declaration.params)
 
     def bind(self, instance: 'LoxInstance'):
-        environment = Environment(self.closure)
-        environment.define("this", instance)
-        return LoxFunction(self.declaration, environment, self.is_initializer)
+        environment = Environment(self.closure, [instance])
+        return self.__class__(self.declaration, environment, self.is_initializer)
 
-    def call(self, interpreter: 'Interpreter', arguments: list[Any]) -> Any:
-        environment = Environment(self.closure)
+    def invoke(self, interpreter: 'Interpreter', instance: 'LoxInstance', arguments: list[Any]) -> Any:
+        """
+        Calls the method on `instance` without creating the bound function first.
+        """
+        environment = Environment(Environment(self.closure, [instance]), arguments)
+        result = interpreter.execute_block(self.declaration.body, environment)
+        while result.__class__ is TailCall:
+            result = interpreter.execute_block(result.body, result.environment)
 
-        for i in range(len(self.declaration.params)):
-            environment.define(self.declaration.params[i].lexeme, arguments[i])
+        if self.is_initializer:
+            return instance
+        if result is NEXT:
+            return None
+        return result
+
+    def call(self, interpreter: 'Interpreter', arguments: list[Any]) -> Any:
+        # The parameters are the first slots of the function's scope, in order, and the
+        # interpreter never reuses an argument list after the call.
+        environment = Environment(self.closure, arguments)
 
-        try:
-            interpreter.execute_block(self.declaration.body, environment)
-        except ReturnError as return_value:
-            if self.is_initializer:
-                return self.closure.get_at(0, "this")
-            return return_value.value
+        result = interpreter.execute_block(self.declaration.body, environment)
+        while result.__class__ is TailCall:
+            result = interpreter.execute_block(result.body, result.environment)
 
         if self.is_initializer:
-            return self.closure.get_at(0, "this")
-        return None
+            return self.closure.values[0]
+        if result is NEXT:
+            return None
+        return result
 
     def __str__(self) -> str:
         return f"<fn {self.declaration.name.lexeme}>"
\ No newline at end of file
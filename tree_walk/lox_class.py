@@ -6,6 +6,7 @@ from token_type import Token
 from lox_callable import LoxCallable, LoxFunction
 
 if TYPE_CHECKING:
+    from inline_cache import InlineCache
     from interpreter import Interpreter
 
 
@@ -14,6 +15,8 @@ class LoxClass(LoxCallable):
         self.methods = methods
         self.name = name
         self.superclass = superclass
+        # Each class grows its own tree of shapes, which goes when the class does.
+        self.shape = Shape(())
     
     def __str__(self):
         return self.name
@@ -22,7 +25,7 @@ class LoxClass(LoxCallable):
         instance = LoxInstance(self)
         initializer = self.find_method("init")
         if initializer != None:
-            initializer.bind(instance).call(intrepreter, arguments)
+            initializer.invoke(intrepreter, instance, arguments)
         return instance
 
     def find_method(self, name: str) -> LoxFunction | None:
@@ -39,23 +42,101 @@ class LoxClass(LoxCallable):
         return initializer.arity()
 
 
+# An instance with more fields than this, or whose fields were added in an order its
+# class has no room for any more shapes for, keeps its fields in a dict instead.
+MAX_SHAPE_FIELDS = 64
+MAX_SHAPE_TRANSITIONS = 8
+
+# Returned by `LoxInstance.field` for a name the instance has no field for.
+NO_FIELD = object()
+
+
+class Shape:
+    """
+    The layout shared by every instance of a class that added the same fields in the
+    same order: which offset of the instance's value list holds each field. Adding a
+    field moves an instance to the next shape along, and each shape remembers the
+    shapes it has led to so that instances built the same way end up sharing them.
+    """
+    __slots__ = ("names", "offsets", "transitions")
+
+    def __init__(self, names: tuple[str, ...]):
+        self.names = names
+        self.offsets = {name: offset for offset, name in enumerate(names)}
+        self.transitions: dict[str, Shape] = {}
+
+    def add(self, name: str) -> Shape | None:
+        """
+        The shape after adding a field, or None when the instance should switch to a dict.
+        """
+        shape = self.transitions.get(name)
+        if shape is None:
+            if len(self.names) >= MAX_SHAPE_FIELDS or len(self.transitions) >= MAX_SHAPE_TRANSITIONS:
+                return None
+            # Should two threads add the same field at once, setdefault makes them
+            # agree on one shape.
+            shape = self.transitions.setdefault(name, Shape(self.names + (name,)))
+        return shape
+
+
+
 class LoxInstance:
+    """
+    While `shape` is set, `values` is a list laid out by the shape. Once the instance
+    is megamorphic, `shape` is None and `values` is a dict of fields by name.
+    """
+    __slots__ = ("klass", "shape", "values")
+
     def __init__(self, klass: LoxClass):
         self.klass = klass
-        self.fields: dict[str, Any] = {}
+        self.shape: Shape | None = klass.shape
+        self.values: list[Any] | dict[str, Any] = []
 
     def __str__(self):
         return f"{self.klass} instance"
 
-    def get(self, name: Token) -> Any:
-        if name.lexeme in self.fields:
-            return self.fields[name.lexeme]
+    def field(self, name: str) -> Any:
+        shape = self.shape
+        if shape is None:
+            return self.values.get(name, NO_FIELD)
+        offset = shape.offsets.get(name)
+        if offset is None:
+            return NO_FIELD
+        return self.values[offset]
 
-        method = self.klass.find_method(name.lexeme)
+    def get(self, name: Token, cache: InlineCache | None = None) -> Any:
+        shape = self.shape
+        if shape is not None:
+            offset = shape.offsets.get(name.lexeme)
+            if offset is not None:
+                return self.values[offset]
+        elif name.lexeme in self.values:
+            return self.values[name.lexeme]
+
+        if cache is None:
+            method = self.klass.find_method(name.lexeme)
+        else:
+            method = cache.find_method(self.klass)
         if method != None:
             return method.bind(self)
 
         raise RunTimeError(name, f"Undefined property '{name.lexeme}'.")
 
     def set(self, name: Token, value: Any) -> None:
-        self.fields[name.lexeme] = value
\ No newline at end of file
+        shape = self.shape
+        if shape is None:
+            self.values[name.lexeme] = value
+            return
+
+        offset = shape.offsets.get(name.lexeme)
+        if offset is not None:
+            self.values[offset] = value
+            return
+
+        next_shape = shape.add(name.lexeme)
+        if next_shape is None:
+            self.values = dict(zip(shape.names, self.values))
+            self.values[name.lexeme] = value
+        else:
+            self.values.append(value)
+        self.shape = next_shape
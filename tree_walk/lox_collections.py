@@ -0,0 +1,400 @@
+from __future__ import annotations
+from array import array
+from types import MethodType
+from typing import Any, Callable, Iterable
+
+from error import NativeError
+from lox_callable import LoxCallable, NativeFunction
+from number_backend import NumberBackend, DECIMAL, NUMBER_BACKENDS
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+FLOAT = NUMBER_BACKENDS["float"]
+
+
+class LoxList:
+    """
+    A Lox list, backed by a Python list. Lists are only ever equal to themselves.
+    """
+    __slots__ = ("values",)
+
+    def __init__(self, values: list[Any] | None = None):
+        self.values: list[Any] = [] if values is None else values
+
+    def __str__(self) -> str:
+        return self.show(stringify)
+
+    def show(self, stringify: Callable[[Any], str]) -> str:
+        """
+        Shows the list with `stringify` showing each value, for an engine that has
+        values str() does not show as Lox does.
+        """
+        return f"[{', '.join(stringify(value) for value in self.values)}]"
+
+
+class LoxMap:
+    """
+    A Lox map, backed by a Python dict, so its keys keep the order they were added in.
+    Keys are compared with Lox equality, and lists, maps and instances by identity,
+    except that booleans are never the same key as a number, though `true == 1`.
+    `entries` holds booleans, and the python engine's bound methods, as `map_key`
+    wraps them.
+    """
+    __slots__ = ("entries",)
+
+    def __init__(self, entries: dict[Any, Any] | None = None):
+        self.entries: dict[Any, Any] = {} if entries is None else entries
+
+    def __str__(self) -> str:
+        return self.show(stringify)
+
+    def show(self, stringify: Callable[[Any], str]) -> str:
+        """
+        Like `LoxList.show`.
+        """
+        return f"{{{', '.join(f'{stringify(lox_key(key))}: {stringify(value)}' for key, value in self.entries.items())}}}"
+
+
+class MethodKey:
+    """
+    A bound method of the python engine as a key. Python's bound methods are equal
+    whenever they bind the same method to the same instance, but a Lox one is only
+    equal to itself.
+    """
+    __slots__ = ("method",)
+
+    def __init__(self, method: MethodType):
+        self.method = method
+
+    def __eq__(self, other: Any) -> bool:
+        return other.__class__ is MethodKey and other.method is self.method
+
+    def __hash__(self) -> int:
+        return id(self.method)
+
+
+def map_key(key: Any) -> Any:
+    """
+    The key `LoxMap.entries` holds a Lox value under: booleans in a tuple with their
+    type, so that `true` and `1` are different keys, although they are equal, and
+    bound methods in a MethodKey.
+    """
+    key_class = key.__class__
+    if key_class is bool:
+        return (bool, key)
+    if key_class is MethodType:
+        return MethodKey(key)
+    return key
+
+
+def lox_key(key: Any) -> Any:
+    """
+    The Lox value of a key of `LoxMap.entries`, undoing `map_key`.
+    """
+    key_class = key.__class__
+    if key_class is tuple:
+        return key[1]
+    if key_class is MethodKey:
+        return key.method
+    return key
+
+
+class NumArray:
+    """
+    A Lox array of numbers, stored as doubles: in a NumPy array when NumPy is
+    installed, and in an `array('d')` otherwise. See `num_array.py` for what can be
+    done with them.
+    """
+    __slots__ = ("values",)
+
+    def __init__(self, values: Any):
+        self.values = values
+
+    def __str__(self) -> str:
+        return f"NumArray[{', '.join(FLOAT.stringify(float(value)) for value in self.values)}]"
+
+
+def doubles(values: Iterable[float]) -> Any:
+    """
+    Stores floats the way `NumArray` does.
+    """
+    if numpy is not None:
+        return numpy.fromiter(values, float)
+    return array("d", values)
+
+
+def lox_value(value: Any, numbers: NumberBackend = DECIMAL) -> Any:
+    """
+    Converts a Python value to Lox: numbers to the backend's, lists and tuples to
+    lists, and dicts to maps, all the way down. Lox values are left as they are.
+    """
+    if value is None or value.__class__ is bool or value.__class__ is str or value.__class__ in numbers.types:
+        return value
+    if isinstance(value, int):
+        return numbers.from_int(value)
+    if isinstance(value, float):
+        return numbers.from_float(value)
+    if isinstance(value, (list, tuple)):
+        return LoxList([lox_value(item, numbers) for item in value])
+    if isinstance(value, dict):
+        return LoxMap({map_key(lox_value(key, numbers)): lox_value(item, numbers) for key, item in value.items()})
+    if isinstance(value, (LoxList, LoxMap, NumArray, LoxIterator, LoxCallable)):
+        return value
+    raise TypeError(f"Lox has no values of type {value.__class__.__name__}.")
+
+
+def python_value(value: Any, numbers: NumberBackend = DECIMAL) -> Any:
+    """
+    Converts a Lox value back to Python, the way `json` can write it: whole numbers to
+    ints and others to floats, lists and NumArrays to lists, and maps to dicts.
+    """
+    if value is None or value.__class__ is bool or value.__class__ is str or value.__class__ is int:
+        return value
+    if value.__class__ in numbers.types:
+        try:
+            whole = int(value)
+        except (ValueError, OverflowError):
+            return float(value)
+        return whole if whole == value else float(value)
+    if value.__class__ is LoxList:
+        return [python_value(item, numbers) for item in value.values]
+    if value.__class__ is LoxMap:
+        return {python_value(lox_key(key), numbers): python_value(item, numbers) for key, item in value.entries.items()}
+    if value.__class__ is NumArray:
+        return [float(item) for item in value.values]
+    raise TypeError(f"{value} has no Python value.")
+
+
+class LoxIterator:
+    """
+    Steps through a collection, for `coll_hasNext` and `coll_next`: a list's values, a
+    map's keys, a string's characters or an array's numbers. A list is read as it is at
+    each step, so values appended on the way are included. A map's keys are the ones
+    it had when the iterator was made.
+    """
+    __slots__ = ("values", "index", "number")
+
+    def __init__(self, values: Any, number: Any = None):
+        self.values = values
+        self.index = 0
+        self.number = number # turns an array's doubles into the backend's numbers
+
+    def __str__(self) -> str:
+        return "<iterator>"
+
+
+def stringify(value: Any) -> str:
+    """
+    Shows a value inside a list or map as `print` would. Every number backend but the
+    float ones prints numbers with str().
+    """
+    if value is None:
+        return "nil"
+    if value.__class__ is float:
+        return FLOAT.stringify(value)
+    return str(value)
+
+
+class Collections:
+    """
+    The natives for lists and maps, as functions rather than methods so that every
+    engine can call them the way it calls `clock`. All but the constructors start with
+    `coll_`, so that they stay out of the way of the program's own globals:
+
+        List()  Map()  coll_len(c)  coll_get(c, key)  coll_set(c, key, value)
+        coll_append(list, value)  coll_pop(list)  coll_has(map, key)
+        coll_remove(map, key)  coll_keys(map)  coll_values(map)  coll_sort(list)
+        coll_join(list, separator)  coll_slice(c, start, end)
+        coll_iter(c)  coll_hasNext(iterator)  coll_next(iterator)
+
+    `len`, `get`, `slice` and `iter` also work on strings, and all but `append`,
+    `pop` and `sort` on NumArrays. Indexes are numbers from 0, and an index outside
+    the list is an error, while `get` of a missing key is nil.
+
+    `stringify` is how `join` shows values, which engines can replace with their own.
+    """
+    def __init__(self, numbers: NumberBackend = DECIMAL, stringify: Callable[[Any], str] = stringify):
+        self.numbers = numbers
+        self.stringify = stringify
+        self.number_types = numbers.types
+        self.from_int = numbers.from_int
+        self.from_float = numbers.from_float
+
+    def natives(self) -> dict[str, LoxCallable]:
+        return {
+            name: NativeFunction(name, arity, function) for name, arity, function in (
+                ("List", 0, LoxList),
+                ("Map", 0, LoxMap),
+                ("coll_len", 1, self.len),
+                ("coll_get", 2, self.get),
+                ("coll_set", 3, self.set),
+                ("coll_append", 2, self.append),
+                ("coll_pop", 1, self.pop),
+                ("coll_has", 2, self.has),
+                ("coll_remove", 2, self.remove),
+                ("coll_keys", 1, self.keys),
+                ("coll_values", 1, self.values),
+                ("coll_sort", 1, self.sort),
+                ("coll_join", 2, self.join),
+                ("coll_slice", 3, self.slice),
+                ("coll_iter", 1, self.iter),
+                ("coll_hasNext", 1, self.has_next),
+                ("coll_next", 1, self.next),
+            )
+        }
+
+    def index(self, value: Any, length: int) -> int:
+        if value.__class__ not in self.number_types:
+            raise NativeError("Index must be a number.")
+        try:
+            index = int(value)
+        except (ValueError, OverflowError):
+            index = -1
+        if index != value or not 0 <= index < length:
+            raise NativeError("Index out of range.")
+        return index
+
+    def bound(self, value: Any, length: int) -> int:
+        """
+        Like `index`, but for the ends of a slice, which may be the length itself.
+        """
+        return self.index(value, length + 1)
+
+    def len(self, collection: Any) -> Any:
+        if collection.__class__ is LoxList:
+            return self.from_int(len(collection.values))
+        if collection.__class__ is LoxMap:
+            return self.from_int(len(collection.entries))
+        if collection.__class__ is str or collection.__class__ is NumArray:
+            return self.from_int(len(collection if collection.__class__ is str else collection.values))
+        raise NativeError("Can only take the length of lists, maps, strings and arrays.")
+
+    def get(self, collection: Any, key: Any) -> Any:
+        if collection.__class__ is LoxList:
+            values = collection.values
+            return values[self.index(key, len(values))]
+        if collection.__class__ is LoxMap:
+            return collection.entries.get(map_key(key))
+        if collection.__class__ is str:
+            return collection[self.index(key, len(collection))]
+        if collection.__class__ is NumArray:
+            values = collection.values
+            return self.from_float(float(values[self.index(key, len(values))]))
+        raise NativeError("Can only get from lists, maps, strings and arrays.")
+
+    def set(self, collection: Any, key: Any, value: Any) -> Any:
+        if collection.__class__ is LoxList:
+            values = collection.values
+            values[self.index(key, len(values))] = value
+        elif collection.__class__ is LoxMap:
+            collection.entries[map_key(key)] = value
+        elif collection.__class__ is NumArray:
+            if value.__class__ not in self.number_types:
+                raise NativeError("Arrays can only hold numbers.")
+            values = collection.values
+            index = self.index(key, len(values))
+            try:
+                values[index] = float(value)
+            except OverflowError:
+                raise NativeError("Number too large.") from None
+        else:
+            raise NativeError("Can only set in lists, maps and arrays.")
+        return value
+
+    def append(self, list: Any, value: Any) -> None:
+        self.check_list(list).values.append(value)
+
+    def pop(self, list: Any) -> Any:
+        values = self.check_list(list).values
+        if not values:
+            raise NativeError("Can't pop from an empty list.")
+        return values.pop()
+
+    def has(self, map: Any, key: Any) -> bool:
+        return map_key(key) in self.check_map(map).entries
+
+    def remove(self, map: Any, key: Any) -> Any:
+        return self.check_map(map).entries.pop(map_key(key), None)
+
+    def keys(self, map: Any) -> LoxList:
+        return LoxList([lox_key(key) for key in self.check_map(map).entries])
+
+    def values(self, map: Any) -> LoxList:
+        return LoxList(list(self.check_map(map).entries.values()))
+
+    def sort(self, list: Any) -> LoxList:
+        """
+        Sorts the list in place, and returns it.
+        """
+        values = self.check_list(list).values
+        types = {value.__class__ for value in values}
+        if not (types <= set(self.number_types) or types == {str}):
+            raise NativeError("Can only sort lists of numbers or of strings.")
+        values.sort()
+        return list
+
+    def join(self, list: Any, separator: Any) -> str:
+        if separator.__class__ is not str:
+            raise NativeError("Separator must be a string.")
+        return separator.join([self.stringify(value) for value in self.check_list(list).values])
+
+    def slice(self, collection: Any, start: Any, end: Any) -> Any:
+        if collection.__class__ is str:
+            values = collection
+        elif collection.__class__ is LoxList or collection.__class__ is NumArray:
+            values = collection.values
+        else:
+            raise NativeError("Can only slice lists, strings and arrays.")
+        start = self.bound(start, len(values))
+        end = self.bound(end, len(values))
+        if start > end:
+            raise NativeError("Slice must not end before it starts.")
+
+        if collection.__class__ is LoxList:
+            return LoxList(values[start:end])
+        if collection.__class__ is NumArray:
+            # A NumPy slice is a view, and arrays never share their values.
+            part = values[start:end]
+            return NumArray(part if numpy is None else part.copy())
+        return values[start:end]
+
+    def iter(self, collection: Any) -> LoxIterator:
+        if collection.__class__ is LoxList:
+            return LoxIterator(collection.values)
+        if collection.__class__ is LoxMap:
+            return LoxIterator([lox_key(key) for key in collection.entries])
+        if collection.__class__ is str:
+            return LoxIterator(collection)
+        if collection.__class__ is NumArray:
+            return LoxIterator(collection.values, self.from_float)
+        raise NativeError("Can only iterate over lists, maps, strings and arrays.")
+
+    def has_next(self, iterator: Any) -> bool:
+        iterator = self.check_iterator(iterator)
+        return iterator.index < len(iterator.values)
+
+    def next(self, iterator: Any) -> Any:
+        iterator = self.check_iterator(iterator)
+        if iterator.index >= len(iterator.values):
+            raise NativeError("Iterator has no more values.")
+        value = iterator.values[iterator.index]
+        iterator.index += 1
+        return value if iterator.number is None else iterator.number(float(value))
+
+    def check_iterator(self, iterator: Any) -> LoxIterator:
+        if iterator.__class__ is not LoxIterator:
+            raise NativeError("Expected an iterator.")
+        return iterator
+
+    def check_list(self, list: Any) -> LoxList:
+        if list.__class__ is not LoxList:
+            raise NativeError("Expected a list.")
+        return list
+
+    def check_map(self, map: Any) -> LoxMap:
+        if map.__class__ is not LoxMap:
+            raise NativeError("Expected a map.")
+        return map
@@ -0,0 +1,14 @@
+from typing import Any, Callable
+
+from lox_callable import LoxCallable, Clock
+from lox_collections import Collections, stringify as collection_stringify
+from num_array import NumArrays
+from number_backend import NumberBackend, DECIMAL
+
+
+def natives(numbers: NumberBackend = DECIMAL, stringify: Callable[[Any], str] = collection_stringify) -> dict[str, LoxCallable]:
+    """
+    The native functions every engine starts with, by name. `stringify` is how they show
+    values, for engines whose values don't all show as Lox's with str().
+    """
+    return {"clock": Clock(numbers), **Collections(numbers, stringify).natives(), **NumArrays(numbers).natives()}
@@ -0,0 +1,133 @@
+from __future__ import annotations
+from array import array
+from itertools import repeat
+from operator import add, sub, mul, truediv
+from typing import Any, Callable
+
+from error import NativeError
+from lox_callable import LoxCallable, NativeFunction
+from lox_collections import LoxList, NumArray, doubles, numpy, FLOAT
+from number_backend import NumberBackend, DECIMAL
+
+
+class NumArrays:
+    """
+    The natives for NumArrays, which do a whole array's worth of arithmetic in one call
+    instead of one interpreted operation per number. All but the constructor start with
+    `arr_`, as the collection natives start with `coll_`:
+
+        NumArray(size or list)  arr_add(a, b)  arr_sub(a, b)  arr_mul(a, b)
+        arr_div(a, b)  arr_sum(a)  arr_min(a)  arr_max(a)  arr_mean(a)  arr_dot(a, b)
+        arr_toList(a)
+
+    `NumArray(5)` is five zeros. Either operand of the arithmetic may be a number
+    instead of an array, which then applies to every element. Numbers go in and come
+    out as whatever the number backend uses, but are doubles inside the array, and
+    divide like the float backend's. With NumPy installed, the work is done by NumPy.
+    """
+    def __init__(self, numbers: NumberBackend = DECIMAL):
+        self.number_types = numbers.types
+        self.from_float = numbers.from_float
+
+    def natives(self) -> dict[str, LoxCallable]:
+        return {
+            name: NativeFunction(name, arity, function) for name, arity, function in (
+                ("NumArray", 1, self.new),
+                ("arr_add", 2, lambda left, right: self.elementwise(add, left, right)),
+                ("arr_sub", 2, lambda left, right: self.elementwise(sub, left, right)),
+                ("arr_mul", 2, lambda left, right: self.elementwise(mul, left, right)),
+                ("arr_div", 2, self.divide),
+                ("arr_sum", 1, self.sum),
+                ("arr_min", 1, self.min),
+                ("arr_max", 1, self.max),
+                ("arr_mean", 1, self.mean),
+                ("arr_dot", 2, self.dot),
+                ("arr_toList", 1, self.to_list),
+            )
+        }
+
+    def new(self, source: Any) -> NumArray:
+        if source.__class__ is LoxList:
+            return NumArray(doubles(self.double(value) for value in source.values))
+        size = self.double(source)
+        if not size.is_integer() or size < 0:
+            raise NativeError("Size must be a whole number.")
+        if numpy is not None:
+            return NumArray(numpy.zeros(int(size)))
+        return NumArray(array("d", bytes(8 * int(size))))
+
+    def double(self, value: Any) -> float:
+        if value.__class__ not in self.number_types:
+            raise NativeError("Arrays can only hold numbers.")
+        try:
+            return float(value)
+        except OverflowError:
+            raise NativeError("Number too large.") from None
+
+    def elementwise(self, operator: Callable[[Any, Any], Any], left: Any, right: Any) -> NumArray:
+        if left.__class__ is NumArray and right.__class__ is NumArray:
+            left, right = left.values, right.values
+            if len(left) != len(right):
+                raise NativeError("Arrays must have the same length.")
+            if numpy is not None:
+                return NumArray(operator(left, right))
+            return NumArray(array("d", map(operator, left, right)))
+
+        if left.__class__ is NumArray:
+            left, right = left.values, self.double(right)
+            if numpy is not None:
+                return NumArray(operator(left, right))
+            return NumArray(array("d", map(operator, left, repeat(right))))
+
+        if right.__class__ is NumArray:
+            left, right = self.double(left), right.values
+            if numpy is not None:
+                return NumArray(operator(left, right))
+            return NumArray(array("d", map(operator, repeat(left), right)))
+
+        raise NativeError("Operands must include an array.")
+
+    def divide(self, left: Any, right: Any) -> NumArray:
+        if numpy is None:
+            return self.elementwise(FLOAT.divide, left, right)
+        # Dividing by zero gives an infinity or NaN, as with the float backend.
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            return self.elementwise(truediv, left, right)
+
+    def sum(self, numbers: Any) -> Any:
+        values = self.values(numbers)
+        return self.from_float(float(sum(values) if numpy is None else values.sum()))
+
+    def min(self, numbers: Any) -> Any:
+        values = self.nonempty(numbers)
+        return self.from_float(float(min(values) if numpy is None else values.min()))
+
+    def max(self, numbers: Any) -> Any:
+        values = self.nonempty(numbers)
+        return self.from_float(float(max(values) if numpy is None else values.max()))
+
+    def mean(self, numbers: Any) -> Any:
+        values = self.nonempty(numbers)
+        return self.from_float(float(sum(values) if numpy is None else values.sum()) / len(values))
+
+    def dot(self, left: Any, right: Any) -> Any:
+        left, right = self.values(left), self.values(right)
+        if len(left) != len(right):
+            raise NativeError("Arrays must have the same length.")
+        if numpy is not None:
+            return self.from_float(float(numpy.dot(left, right)))
+        return self.from_float(sum(map(mul, left, right)))
+
+    def to_list(self, numbers: Any) -> LoxList:
+        return LoxList([self.from_float(float(value)) for value in self.values(numbers)])
+
+    def values(self, numbers: Any) -> Any:
+        if numbers.__class__ is not NumArray:
+            raise NativeError("Expected an array.")
+        return numbers.values
+
+    def nonempty(self, numbers: Any) -> Any:
+        values = self.values(numbers)
+        if not len(values):
+            raise NativeError("Array is empty.")
+        return values
@@ -0,0 +1,149 @@
+from abc import ABC, abstractmethod
+from decimal import Decimal, DivisionByZero, InvalidOperation, Overflow
+from math import copysign
+from typing import Any
+
+from error import NativeError
+
+INFINITY = float("inf")
+NAN = float("nan")
+
+
+class NumberBackend(ABC):
+    """
+    How Lox numbers are represented at runtime. The scanner turns number literals into
+    values with `number`, `clock` reports time with `from_float` and natives report
+    lengths with `from_int`, the engines check
+    operands against `types` and divide with `divide`, and `print` shows numbers with
+    `stringify`. Every other operator is Python's own.
+
+    `types` lists the exact classes that are numbers. Engines compare `__class__`
+    against it rather than using isinstance, so that booleans (an int subclass) are
+    never mistaken for numbers.
+
+    `divide` raises NativeError for a division Lox can't do, which engines report as
+    a runtime error at the `/`. The other operators raise an ArithmeticError for a
+    number too large to represent, which engines report at the operator as well.
+    """
+    name: str
+    types: tuple[type, ...]
+
+    @abstractmethod
+    def number(self, lexeme: str) -> Any:
+        pass
+
+    @abstractmethod
+    def from_float(self, value: float) -> Any:
+        pass
+
+    @abstractmethod
+    def from_int(self, value: int) -> Any:
+        pass
+
+    @abstractmethod
+    def divide(self, left: Any, right: Any) -> Any:
+        pass
+
+    def stringify(self, value: Any) -> str:
+        return str(value)
+
+
+class DecimalBackend(NumberBackend):
+    """
+    Exact decimal arithmetic, to 28 significant digits. Dividing by zero is an error.
+    """
+    name = "decimal"
+    types = (Decimal,)
+    number = staticmethod(Decimal)
+    from_int = staticmethod(Decimal)
+
+    @staticmethod
+    def divide(left: Decimal, right: Decimal) -> Decimal:
+        try:
+            return left / right
+        except (DivisionByZero, InvalidOperation):
+            # InvalidOperation is for 0 / 0.
+            raise NativeError("Division by zero.") from None
+        except Overflow:
+            raise NativeError("Number too large.") from None
+
+    @staticmethod
+    def from_float(value: float) -> Decimal:
+        # The shortest decimal that reads back as the same float, so 0.1 comes out as
+        # 0.1 and not 0.1000000000000000055511151231257827021181583404541015625.
+        if value.is_integer():
+            return Decimal(value)
+        return Decimal(repr(value))
+
+
+class FloatBackend(NumberBackend):
+    """
+    IEEE doubles, as in the reference implementations of Lox. Division by zero gives
+    an infinity (or NaN) instead of raising, and integral values print without ".0".
+    """
+    name = "float"
+    types = (float,)
+    number = staticmethod(float)
+    from_float = staticmethod(float)
+    from_int = staticmethod(float)
+
+    @staticmethod
+    def divide(left: float, right: float) -> float:
+        try:
+            return left / right
+        except ZeroDivisionError:
+            if left == 0 or left != left:
+                return NAN
+            # The sign of the zero decides the sign of the infinity. Comparing, rather
+            # than copying the sign, also works for ints too large for a float.
+            return (INFINITY if left > 0 else -INFINITY) * copysign(1.0, right)
+
+    def stringify(self, value: float) -> str:
+        if value != value:
+            return "NaN"
+        if value == INFINITY:
+            return "Infinity"
+        if value == -INFINITY:
+            return "-Infinity"
+        text = repr(value)
+        return text[:-2] if text.endswith(".0") else text
+
+
+class AdaptiveBackend(FloatBackend):
+    """
+    Python ints while a value is integral and floats otherwise. Integer arithmetic is
+    exact and cheap, and a division only produces a float when it does not come out
+    even. Floats are not turned back into ints (0.5 + 0.5 stays 1.0), but print the
+    same way.
+    """
+    name = "int"
+    types = (int, float)
+    from_int = staticmethod(int)
+
+    @staticmethod
+    def number(lexeme: str) -> int | float:
+        if "." not in lexeme:
+            return int(lexeme)
+        value = float(lexeme)
+        return int(value) if value.is_integer() else value
+
+    @staticmethod
+    def divide(left: int | float, right: int | float) -> int | float:
+        if left.__class__ is int and right.__class__ is int and right != 0 and left % right == 0:
+            return left // right
+        try:
+            return FloatBackend.divide(left, right)
+        except OverflowError:
+            # An int, or the quotient of two, too large for a float.
+            raise NativeError("Number too large.") from None
+
+    def stringify(self, value: int | float) -> str:
+        if value.__class__ is int:
+            return str(value)
+        return super().stringify(value)
+
+
+NUMBER_BACKENDS: dict[str, NumberBackend] = {
+    backend.name: backend for backend in (DecimalBackend(), FloatBackend(), AdaptiveBackend())
+}
+DECIMAL = NUMBER_BACKENDS["decimal"]
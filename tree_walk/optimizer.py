@@ -0,0 +1,240 @@
+from typing import Any
+
+from error import NativeError
+from expr import Visitor as ExprVisitor, Expr, Assign, Binary, Call, Get, Grouping, Literal, Logical, Set, Super, This, Unary, Variable
+from number_backend import NumberBackend, DECIMAL
+from stmt import Visitor as StmtVisitor, Stmt, Block, Class, Expression, Function, If, Print, Return, Var, While
+from token_type import TokenType
+
+
+class Optimizer(ExprVisitor[Expr], StmtVisitor[Stmt | None]):
+    """
+    Simplifies a resolved program before it runs:
+    - folds operators whose operands are all literals, following Lox semantics,
+    - replaces an `if` or `while` whose condition is a literal with the branch that runs,
+    - drops the statements after a `return` in the same block,
+    - drops empty blocks.
+
+    Nodes are rewritten in place and only ever replaced by literals or by their own
+    children, so what the resolver recorded for the nodes that remain still holds.
+    Anything that would fail at runtime (like `-"a"`) is left for the runtime to report.
+
+    Visiting a statement returns None when the statement can be removed.
+    """
+    def __init__(self, numbers: NumberBackend = DECIMAL):
+        self.numbers = numbers
+        self.stats = {
+            "expressions folded": 0,
+            "branches pruned": 0,
+            "unreachable statements removed": 0,
+            "empty blocks removed": 0,
+        }
+
+    def optimize(self, statements: list[Stmt]) -> list[Stmt]:
+        return self.optimize_statements(statements)
+
+    def optimize_statements(self, statements: list[Stmt]) -> list[Stmt]:
+        optimized = []
+        for i, statement in enumerate(statements):
+            statement = statement.accept(self)
+            if statement is None:
+                continue
+            if isinstance(statement, Block) and not statement.statements:
+                self.stats["empty blocks removed"] += 1
+                continue
+            optimized.append(statement)
+            if isinstance(statement, Return):
+                self.stats["unreachable statements removed"] += len(statements) - i - 1
+                break
+        return optimized
+
+    def optimize_branch(self, stmt: Stmt) -> Stmt:
+        """
+        Optimizes the body of an `if` or `while`, which has to stay a statement.
+        """
+        optimized = stmt.accept(self)
+        return Block([]) if optimized is None else optimized
+
+    def fold(self, value: Any) -> Literal:
+        self.stats["expressions folded"] += 1
+        return Literal(value)
+
+    def report(self) -> str:
+        return "\n".join(f"{count} {name}" for name, count in self.stats.items())
+
+    # Statements
+
+    def visit_block_stmt(self, stmt: Block) -> Stmt | None:
+        stmt.statements = self.optimize_statements(stmt.statements)
+        return stmt
+
+    def visit_class_stmt(self, stmt: Class) -> Stmt | None:
+        for method in stmt.methods:
+            method.accept(self)
+        return stmt
+
+    def visit_expression_stmt(self, stmt: Expression) -> Stmt | None:
+        stmt.expression = stmt.expression.accept(self)
+        return stmt
+
+    def visit_function_stmt(self, stmt: Function) -> Stmt | None:
+        stmt.body = self.optimize_statements(stmt.body)
+        return stmt
+
+    def visit_if_stmt(self, stmt: If) -> Stmt | None:
+        stmt.condition = stmt.condition.accept(self)
+
+        if isinstance(stmt.condition, Literal):
+            self.stats["branches pruned"] += 1
+            if self.is_truthy(stmt.condition.value):
+                return stmt.then_branch.accept(self)
+            if stmt.else_branch is not None:
+                return stmt.else_branch.accept(self)
+            return None
+
+        stmt.then_branch = self.optimize_branch(stmt.then_branch)
+        if stmt.else_branch is not None:
+            stmt.else_branch = stmt.else_branch.accept(self)
+            if stmt.else_branch is None or isinstance(stmt.else_branch, Block) and not stmt.else_branch.statements:
+                stmt.else_branch = None
+        return stmt
+
+    def visit_print_stmt(self, stmt: Print) -> Stmt | None:
+        stmt.expression = stmt.expression.accept(self)
+        return stmt
+
+    def visit_return_stmt(self, stmt: Return) -> Stmt | None:
+        if stmt.value is not None:
+            stmt.value = stmt.value.accept(self)
+        return stmt
+
+    def visit_var_stmt(self, stmt: Var) -> Stmt | None:
+        if stmt.initializer is not None:
+            stmt.initializer = stmt.initializer.accept(self)
+        return stmt
+
+    def visit_while_stmt(self, stmt: While) -> Stmt | None:
+        stmt.condition = stmt.condition.accept(self)
+
+        if isinstance(stmt.condition, Literal) and not self.is_truthy(stmt.condition.value):
+            self.stats["branches pruned"] += 1
+            return None
+
+        stmt.body = self.optimize_branch(stmt.body)
+        return stmt
+
+    # Expressions
+
+    def visit_assign_expr(self, expr: Assign) -> Expr:
+        expr.value = expr.value.accept(self)
+        return expr
+
+    def visit_binary_expr(self, expr: Binary) -> Expr:
+        expr.left = expr.left.accept(self)
+        expr.right = expr.right.accept(self)
+
+        if not isinstance(expr.left, Literal) or not isinstance(expr.right, Literal):
+            return expr
+
+        left = expr.left.value
+        right = expr.right.value
+        token_type = expr.operator.token_type
+
+        if token_type == TokenType.EQUAL_EQUAL:
+            return self.fold(left == right)
+        if token_type == TokenType.BANG_EQUAL:
+            return self.fold(not left == right)
+
+        if left.__class__ is str and right.__class__ is str:
+            if token_type == TokenType.PLUS:
+                return self.fold(left + right)
+            return expr
+
+        number_types = self.numbers.types
+        if left.__class__ not in number_types or right.__class__ not in number_types:
+            return expr
+
+        try:
+            match token_type:
+                case TokenType.PLUS:
+                    return self.fold(left + right)
+                case TokenType.MINUS:
+                    return self.fold(left - right)
+                case TokenType.STAR:
+                    return self.fold(left * right)
+                case TokenType.SLASH:
+                    return self.fold(self.numbers.divide(left, right))
+                case TokenType.GREATER:
+                    return self.fold(left > right)
+                case TokenType.GREATER_EQUAL:
+                    return self.fold(left >= right)
+                case TokenType.LESS:
+                    return self.fold(left < right)
+                case TokenType.LESS_EQUAL:
+                    return self.fold(left <= right)
+        except (ArithmeticError, NativeError):
+            # Like dividing by zero with decimals. Leave it to happen at runtime.
+            pass
+        return expr
+
+    def visit_call_expr(self, expr: Call) -> Expr:
+        expr.callee = expr.callee.accept(self)
+        expr.arguments = [argument.accept(self) for argument in expr.arguments]
+        return expr
+
+    def visit_get_expr(self, expr: Get) -> Expr:
+        expr.object = expr.object.accept(self)
+        return expr
+
+    def visit_grouping_expr(self, expr: Grouping) -> Expr:
+        expr.expression = expr.expression.accept(self)
+        if isinstance(expr.expression, Literal):
+            return self.fold(expr.expression.value)
+        return expr
+
+    def visit_literal_expr(self, expr: Literal) -> Expr:
+        return expr
+
+    def visit_logical_expr(self, expr: Logical) -> Expr:
+        expr.left = expr.left.accept(self)
+        expr.right = expr.right.accept(self)
+
+        if not isinstance(expr.left, Literal):
+            return expr
+
+        # `or` yields a truthy left operand and `and` a falsey one, without evaluating
+        # the right operand. Otherwise the result is the right operand.
+        self.stats["expressions folded"] += 1
+        if self.is_truthy(expr.left.value) == (expr.operator.token_type == TokenType.OR):
+            return expr.left
+        return expr.right
+
+    def visit_set_expr(self, expr: Set) -> Expr:
+        expr.object = expr.object.accept(self)
+        expr.value = expr.value.accept(self)
+        return expr
+
+    def visit_super_expr(self, expr: Super) -> Expr:
+        return expr
+
+    def visit_this_expr(self, expr: This) -> Expr:
+        return expr
+
+    def visit_unary_expr(self, expr: Unary) -> Expr:
+        expr.right = expr.right.accept(self)
+
+        if not isinstance(expr.right, Literal):
+            return expr
+
+        value = expr.right.value
+        if expr.operator.token_type == TokenType.BANG:
+            return self.fold(not self.is_truthy(value))
+        if value.__class__ in self.numbers.types:
+            return self.fold(-value)
+        return expr
+
+    def visit_variable_expr(self, expr: Variable) -> Expr:
+        return expr
+
+    def is_truthy(self, value: Any) -> bool:
+        return value is not None and value is not False
@@ -0,0 +1,70 @@
+import io
+import sys
+from typing import TextIO
+
+DEFAULT_BUFFER_SIZE = 8192
+
+
+class Output:
+    """
+    Where a session's `print` statements and errors go. Lines are collected in a
+    buffer and handed to the writer in one piece once there are `buffer_size`
+    characters of them, so a script printing millions of lines makes thousands of
+    writes rather than millions of `print()` calls. A `buffer_size` of 0 writes every
+    line at once, and `line_buffered` does too, flushing the writer each time, for
+    interactive use.
+
+    The writer is any text stream, or whatever `sys.stdout` is at the time of each
+    flush if None. `Lox` flushes its output when a program finishes, whether or not it
+    failed, and `Diagnostics` whenever it reports an error. Anyone else writing to the
+    same writer should flush first.
+    """
+    __slots__ = ("writer", "buffer_size", "line_buffered", "chunks", "size")
+
+    def __init__(self, writer: TextIO | None = None, buffer_size: int = DEFAULT_BUFFER_SIZE,
+                 line_buffered: bool = False):
+        self.writer = writer
+        self.buffer_size = buffer_size
+        self.line_buffered = line_buffered
+        self.chunks: list[str] = []
+        self.size = 0
+
+    def write_line(self, text: str) -> None:
+        self.chunks.append(text)
+        self.chunks.append("\n")
+        self.size += len(text) + 1
+        if self.size >= self.buffer_size or self.line_buffered:
+            self.flush()
+
+    def write(self, text: str) -> int:
+        """
+        Takes text as a stream does, so that `print(..., file=output)` works too.
+        """
+        self.chunks.append(text)
+        self.size += len(text)
+        if self.size >= self.buffer_size or self.line_buffered and "\n" in text:
+            self.flush()
+        return len(text)
+
+    def flush(self) -> None:
+        writer = sys.stdout if self.writer is None else self.writer
+        if self.chunks:
+            text = "".join(self.chunks)
+            self.chunks = []
+            self.size = 0
+            writer.write(text)
+        writer.flush()
+
+
+class MemoryOutput(Output):
+    """
+    Keeps what is printed in memory, for embedding Lox: `getvalue()` returns it all.
+    """
+    __slots__ = ()
+
+    def __init__(self, buffer_size: int = DEFAULT_BUFFER_SIZE):
+        super().__init__(io.StringIO(), buffer_size)
+
+    def getvalue(self) -> str:
+        self.flush()
+        return self.writer.getvalue()
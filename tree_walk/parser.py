@@ -1,19 +1,32 @@
+from typing import Iterable, Iterator
+
 from expr import Expr, Binary, Grouping, Unary, Literal, Variable, Assign, Logical, Call, Get, Set, This, Super
 from stmt import Stmt, Print, Expression, Var, Block, If, While, Function, Return, Class
 from token_type import Token, TokenType
 
-from error import Error, ParseError
+from error import Diagnostics, ParseError
 
 class Parser:
-    def __init__(self, tokens: list[Token]):
-        self.tokens = tokens
-        self.current = 0
+    """
+    Reads the tokens one at a time, never looking further ahead than the next one, so
+    they can come straight from `RegexScanner.scan` without ever all being in memory.
+    """
+    def __init__(self, tokens: Iterable[Token], diagnostics: Diagnostics | None = None):
+        self.diagnostics = Diagnostics() if diagnostics is None else diagnostics
+        self.tokens = iter(tokens)
+        self.current_token = next(self.tokens)
+        self.previous_token: Token | None = None
 
     def parse(self) -> list[Stmt]:
-        statements = []
+        return list(self.declarations())
+
+    def declarations(self) -> Iterator[Stmt | None]:
+        """
+        Yields each top-level declaration as soon as it has been parsed, or None
+        for one with a syntax error.
+        """
         while not self.is_at_end():
-            statements.append(self.declaration())
-        return statements
+            yield self.declaration()
 
     def expression(self) -> Expr:
         """
@@ -103,9 +116,10 @@ class Parser:
         return If(condition, then_branch, else_branch)
 
     def print_statement(self) -> Stmt:
+        keyword = self.previous()
         value = self.expression()
         self.consume(TokenType.SEMICOLON, "Expected ';' after value.")
-        return Print(value)
+        return Print(keyword, value)
 
     def return_statement(self) -> Stmt:
         keyword = self.previous()
@@ -363,20 +377,21 @@ class Parser:
         Consumes the current token and returns it.
         """
         if not self.is_at_end():
-            self.current += 1
-        return self.previous()
+            self.previous_token = self.current_token
+            self.current_token = next(self.tokens)
+        return self.previous_token
 
     def is_at_end(self) -> bool:
         return self.peek().token_type == TokenType.EOF
     
     def peek(self) -> Token:
-        return self.tokens[self.current]
+        return self.current_token
 
     def previous(self) -> Token:
-        return self.tokens[self.current - 1]
+        return self.previous_token
 
     def raise_error(self, token: Token, message: str) -> 'ParseError':
-        Error.error_token(token, message)
+        self.diagnostics.error_token(token, message)
         return ParseError(message)
 
     def synchronize(self) -> None:
@@ -0,0 +1,197 @@
+from __future__ import annotations
+from collections import defaultdict
+from time import perf_counter_ns
+from typing import Any
+
+from error import Diagnostics
+from output import Output
+from expr import Expr
+from interpreter import Interpreter
+from lox_callable import LoxFunction, TailCall
+from lox_class import LoxClass, LoxInstance
+from number_backend import NumberBackend, DECIMAL
+from stmt import Stmt, Block, Class, Function
+from token_type import Token
+
+SCRIPT = "<script>"
+
+
+class FunctionStats:
+    __slots__ = ("calls", "inclusive", "exclusive")
+
+    def __init__(self):
+        self.calls = 0
+        self.inclusive = 0 # ns, not counting recursive calls twice
+        self.exclusive = 0 # ns
+
+
+class Frame:
+    __slots__ = ("label", "start", "children", "stack")
+
+    def __init__(self, label: str, start: int, stack: tuple[str, ...]):
+        self.label = label
+        self.start = start
+        self.children = 0 # ns spent in calls made from this frame
+        self.stack = stack
+
+
+class Profile:
+    """
+    Times calls as they enter and exit. A function's inclusive time is the time from
+    its outermost call returning, and its exclusive time leaves out the calls it made.
+    Exclusive time is also added up per call stack, for flame graphs.
+    """
+    def __init__(self):
+        self.functions: defaultdict[str, FunctionStats] = defaultdict(FunctionStats)
+        self.lines: defaultdict[int, int] = defaultdict(int) # line -> hits
+        self.stacks: defaultdict[tuple[str, ...], int] = defaultdict(int) # stack -> exclusive ns
+        self.active: defaultdict[str, int] = defaultdict(int) # label -> calls on the stack
+        self.active[SCRIPT] = 1
+        self.frames = [Frame(SCRIPT, perf_counter_ns(), (SCRIPT,))]
+
+    def enter(self, label: str) -> None:
+        self.active[label] += 1
+        self.frames.append(Frame(label, perf_counter_ns(), self.frames[-1].stack + (label,)))
+
+    def exit(self) -> None:
+        now = perf_counter_ns()
+        frame = self.frames.pop()
+        elapsed = now - frame.start
+        self.frames[-1].children += elapsed
+        self.record(frame, elapsed)
+
+    def record(self, frame: Frame, elapsed: int) -> None:
+        stats = self.functions[frame.label]
+        stats.calls += 1
+        stats.exclusive += elapsed - frame.children
+        self.stacks[frame.stack] += elapsed - frame.children
+
+        self.active[frame.label] -= 1
+        if not self.active[frame.label]:
+            stats.inclusive += elapsed
+
+    def finish(self) -> None:
+        """
+        Stops the clock on the script itself. Call it once, when the script has ended.
+        """
+        frame = self.frames.pop()
+        self.record(frame, perf_counter_ns() - frame.start)
+
+    def report(self) -> str:
+        lines = [f"{'calls':>10} {'total ms':>10} {'own ms':>10}  function"]
+        by_time = sorted(self.functions.items(), key=lambda item: item[1].exclusive, reverse=True)
+        for label, stats in by_time:
+            lines.append(f"{stats.calls:>10} {stats.inclusive / 1e6:>10.2f} {stats.exclusive / 1e6:>10.2f}  {label}")
+
+        lines.append("")
+        lines.append(f"{'hits':>10}  line")
+        for line, hits in sorted(self.lines.items(), key=lambda item: (-item[1], item[0])):
+            lines.append(f"{hits:>10}  {line}")
+        return "\n".join(lines) + "\n"
+
+    def collapsed_stacks(self) -> str:
+        """
+        One line per call stack, with the microseconds spent in its innermost function,
+        in the format flamegraph.pl, inferno and speedscope read.
+        """
+        return "".join(f"{';'.join(stack)} {ns // 1000}\n" for stack, ns in self.stacks.items() if ns >= 1000)
+
+
+class ProfiledFunction(LoxFunction):
+    def call(self, interpreter: ProfilingInterpreter, arguments: list[Any]) -> Any:
+        interpreter.profile.enter(interpreter.label(self.declaration))
+        try:
+            return super().call(interpreter, arguments)
+        finally:
+            interpreter.profile.exit()
+
+    def invoke(self, interpreter: ProfilingInterpreter, instance: LoxInstance, arguments: list[Any]) -> Any:
+        interpreter.profile.enter(interpreter.label(self.declaration))
+        try:
+            return super().invoke(interpreter, instance, arguments)
+        finally:
+            interpreter.profile.exit()
+
+
+class ProfiledClass(LoxClass):
+    def __init__(self, name: str, superclass: LoxClass, methods: dict[str, LoxFunction], label: str):
+        super().__init__(name, superclass, methods)
+        self.label = label
+
+    def call(self, interpreter: ProfilingInterpreter, arguments: list[Any]) -> Any:
+        interpreter.profile.enter(self.label)
+        try:
+            return super().call(interpreter, arguments)
+        finally:
+            interpreter.profile.exit()
+
+
+class ProfilingInterpreter(Interpreter):
+    """
+    An `Interpreter` that profiles the program as it runs: calls, inclusive and
+    exclusive time per function and class, and how often each line's statements run.
+    `Lox` only uses it when asked to profile, so the plain interpreter pays nothing.
+
+    Functions and classes are labelled `name:line`, and methods `Class.name:line`.
+    """
+    function_type = ProfiledFunction
+
+    def __init__(self, numbers: NumberBackend = DECIMAL, diagnostics: Diagnostics | None = None,
+                 output: Output | None = None):
+        super().__init__(numbers, diagnostics, output)
+        self.profile = Profile()
+        self.labels: dict[Function, str] = {}
+        self.statement_lines: dict[Stmt, int] = {}
+        self.class_label = ""
+
+    def label(self, declaration: Function) -> str:
+        label = self.labels.get(declaration)
+        if label is None:
+            label = self.labels[declaration] = f"{declaration.name.lexeme}:{declaration.name.line}"
+        return label
+
+    def execute(self, stmt: Stmt) -> Any:
+        # A block is not a line of its own, and the statements in it are counted anyway.
+        if stmt.__class__ is not Block:
+            line = self.statement_lines.get(stmt)
+            if line is None:
+                # A statement without any tokens, like `1;`, has no line to count.
+                line = self.statement_lines[stmt] = first_line(stmt) or 0
+            if line:
+                self.profile.lines[line] += 1
+        return stmt.accept(self)
+
+    def tail_call_function(self, function: LoxFunction, arguments: list[Any]) -> TailCall:
+        # The call takes over the frame of the function making it, as it does the Python
+        # stack: the time so far is the caller's, and the rest the callee's.
+        self.profile.exit()
+        self.profile.enter(self.label(function.declaration))
+        return super().tail_call_function(function, arguments)
+
+    def visit_class_stmt(self, stmt: Class) -> Any:
+        for method in stmt.methods:
+            self.labels[method] = f"{stmt.name.lexeme}.{method.name.lexeme}:{method.name.line}"
+        self.class_label = f"{stmt.name.lexeme}:{stmt.name.line}"
+        return super().visit_class_stmt(stmt)
+
+    def class_type(self, name: str, superclass: LoxClass, methods: dict[str, LoxFunction]) -> ProfiledClass:
+        return ProfiledClass(name, superclass, methods, self.class_label)
+
+
+def first_line(node: Any) -> int | None:
+    """
+    The line of the first token in the node, if it has any.
+    """
+    if isinstance(node, Token):
+        return node.line
+    if isinstance(node, list):
+        for item in node:
+            line = first_line(item)
+            if line is not None:
+                return line
+    elif isinstance(node, (Expr, Stmt)):
+        for field in node.__slots__:
+            line = first_line(getattr(node, field))
+            if line is not None:
+                return line
+    return None
@@ -0,0 +1,64 @@
+from __future__ import annotations
+from typing import Any, Iterator
+
+from expr import Expr
+from stmt import Stmt, Function, Return
+
+
+class Program:
+    """
+    A scanned, parsed, resolved and optimized program, ready for any engine to run.
+
+    The resolver hands its results to `resolve` just as it would to an interpreter,
+    and `load` passes them on to the interpreter that runs the program. Keeping them
+    with the statements is what lets a program be cached and run again later without
+    resolving it again.
+    """
+    __slots__ = ("statements", "resolutions", "tail_calls", "pure_functions")
+
+    def __init__(self):
+        self.statements: list[Stmt] = []
+        self.resolutions: list[tuple[Expr, int, int]] = [] # (expr, depth, slot)
+        self.tail_calls: list[Return] = []
+        self.pure_functions: list[tuple[Function, frozenset[str]]] = [] # (function, globals it calls)
+
+    def resolve(self, expr: Expr, depth: int, slot: int) -> None:
+        self.resolutions.append((expr, depth, slot))
+
+    def resolve_tail_call(self, stmt: Return) -> None:
+        self.tail_calls.append(stmt)
+
+    def resolve_pure(self, function: Function, callees: frozenset[str]) -> None:
+        self.pure_functions.append((function, callees))
+
+    def load(self, interpreter: Any) -> None:
+        for expr, depth, slot in self.resolutions:
+            interpreter.resolve(expr, depth, slot)
+        for stmt in self.tail_calls:
+            interpreter.resolve_tail_call(stmt)
+        for function, callees in self.pure_functions:
+            interpreter.resolve_pure(function, callees)
+
+    def transient_nodes(self) -> Iterator[Expr | Stmt]:
+        """
+        Yields the nodes outside of function bodies, and the functions themselves. Once
+        the program has run, these can never run again, so what an engine keeps about
+        them can be released. Function bodies run whenever the function is called.
+        """
+        return walk(self.statements)
+
+
+def walk(statements: list[Stmt]) -> Iterator[Expr | Stmt]:
+    """
+    Yields every node of the statements, without going into the bodies of the functions
+    among them.
+    """
+    stack: list[Any] = list(statements)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, (Expr, Stmt)):
+            yield node
+            if not isinstance(node, Function):
+                stack.extend(getattr(node, field) for field in node.__slots__)
@@ -0,0 +1,125 @@
+import hashlib
+import os
+import pickle
+import sys
+import zlib
+from stat import S_IWGRP, S_IWOTH
+
+from program import Program
+
+# Bump whenever the cache file layout changes.
+CACHE_VERSION = 1
+MAGIC = b"LOXC"
+
+DEFAULT_CACHE_DIR = os.environ.get("LOX_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "lox")
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# The modules that decide what a cached program looks like. Editing any of them
+# changes the interpreter version, and so every cache key.
+COMPILER_MODULES = [
+    "expr", "stmt", "token_type", "scanner", "parser", "resolver", "optimizer", "number_backend", "program",
+    "program_cache",
+]
+
+
+def interpreter_version() -> str:
+    here = os.path.dirname(os.path.abspath(__file__))
+    parts = [str(CACHE_VERSION), sys.version]
+    for module in COMPILER_MODULES:
+        stat = os.stat(os.path.join(here, f"{module}.py"))
+        parts.append(f"{module}:{stat.st_size}:{stat.st_mtime_ns}")
+    return "\n".join(parts)
+
+
+def private(stat: os.stat_result) -> bool:
+    """
+    Whether a file or directory is the current user's, and no one else can write to it.
+    """
+    if not hasattr(os, "getuid"):
+        return True # Windows, where the cache is in the user's own profile.
+    return stat.st_uid == os.getuid() and not stat.st_mode & (S_IWGRP | S_IWOTH)
+
+
+class ProgramCache:
+    """
+    Stores compiled programs on disk, keyed by a hash of their source and of everything
+    else that affects compilation (number backend, optimization level, interpreter
+    version), so that running an unchanged script skips scanning, parsing and resolving.
+
+    Each file is MAGIC, then the interpreter version it was written by, then the pickled
+    `Program`, compressed. The directory is kept under `max_bytes` by deleting the least recently
+    used files, with a file's modification time recording its last use.
+
+    Unpickling can run any code, so the cache is only used while the directory and the
+    file are the current user's and no one else can write to them.
+    """
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES, options: str = ""):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = interpreter_version().encode()
+        self.options = options.encode()
+
+    def path(self, source: str) -> str:
+        digest = hashlib.sha256()
+        for part in (self.version, self.options, source.encode()):
+            digest.update(len(part).to_bytes(8, "little"))
+            digest.update(part)
+        return os.path.join(self.directory, f"{digest.hexdigest()}.loxc")
+
+    def load(self, source: str) -> Program | None:
+        path = self.path(source)
+        try:
+            if not private(os.stat(self.directory)):
+                return None
+            with open(path, "rb") as f:
+                if not private(os.fstat(f.fileno())) or f.read(len(MAGIC)) != MAGIC:
+                    return None
+                version = f.read(int.from_bytes(f.read(4), "little"))
+                if version != self.version:
+                    return None
+                program = pickle.loads(zlib.decompress(f.read()))
+            os.utime(path)
+        except (OSError, EOFError, zlib.error, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+        return program if isinstance(program, Program) else None
+
+    def store(self, source: str, program: Program) -> None:
+        path = self.path(source)
+        try:
+            # The fastest compression level still shrinks the pickle about eightfold.
+            data = zlib.compress(pickle.dumps(program, pickle.HIGHEST_PROTOCOL), 1)
+        except (RecursionError, pickle.PicklingError):
+            return # Too deeply nested to pickle, so just compile it every time.
+
+        try:
+            os.makedirs(self.directory, 0o700, exist_ok=True)
+            if not private(os.stat(self.directory)):
+                return
+            # Write under a temporary name first so concurrent runs never read half a file.
+            temporary = f"{path}.{os.getpid()}.tmp"
+            with open(temporary, "wb") as f:
+                f.write(MAGIC)
+                f.write(len(self.version).to_bytes(4, "little"))
+                f.write(self.version)
+                f.write(data)
+            os.replace(temporary, path)
+            self.evict()
+        except OSError:
+            pass # A cache that can't be written is just a cache miss next time.
+
+    def evict(self) -> None:
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".loxc"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
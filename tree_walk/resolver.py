@@ -1,10 +1,11 @@
 from enum import Enum
 
-from error import Error
+from error import Diagnostics
 from expr import Grouping, Visitor as ExprVisitor, Expr, Variable, Assign, Binary, Call, Literal, Unary, Logical, Get, Set, This, Super
 from stmt import Visitor as StmtVisitor, Block, Stmt, Var, Function, Expression, If, Print, Return, While, Class
 from token_type import Token
 from interpreter import Interpreter
+from program import Program
 
 
 class FunctionType(str, Enum):
@@ -20,12 +21,45 @@ class ClassType(str, Enum):
     SUBCLASS = "subclass"
 
 
+class Local:
+    """
+    A variable declared in a local scope. Its slot is its position among the scope's
+    declarations, which is where the interpreter's environment stores it.
+    """
+    __slots__ = ("slot", "defined")
+
+    def __init__(self, slot: int, defined: bool = False):
+        self.slot = slot
+        self.defined = defined
+
+
 class Resolver(ExprVisitor, StmtVisitor):
-    def __init__(self, interpreter: Interpreter):
+    def __init__(self, interpreter: Interpreter | Program | None = None, diagnostics: Diagnostics | None = None):
         self.interpreter = interpreter
-        self.scopes: list[dict[str, bool]] = [] # Stack
+        self.diagnostics = Diagnostics() if diagnostics is None else diagnostics
+        self.scopes: list[dict[str, Local]] = [] # Stack
         self.current_function = FunctionType.NONE
         self.current_class = ClassType.NONE
+        # The index in `scopes` of the current function's parameters, whether nothing
+        # seen in its body so far could make it impure, and the globals it calls.
+        self.function_scope = 0
+        self.pure = False
+        self.callees: set[str] = set()
+
+    def resolve_program(self, program: Program, statements: list[Stmt]) -> None:
+        """
+        Resolves top-level statements into `program`, so that one resolver can serve a
+        whole session. The state is reset first, in case resolving the last program
+        was cut short by an exception.
+        """
+        self.interpreter = program
+        self.scopes = []
+        self.current_function = FunctionType.NONE
+        self.current_class = ClassType.NONE
+        self.function_scope = 0
+        self.pure = False
+        self.callees = set()
+        self.resolve_statements(statements)
 
     def visit_block_stmt(self, stmt: Block) -> None:
         self.begin_scope()
@@ -41,17 +75,17 @@ class Resolver(ExprVisitor, StmtVisitor):
 
         if stmt.superclass is not None:
             if stmt.name.lexeme == stmt.superclass.name.lexeme:
-                Error.error(stmt.superclass.name, "A class can't inherit from itself.")
+                self.diagnostics.error_token(stmt.superclass.name, "A class can't inherit from itself.")
 
             self.current_class = ClassType.SUBCLASS
             self.resolve(stmt.superclass)
 
         if stmt.superclass is not None:
             self.begin_scope()
-            self.scopes[-1]["super"] = True
+            self.scopes[-1]["super"] = Local(0, True)
 
         self.begin_scope()
-        self.scopes[-1]["this"] = True
+        self.scopes[-1]["this"] = Local(0, True)
 
         for method in stmt.methods:
             declaration = FunctionType.METHOD
@@ -74,15 +108,20 @@ class Resolver(ExprVisitor, StmtVisitor):
         self.define(stmt.name)
 
     def visit_variable_expr(self, expr: Variable) -> None:
-        if self.scopes and self.scopes[-1].get(expr.name.lexeme, None) is False:
+        local = self.scopes[-1].get(expr.name.lexeme) if self.scopes else None
+        if local is not None and not local.defined:
             # print(self.scopes[-1])
-            Error.error(expr.name, "Can't read local variable in its own initializer.")
+            self.diagnostics.error_token(expr.name, "Can't read local variable in its own initializer.")
         
-        self.resolve_local(expr, expr.name)
+        if not self.resolve_local(expr, expr.name):
+            # Another function's variables can change between calls, but calling a
+            # function through them is fine (see `visit_call_expr`).
+            self.pure = False
 
     def visit_assign_expr(self, expr: Assign) -> None:
         self.resolve(expr.value)
-        self.resolve_local(expr, expr.name)
+        if not self.resolve_local(expr, expr.name):
+            self.pure = False
 
     def visit_function_stmt(self, stmt: Function) -> None:
         self.declare(stmt.name)
@@ -97,14 +136,18 @@ class Resolver(ExprVisitor, StmtVisitor):
             self.resolve(stmt.else_branch)
 
     def visit_print_stmt(self, stmt: Print) -> None:
+        self.pure = False
         self.resolve(stmt.expression)
 
     def visit_return_stmt(self, stmt: Return) -> None:
         if self.current_function == FunctionType.NONE:
-            Error.error(stmt.keyword, "Can't return from top-level code.")
+            self.diagnostics.error_token(stmt.keyword, "Can't return from top-level code.")
         if stmt.value is not None:
             if self.current_function == FunctionType.INITIALIZER:
-                Error.error(stmt.keyword, "Can't return a value from an initializer.")
+                self.diagnostics.error_token(stmt.keyword, "Can't return a value from an initializer.")
+            elif stmt.value.__class__ is Call and self.current_function != FunctionType.NONE:
+                # Nothing is left to do in this function once the call returns.
+                self.interpreter.resolve_tail_call(stmt)
             self.resolve(stmt.value)
 
     def visit_while_stmt(self, stmt: While) -> None:
@@ -116,12 +159,21 @@ class Resolver(ExprVisitor, StmtVisitor):
         self.resolve(expr.right)
 
     def visit_call_expr(self, expr: Call) -> None:
-        self.resolve(expr.callee)
+        callee = expr.callee
+        pure = self.pure
+        self.resolve(callee)
+        if callee.__class__ is Variable and self.declaring_scope(callee.name) is None:
+            # Globals are late bound, so whether calling this one is pure is only known
+            # once the program runs: `memo` checks what it holds then.
+            self.callees.add(callee.name.lexeme)
+            self.pure = pure
 
         for argument in expr.arguments:
             self.resolve(argument)
 
     def visit_get_expr(self, expr: Get) -> None:
+        # Fields can change between calls.
+        self.pure = False
         self.resolve(expr.object)
 
     def visit_grouping_expr(self, expr: Grouping) -> None:
@@ -135,23 +187,27 @@ class Resolver(ExprVisitor, StmtVisitor):
         self.resolve(expr.right)
 
     def visit_set_expr(self, expr: Set) -> None:
+        self.pure = False
         self.resolve(expr.value)
         self.resolve(expr.object)
 
     def visit_super_expr(self, expr: Super) -> None:
         if self.current_class == ClassType.NONE:
-            Error.error(expr.keyword, "Can't use 'super' outside of a class.")
+            self.diagnostics.error_token(expr.keyword, "Can't use 'super' outside of a class.")
         elif self.current_class != ClassType.SUBCLASS:
-            Error.error(expr.keyword, "Can't use 'super' in a class with no superclass.")
+            self.diagnostics.error_token(expr.keyword, "Can't use 'super' in a class with no superclass.")
 
-        self.resolve_local(expr, expr.keyword)
+        if not self.resolve_local(expr, expr.keyword):
+            # The method's instance, which a function nested in it can't depend on.
+            self.pure = False
 
     def visit_this_expr(self, expr: This) -> None:
         if self.current_class == ClassType.NONE:
-            Error.error(expr.keyword, "Can't use 'this' outside of a class.")
+            self.diagnostics.error_token(expr.keyword, "Can't use 'this' outside of a class.")
             return
 
-        self.resolve_local(expr, expr.keyword)
+        if not self.resolve_local(expr, expr.keyword):
+            self.pure = False
 
     def visit_unary_expr(self, expr: Unary) -> None:
         self.resolve(expr.right)
@@ -163,37 +219,74 @@ class Resolver(ExprVisitor, StmtVisitor):
     def resolve(self, stmt: Stmt | Expr) -> None:
         stmt.accept(self)
 
-    def resolve_local(self, expr: Expr, name: Token) -> None:
+    def resolve_local(self, expr: Expr, name: Token) -> bool:
+        """
+        Returns whether the variable belongs to the current function, rather than to an
+        enclosing one or the globals.
+        """
+        i = self.declaring_scope(name)
+        if i is None:
+            return False
+        self.interpreter.resolve(expr, len(self.scopes) - 1 - i, self.scopes[i][name.lexeme].slot)
+        return i >= self.function_scope
+
+    def declaring_scope(self, name: Token) -> int | None:
+        """
+        The index in `scopes` of the variable's declaration, or None for a global.
+        """
         for i in range(len(self.scopes) - 1, -1, -1):
-            if self.scopes[i].get(name.lexeme, False):
-                self.interpreter.resolve(expr, len(self.scopes) - 1 - i)
-                return
+            local = self.scopes[i].get(name.lexeme)
+            if local is not None and local.defined:
+                return i
+        return None
 
     def resolve_function(self, function: Function, function_type: FunctionType) -> None:
+        """
+        Also finds out whether the function is pure, so that `memo` can cache it: its
+        result must depend on nothing but its arguments, and calling it must change
+        nothing. So it may not print, touch fields, or assign or read variables other
+        than its own, except to call global functions. Those are late bound, so they are
+        handed over with the function, for `memo` to check when it runs.
+        """
         enclosing_function = self.current_function
+        enclosing_function_scope = self.function_scope
+        enclosing_pure = self.pure
+        enclosing_callees = self.callees
         self.current_function = function_type
+        self.function_scope = len(self.scopes)
+        self.pure = True
+        self.callees = set()
         self.begin_scope()
         for param in function.params:
             self.declare(param)
             self.define(param)
         self.resolve_statements(function.body)
         self.end_scope()
+        if self.pure and function_type == FunctionType.FUNCTION:
+            self.interpreter.resolve_pure(function, frozenset(self.callees))
         self.current_function = enclosing_function
+        self.function_scope = enclosing_function_scope
+        # A function declared inside another can only make it impure when called, but
+        # keep it simple.
+        self.pure = enclosing_pure and self.pure
+        self.callees = enclosing_callees | self.callees
 
     def declare(self, name: Token) -> None:
         if not self.scopes:
             return
         scope = self.scopes[-1]
 
-        if scope.get(name.lexeme, False):
-            Error.error(name, "Already a variable with this name in this scope.")
-        scope[name.lexeme] = False
+        if name.lexeme in scope:
+            self.diagnostics.error_token(name, "Already a variable with this name in this scope.")
+            # Keep the original slot; the program will not run anyway.
+            scope[name.lexeme].defined = False
+            return
+        scope[name.lexeme] = Local(len(scope))
 
     def define(self, name: Token) -> None:
         if not self.scopes:
             return
-        scope = self.scopes[-1]
-        scope[name.lexeme] = True
+        self.scopes[-1][name.lexeme].defined = True
 
     def begin_scope(self) -> None:
         self.scopes.append({})
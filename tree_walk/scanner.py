@@ -1,7 +1,9 @@
-from decimal import Decimal
-from typing import Any
+import re
+from sys import intern
+from typing import Any, Iterable, Iterator
 
-from error import Error
+from error import Diagnostics
+from number_backend import NumberBackend, DECIMAL
 from token_type import Token, TokenType
 
 
@@ -24,9 +26,32 @@ keywords = {
     "while": TokenType.WHILE,
 }
 
+operators = {
+    token_type.value: token_type for token_type in TokenType
+    if len(token_type.value) <= 2 and token_type.value not in keywords
+}
+
+# Whitespace and comments, then one alternative per kind of lexeme, tried in this order.
+# A string with no closing quote runs to the end of the source, as it does in `Scanner`.
+# Anything else is a single unexpected character. The lexeme is optional so that trailing
+# whitespace still matches.
+TOKEN_PATTERN = re.compile(r"""
+    ((?:[ \t\r\n]|//[^\n]*)*)
+    (?:
+      ([A-Za-z_][A-Za-z0-9_]*)
+    | (!=|==|<=|>=|[(){},.\-+;*/!=<>])
+    | ([0-9]+(?:\.[0-9]+)?)
+    | ("[^"]*"?)
+    | (.)
+    )?
+""", re.VERBOSE | re.DOTALL)
+
+
 class Scanner:
-    def __init__(self, source: str):
+    def __init__(self, source: str, numbers: NumberBackend = DECIMAL, diagnostics: Diagnostics | None = None):
         self.source = source
+        self.numbers = numbers
+        self.diagnostics = Diagnostics() if diagnostics is None else diagnostics
         self.tokens = []
         self.start = 0
         self.current = 0
@@ -65,7 +90,7 @@ class Scanner:
             case '*':
                 self.add_token(TokenType.STAR)
             case '!':
-                tt = TokenType.BANG if self.match('=') else TokenType.BANG
+                tt = TokenType.BANG if not self.match('=') else TokenType.BANG_EQUAL
                 self.add_token(tt)
             case '=':
                 tt = TokenType.EQUAL if not self.match('=') else TokenType.EQUAL_EQUAL
@@ -95,7 +120,7 @@ class Scanner:
                 elif self.is_alpha(c):
                     self.identifier_eval()
                 else:
-                    Error.error(self.line, f"Unexpected character: {c}")
+                    self.diagnostics.error(self.line, f"Unexpected character: {c}")
 
     def is_at_end(self) -> bool:
         return self.current >= len(self.source)
@@ -106,6 +131,9 @@ class Scanner:
 
     def add_token(self, token_type: TokenType, literal: Any = None) -> None:
         text = self.source[self.start:self.current] # Might be self.current+1
+        if literal is None:
+            # Identifiers and keywords repeat a lot, so share one string per name.
+            text = intern(text)
         self.tokens.append(Token(token_type, text, literal, self.line))
 
     def match(self, expected: str) -> bool:
@@ -135,7 +163,8 @@ class Scanner:
             self.advance()
         
         if self.is_at_end():
-            Error.error(self.line, "Unterminated string.")
+            self.diagnostics.error(self.line, "Unterminated string.")
+            return
 
         # The closing quote
         self.advance()
@@ -154,7 +183,7 @@ class Scanner:
             while self.is_digit(self.peek()):
                 self.advance()
 
-        value = Decimal(self.source[self.start:self.current])
+        value = self.numbers.number(self.source[self.start:self.current])
         self.add_token(TokenType.NUMBER, value)
 
     def identifier_eval(self) -> None:
@@ -173,3 +202,82 @@ class Scanner:
 
     def is_alpha_numeric(self, c: str) -> bool:
         return self.is_digit(c) or self.is_alpha(c)
+
+
+class RegexScanner:
+    """
+    Produces exactly the tokens and errors that `Scanner` does, but matches each lexeme
+    with one precompiled regular expression instead of a character at a time. Most of
+    what is left of its running time goes into creating the tokens themselves.
+    """
+    def __init__(self, source: str, numbers: NumberBackend = DECIMAL, diagnostics: Diagnostics | None = None):
+        self.source = source
+        self.numbers = numbers
+        self.diagnostics = Diagnostics() if diagnostics is None else diagnostics
+        self.tokens = []
+        self.line = 1
+
+    def scan_tokens(self) -> list[Token]:
+        self.tokens.extend(self.tokens_from(TOKEN_PATTERN.findall(self.source)))
+        return self.tokens
+
+    def scan(self) -> Iterator[Token]:
+        """
+        Yields the tokens one at a time, scanning only as far as has been asked for.
+        """
+        return self.tokens_from(match.groups() for match in TOKEN_PATTERN.finditer(self.source))
+
+    def scan_lines(self, lines: Iterable[str]) -> Iterator[Token]:
+        """
+        Like `scan`, but reads the source a line at a time, as from a file, instead of
+        `source`. Only a token can span lines, a string, so only an open one is carried
+        over to the next line.
+        """
+        return self.tokens_from(self.matches(lines))
+
+    @staticmethod
+    def matches(lines: Iterable[str]) -> Iterator[tuple[str, ...]]:
+        pending = ""
+        for line in lines:
+            text = pending + line
+            pending = ""
+            for match in TOKEN_PATTERN.finditer(text):
+                string = match.group(5)
+                if string and (len(string) == 1 or string[-1] != '"'):
+                    # The rest of the text is in the string, which may end on a later line.
+                    pending = text[match.start():]
+                    break
+                yield match.groups()
+        if pending:
+            yield from (match.groups() for match in TOKEN_PATTERN.finditer(pending))
+
+    def tokens_from(self, matches: Iterable[tuple[str, ...]]) -> Iterator[Token]:
+        """
+        Turns the groups matched by TOKEN_PATTERN at each position into tokens.
+        """
+        number = self.numbers.number
+        line = self.line
+
+        for space, identifier, operator, digits, string, unexpected in matches:
+            if space and "\n" in space:
+                line += space.count("\n")
+
+            if identifier:
+                identifier = intern(identifier)
+                yield Token(keywords.get(identifier, TokenType.IDENTIFIER), identifier, None, line)
+            elif operator:
+                yield Token(operators[operator], intern(operator), None, line)
+            elif digits:
+                yield Token(TokenType.NUMBER, digits, number(digits), line)
+            elif string:
+                if "\n" in string:
+                    line += string.count("\n")
+                if len(string) == 1 or string[-1] != '"':
+                    self.diagnostics.error(line, "Unterminated string.")
+                else:
+                    yield Token(TokenType.STRING, string, string[1:-1], line)
+            elif unexpected:
+                self.diagnostics.error(line, f"Unexpected character: {unexpected}")
+
+        self.line = line
+        yield Token(TokenType.EOF, "", None, line)
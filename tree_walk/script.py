@@ -0,0 +1,59 @@
+import threading
+from typing import Any, TextIO
+
+from error import Diagnostics
+from lox_collections import lox_value
+from number_backend import NumberBackend
+from program import Program
+
+
+class Script:
+    """
+    A program compiled once for one engine, to be run any number of times, each time
+    from scratch: only the natives and the globals passed to `run` are defined, and
+    nothing a run defines is seen by the next. `Lox.compile` makes them.
+
+    Scanning, parsing, resolving and the engine's own compiling all happen up front,
+    so a run costs little more than the program itself. A script keeps an engine of
+    its own, so its runs take turns; compile one per thread to run them in parallel.
+    """
+    __slots__ = ("engine", "prepared", "numbers", "lock")
+
+    def __init__(self, engine: Any, program: Program, numbers: NumberBackend):
+        program.load(engine)
+        self.engine = engine
+        self.prepared = engine.prepare(program.statements)
+        self.numbers = numbers
+        self.lock = threading.Lock()
+
+    def run(self, globals: dict[str, Any] | None = None, stdout: TextIO | None = None) -> bool:
+        """
+        Runs the script with `globals` defined, converted from Python as `lox_value`
+        does, and prints to `stdout`, or whatever `sys.stdout` is at the time if None.
+        Returns False, having printed the error, if a runtime error stopped it.
+        """
+        values = {} if globals is None else {name: lox_value(value, self.numbers) for name, value in globals.items()}
+        output = self.engine.output
+        with self.lock:
+            output.writer = stdout
+            diagnostics = Diagnostics(output)
+            self.engine.reset(values, diagnostics)
+            try:
+                self.engine.run_prepared(self.prepared)
+            finally:
+                output.flush()
+        return not diagnostics.had_runtime_error
+
+    def call(self, name: str, arguments: list[Any]) -> Any:
+        """
+        Calls a function or class that the last run defined, with the arguments
+        converted as `run` converts globals, and returns the Lox value it returns.
+        Prints go where the last run's did. Raises RunTimeError, without reporting it,
+        if the call fails.
+        """
+        arguments = [lox_value(argument, self.numbers) for argument in arguments]
+        with self.lock:
+            try:
+                return self.engine.call_global(name, arguments)
+            finally:
+                self.engine.output.flush()
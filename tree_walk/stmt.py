@@ -11,11 +11,15 @@ from expr import Expr, Variable
 T = TypeVar('T')
 
 class Stmt(ABC):
+	__slots__ = ()
+
 	@abstractmethod
 	def accept(self, visitor: 'Visitor[T]') -> T:
 		pass
 
 class Block(Stmt):
+	__slots__ = ('statements',)
+
 	def __init__(self, statements: list[Stmt]):
 		self.statements = statements
 
@@ -23,6 +27,8 @@ class Block(Stmt):
 		return visitor.visit_block_stmt(self)
 
 class Class(Stmt):
+	__slots__ = ('name', 'superclass', 'methods')
+
 	def __init__(self, name: Token, superclass: Variable, methods: list['Function']):
 		self.name = name
 		self.superclass = superclass
@@ -32,6 +38,8 @@ class Class(Stmt):
 		return visitor.visit_class_stmt(self)
 
 class Expression(Stmt):
+	__slots__ = ('expression',)
+
 	def __init__(self, expression: Expr):
 		self.expression = expression
 
@@ -39,6 +47,8 @@ class Expression(Stmt):
 		return visitor.visit_expression_stmt(self)
 
 class Function(Stmt):
+	__slots__ = ('name', 'params', 'body', '__weakref__')
+
 	def __init__(self, name: Token, params: list[Token], body: list[Stmt]):
 		self.name = name
 		self.params = params
@@ -48,6 +58,8 @@ class Function(Stmt):
 		return visitor.visit_function_stmt(self)
 
 class If(Stmt):
+	__slots__ = ('condition', 'then_branch', 'else_branch')
+
 	def __init__(self, condition: Expr, then_branch: Stmt, else_branch: Stmt):
 		self.condition = condition
 		self.then_branch = then_branch
@@ -57,13 +69,18 @@ class If(Stmt):
 		return visitor.visit_if_stmt(self)
 
 class Print(Stmt):
-	def __init__(self, expression: Expr):
+	__slots__ = ('keyword', 'expression')
+
+	def __init__(self, keyword: Token, expression: Expr):
+		self.keyword = keyword
 		self.expression = expression
 
 	def accept(self, visitor: 'Visitor[T]') -> T:
 		return visitor.visit_print_stmt(self)
 
 class Return(Stmt):
+	__slots__ = ('keyword', 'value')
+
 	def __init__(self, keyword: Token, value: Expr):
 		self.keyword = keyword
 		self.value = value
@@ -72,6 +89,8 @@ class Return(Stmt):
 		return visitor.visit_return_stmt(self)
 
 class Var(Stmt):
+	__slots__ = ('name', 'initializer')
+
 	def __init__(self, name: Token, initializer: Expr):
 		self.name = name
 		self.initializer = initializer
@@ -80,6 +99,8 @@ class Var(Stmt):
 		return visitor.visit_var_stmt(self)
 
 class While(Stmt):
+	__slots__ = ('condition', 'body')
+
 	def __init__(self, condition: Expr, body: Stmt):
 		self.condition = condition
 		self.body = body
@@ -52,6 +52,8 @@ class TokenType(str, Enum):
 
 
 class Token:
+    __slots__ = ("token_type", "lexeme", "literal", "line")
+
     def __init__(self, token_type: TokenType | str, lexeme: str, literal: Any, line: int):
         self.token_type = token_type
         self.lexeme = lexeme
@@ -0,0 +1,935 @@
+from __future__ import annotations
+import weakref
+from functools import partial
+from math import isfinite
+from types import CodeType, FunctionType, MethodType
+from typing import Any, Callable, Iterator
+
+from error import Diagnostics, NativeError, RunTimeError
+from output import Output
+from expr import Visitor as ExprVisitor, Expr, Assign, Binary, Call, Get, Grouping, Literal, Logical, Set, Super, This, Unary, Variable
+from lox_callable import LoxCallable
+from lox_collections import LoxList, LoxMap
+from natives import natives
+from number_backend import NumberBackend, DECIMAL
+from program import Program
+from stmt import Visitor as StmtVisitor, Stmt, Block, Class, Expression, Function, If, Print, Return, Var, While
+from token_type import Token, TokenType
+
+DEBUG_PRINT_SOURCE = False
+
+# Lox names are mangled so they can never collide with Python keywords, builtins or
+# the runtime helpers below (which all start with an underscore):
+#   global variables   g_<name>
+#   local variables    v<n>_<name>, numbered so shadowed locals get distinct names
+#   captured functions d<n>_<name>, the function itself (its cell is a v<n>_<name>)
+#   fields and methods f_<name>
+# Everything after the first underscore is the Lox name again.
+
+
+def lox_name(python_name: str) -> str:
+    return python_name.split("_", 1)[1]
+
+
+def runtime_error(line: int, message: str) -> RunTimeError:
+    return RunTimeError(Token(TokenType.EOF, "", None, line), message)
+
+
+class LoxType(type):
+    """
+    The metaclass of every class compiled from Lox, so that classes print like Lox classes.
+    """
+    def __str__(cls) -> str:
+        return cls.__lox_name__
+
+
+class LoxObject(metaclass=LoxType):
+    """
+    The base class of every class compiled from Lox.
+
+    Lox property lookup (fields first, then methods bound to the instance) is exactly
+    Python's attribute lookup for plain functions on a class, so instances use it as is.
+    """
+    __lox_name__ = "LoxObject"
+
+    def __str__(self) -> str:
+        return f"{self.__lox_name__} instance"
+
+
+def stringify(value: Any, numbers: NumberBackend) -> str:
+    if value is None:
+        return "nil"
+    if value.__class__ in numbers.types:
+        return numbers.stringify(value)
+    if value.__class__ is FunctionType:
+        return f"<fn {lox_name(value.__name__)}>"
+    if value.__class__ is MethodType:
+        return f"<fn {lox_name(value.__func__.__name__)}>"
+    if value.__class__ is LoxList or value.__class__ is LoxMap:
+        # Their own str() would show functions and methods as Python does.
+        return value.show(partial(stringify, numbers=numbers))
+    return str(value)
+
+
+def call(callee: Any, line: int, *arguments: Any) -> Any:
+    """
+    The slow path of a call: anything that is not a plain function, and every arity error.
+    """
+    argc = len(arguments)
+    if callee.__class__ is FunctionType:
+        arity = callee.__code__.co_argcount
+    elif callee.__class__ is MethodType:
+        arity = callee.__func__.__code__.co_argcount - 1
+    elif callee.__class__ is LoxType:
+        instance = object.__new__(callee)
+        initializer = getattr(callee, "f_init", None)
+        if initializer is None:
+            if argc != 0:
+                raise runtime_error(line, f"Expected 0 arguments but got {argc}.")
+            return instance
+        arity = initializer.__code__.co_argcount - 1
+        if argc != arity:
+            raise runtime_error(line, f"Expected {arity} arguments but got {argc}.")
+        return initializer(instance, *arguments)
+    elif isinstance(callee, LoxCallable):
+        if argc != callee.arity():
+            raise runtime_error(line, f"Expected {callee.arity()} arguments but got {argc}.")
+        try:
+            return callee.call(None, list(arguments))
+        except NativeError as error:
+            raise runtime_error(line, error.message) from None
+    else:
+        raise runtime_error(line, "Can only call functions and classes.")
+
+    if argc != arity:
+        raise runtime_error(line, f"Expected {arity} arguments but got {argc}.")
+    return callee(*arguments)
+
+
+def get(instance: Any, name: str, line: int) -> Any:
+    if not isinstance(instance, LoxObject):
+        raise runtime_error(line, "Only instances have properties.")
+    try:
+        return getattr(instance, name)
+    except AttributeError:
+        raise runtime_error(line, f"Undefined property '{lox_name(name)}'.") from None
+
+
+def invoke(instance: Any, name: str, line: int, *arguments: Any) -> Any:
+    return call(get(instance, name, line), line, *arguments)
+
+
+def check_instance(instance: Any, line: int) -> LoxObject:
+    if not isinstance(instance, LoxObject):
+        raise runtime_error(line, "Only instances have fields.")
+    return instance
+
+
+def set_field(instance: LoxObject, name: str, value: Any) -> Any:
+    setattr(instance, name, value)
+    return value
+
+
+def super_method(klass: LoxType, instance: LoxObject, name: str, line: int) -> Any:
+    try:
+        return getattr(super(klass, instance), name)
+    except AttributeError:
+        raise runtime_error(line, f"Undefined property '{lox_name(name)}'.") from None
+
+
+def check_superclass(superclass: Any, line: int) -> LoxType:
+    if superclass.__class__ is not LoxType:
+        raise runtime_error(line, "Superclass must be a class.")
+    return superclass
+
+
+def set_cell(cell: list[Any], value: Any) -> Any:
+    cell[0] = value
+    return value
+
+
+def operand_error(line: int) -> None:
+    raise runtime_error(line, "Operand must be a number.")
+
+
+def operands_error(line: int) -> None:
+    raise runtime_error(line, "Operands must be numbers.")
+
+
+def add_error(line: int) -> None:
+    raise runtime_error(line, "Operands must be two strings or two numbers.")
+
+
+RUNTIME = {
+    "_Function": FunctionType,
+    "_Method": MethodType,
+    "_LoxObject": LoxObject,
+    "_call": call,
+    "_get": get,
+    "_invoke": invoke,
+    "_instance": check_instance,
+    "_set": set_field,
+    "_super": super_method,
+    "_superclass": check_superclass,
+    "_set_cell": set_cell,
+    "_operand_error": operand_error,
+    "_operands_error": operands_error,
+    "_add_error": add_error,
+}
+
+
+class Binding:
+    """
+    A local variable, as seen by the Python code.
+
+    Locals captured by a nested function are stored in a one element list, and the
+    nested function receives that list as a keyword only parameter defaulting to it.
+    Python closures capture variables rather than values, so a function created in a
+    loop would otherwise see whatever the variable was last rebound to, not the
+    variable that was live when it was declared.
+    """
+    __slots__ = ("name", "function", "captured")
+
+    def __init__(self, name: str, function: object):
+        self.name = name
+        self.function = function
+        self.captured = False
+
+
+class ScopeAnalyzer(ExprVisitor[None], StmtVisitor[None]):
+    """
+    Finds the declaration behind every local variable use, and which locals are
+    captured by nested functions. It mirrors the resolver's scopes, so the depths the
+    resolver computed pick out the right scope directly.
+    """
+    def __init__(self, transpiler: Transpiler):
+        self.transpiler = transpiler
+        self.locals = transpiler.locals
+        self.bindings = transpiler.bindings
+        self.free = transpiler.free
+        self.scopes: list[dict[str, Binding]] = []
+        self.function: object = None
+        self.functions: list[Function] = []
+
+    def analyze(self, statements: list[Stmt]) -> None:
+        for statement in statements:
+            statement.accept(self)
+
+    def declare(self, node: Stmt | Token, name: Token) -> None:
+        if not self.scopes:
+            return # Global
+        binding = Binding(self.transpiler.local_name(name.lexeme), self.function)
+        self.scopes[-1][name.lexeme] = binding
+        self.bindings[node] = binding
+
+    def use(self, expr: Expr, name: Token) -> None:
+        distance = self.locals.get(expr)
+        if distance is None:
+            return # Global
+        binding = self.scopes[-1 - distance][name.lexeme]
+        if binding.function is not self.function:
+            binding.captured = True
+            # Every function between the use and the declaration passes the cell along.
+            for function in reversed(self.functions):
+                if function is binding.function:
+                    break
+                self.free[function][binding] = None
+        self.bindings[expr] = binding
+
+    def function_body(self, function: Function) -> None:
+        enclosing_function = self.function
+        self.function = function
+        self.functions.append(function)
+        self.free[function] = {}
+        self.scopes.append({})
+        for param in function.params:
+            self.declare(param, param)
+        self.analyze(function.body)
+        self.scopes.pop()
+        self.functions.pop()
+        self.function = enclosing_function
+
+    def visit_block_stmt(self, stmt: Block) -> None:
+        self.scopes.append({})
+        self.analyze(stmt.statements)
+        self.scopes.pop()
+
+    def visit_class_stmt(self, stmt: Class) -> None:
+        self.declare(stmt, stmt.name)
+        if stmt.superclass is not None:
+            stmt.superclass.accept(self)
+            self.scopes.append({"super": Binding("super", self.function)})
+        self.scopes.append({"this": Binding("this", self.function)})
+        for method in stmt.methods:
+            self.function_body(method)
+        self.scopes.pop()
+        if stmt.superclass is not None:
+            self.scopes.pop()
+
+    def visit_expression_stmt(self, stmt: Expression) -> None:
+        stmt.expression.accept(self)
+
+    def visit_function_stmt(self, stmt: Function) -> None:
+        self.declare(stmt, stmt.name)
+        self.function_body(stmt)
+
+    def visit_if_stmt(self, stmt: If) -> None:
+        stmt.condition.accept(self)
+        stmt.then_branch.accept(self)
+        if stmt.else_branch is not None:
+            stmt.else_branch.accept(self)
+
+    def visit_print_stmt(self, stmt: Print) -> None:
+        stmt.expression.accept(self)
+
+    def visit_return_stmt(self, stmt: Return) -> None:
+        if stmt.value is not None:
+            stmt.value.accept(self)
+
+    def visit_var_stmt(self, stmt: Var) -> None:
+        # The initializer is analyzed first: `var a = a;` in a block reads an outer `a`.
+        if stmt.initializer is not None:
+            stmt.initializer.accept(self)
+        self.declare(stmt, stmt.name)
+
+    def visit_while_stmt(self, stmt: While) -> None:
+        stmt.condition.accept(self)
+        stmt.body.accept(self)
+
+    def visit_assign_expr(self, expr: Assign) -> None:
+        expr.value.accept(self)
+        self.use(expr, expr.name)
+
+    def visit_binary_expr(self, expr: Binary) -> None:
+        expr.left.accept(self)
+        expr.right.accept(self)
+
+    def visit_call_expr(self, expr: Call) -> None:
+        expr.callee.accept(self)
+        for argument in expr.arguments:
+            argument.accept(self)
+
+    def visit_get_expr(self, expr: Get) -> None:
+        expr.object.accept(self)
+
+    def visit_grouping_expr(self, expr: Grouping) -> None:
+        expr.expression.accept(self)
+
+    def visit_literal_expr(self, expr: Literal) -> None:
+        pass
+
+    def visit_logical_expr(self, expr: Logical) -> None:
+        expr.left.accept(self)
+        expr.right.accept(self)
+
+    def visit_set_expr(self, expr: Set) -> None:
+        expr.value.accept(self)
+        expr.object.accept(self)
+
+    def visit_super_expr(self, expr: Super) -> None:
+        pass
+
+    def visit_this_expr(self, expr: This) -> None:
+        pass
+
+    def visit_unary_expr(self, expr: Unary) -> None:
+        expr.right.accept(self)
+
+    def visit_variable_expr(self, expr: Variable) -> None:
+        self.use(expr, expr.name)
+
+
+COMPARISONS = {
+    TokenType.GREATER: ">",
+    TokenType.GREATER_EQUAL: ">=",
+    TokenType.LESS: "<",
+    TokenType.LESS_EQUAL: "<=",
+}
+ARITHMETIC = {
+    TokenType.MINUS: "-",
+    TokenType.SLASH: "/",
+    TokenType.STAR: "*",
+}
+
+
+class Transpiler(ExprVisitor[str], StmtVisitor[None]):
+    """
+    Translates a resolved program into Python source.
+
+    The program becomes a `_main` function, Lox functions become nested `def`s and Lox
+    classes become Python classes, so CPython's own bytecode does the dispatching. Each
+    expression turns into a Python expression with Lox's type checks inlined as a
+    conditional, and only the failing or unusual cases call into the runtime helpers.
+    """
+    def __init__(self, interpreter: TranspilingInterpreter):
+        self.interpreter = interpreter
+        self.locals = interpreter.locals
+        self.number_types = interpreter.numbers.types
+        self.bindings: dict[Stmt | Expr | Token, Binding] = {}
+        # The captured locals of enclosing functions that each function uses, in order.
+        self.free: dict[Function, dict[Binding, None]] = {}
+        self.lines: list[str] = []
+        self.line_map: list[int] = [] # Python line - 1 -> Lox line
+        self.indent = 0
+        self.function_type = "main"
+        self.ids = 0
+
+    def transpile(self, statements: list[Stmt]) -> tuple[str, list[int]]:
+        ScopeAnalyzer(self).analyze(statements)
+
+        self.emit("def _main():", 0)
+        self.indent += 1
+        globals = sorted({
+            f"g_{statement.name.lexeme}" for statement in statements
+            if isinstance(statement, (Var, Function, Class))
+        })
+        if globals:
+            self.emit(f"global {', '.join(globals)}", 0)
+        self.body(statements, 0)
+        self.indent -= 1
+
+        return "\n".join(self.lines) + "\n", self.line_map
+
+    def emit(self, code: str, line: int) -> None:
+        self.lines.append("    " * self.indent + code)
+        self.line_map.append(line)
+
+    def body(self, statements: list[Stmt], line: int) -> None:
+        start = len(self.lines)
+        for statement in statements:
+            statement.accept(self)
+        if len(self.lines) == start:
+            self.emit("pass", line)
+
+    def nested(self, statement: Stmt, line: int) -> None:
+        self.indent += 1
+        self.body([statement], line)
+        self.indent -= 1
+
+    def next_id(self) -> int:
+        # Only unique within the program: these are all local to `_main` or the
+        # functions in it. CPython keeps every distinct name it compiles for good, so
+        # REPL lines reusing the same ones keep memory flat.
+        self.ids += 1
+        return self.ids
+
+    def local_name(self, name: str) -> str:
+        return f"v{self.next_id()}_{name}"
+
+    def temp(self) -> str:
+        return f"_t{self.next_id()}"
+
+    def declaration_target(self, node: Stmt | Token, name: Token) -> tuple[str, bool]:
+        binding = self.bindings.get(node)
+        if binding is None:
+            return f"g_{name.lexeme}", False
+        return binding.name, binding.captured
+
+    def define(self, node: Stmt | Token, name: Token, value: str, line: int) -> None:
+        target, captured = self.declaration_target(node, name)
+        if captured:
+            value = f"[{value}]"
+        self.emit(f"{target} = {value}", line)
+
+    def condition(self, expr: Expr) -> str:
+        """
+        Lox truthiness as a Python condition. Comparisons already produce a bool.
+        """
+        value = self.expression(expr)
+        if isinstance(expr, Binary) and expr.operator.token_type not in (TokenType.PLUS, TokenType.MINUS, TokenType.STAR, TokenType.SLASH):
+            return value
+        if isinstance(expr, Unary) and expr.operator.token_type == TokenType.BANG:
+            return value
+        temp = self.temp()
+        return f"({temp} := {value}) is not None and {temp} is not False"
+
+    def expression(self, expr: Expr) -> str:
+        return expr.accept(self)
+
+    def function(self, declaration: Function, name: str, function_type: str, params: list[str]) -> None:
+        line = declaration.name.line
+        enclosing_type = self.function_type
+        self.function_type = function_type
+
+        params = params + [self.bindings[param].name for param in declaration.params]
+        free = [f"{binding.name}={binding.name}" for binding in self.free[declaration]]
+        if free:
+            params += ["*"] + free
+        self.emit(f"def {name}({', '.join(params)}):", line)
+        self.indent += 1
+        for param in declaration.params:
+            binding = self.bindings[param]
+            if binding.captured:
+                self.emit(f"{binding.name} = [{binding.name}]", line)
+        self.body(declaration.body, line)
+        if function_type == "initializer":
+            self.emit("return this", line)
+        self.indent -= 1
+
+        self.function_type = enclosing_type
+
+    def visit_block_stmt(self, stmt: Block) -> None:
+        # Every local has its own Python name, so a block needs no code of its own.
+        for statement in stmt.statements:
+            statement.accept(self)
+
+    def visit_class_stmt(self, stmt: Class) -> None:
+        line = stmt.name.line
+        klass = f"_C{self.next_id()}"
+        target, captured = self.declaration_target(stmt, stmt.name)
+        if captured:
+            # Methods referring to the class pick up the cell before it is filled.
+            self.emit(f"{target} = [None]", line)
+
+        base = "_LoxObject"
+        if stmt.superclass is not None:
+            base = f"_superclass({self.expression(stmt.superclass)}, {stmt.superclass.name.line})"
+
+        self.emit(f"class {klass}({base}):", line)
+        self.indent += 1
+        self.emit(f"__lox_name__ = {stmt.name.lexeme!r}", line)
+        for method in stmt.methods:
+            function_type = "initializer" if method.name.lexeme == "init" else "method"
+            self.function(method, f"f_{method.name.lexeme}", function_type, ["this"])
+        self.indent -= 1
+
+        if captured:
+            self.emit(f"{target}[0] = {klass}", line)
+        else:
+            self.emit(f"{target} = {klass}", line)
+
+    def visit_expression_stmt(self, stmt: Expression) -> None:
+        self.emit(self.expression(stmt.expression), self.line_of(stmt.expression))
+
+    def visit_function_stmt(self, stmt: Function) -> None:
+        target, captured = self.declaration_target(stmt, stmt.name)
+        if not captured:
+            self.function(stmt, target, "function", [])
+            return
+
+        # The function may refer to itself, so its cell has to exist first.
+        line = stmt.name.line
+        name = f"d{self.next_id()}_{stmt.name.lexeme}"
+        self.emit(f"{target} = [None]", line)
+        self.function(stmt, name, "function", [])
+        self.emit(f"{target}[0] = {name}", line)
+
+    def visit_if_stmt(self, stmt: If) -> None:
+        line = self.line_of(stmt.condition)
+        self.emit(f"if {self.condition(stmt.condition)}:", line)
+        self.nested(stmt.then_branch, line)
+        if stmt.else_branch is not None:
+            self.emit("else:", line)
+            self.nested(stmt.else_branch, line)
+
+    def visit_print_stmt(self, stmt: Print) -> None:
+        self.emit(f"_print(_str({self.expression(stmt.expression)}))", self.line_of(stmt.expression))
+
+    def visit_return_stmt(self, stmt: Return) -> None:
+        line = stmt.keyword.line
+        if self.function_type == "initializer":
+            self.emit("return this", line)
+        elif stmt.value is None:
+            self.emit("return None", line)
+        else:
+            self.emit(f"return {self.expression(stmt.value)}", line)
+
+    def visit_var_stmt(self, stmt: Var) -> None:
+        value = "None" if stmt.initializer is None else self.expression(stmt.initializer)
+        self.define(stmt, stmt.name, value, stmt.name.line)
+
+    def visit_while_stmt(self, stmt: While) -> None:
+        line = self.line_of(stmt.condition)
+        self.emit(f"while {self.condition(stmt.condition)}:", line)
+        self.nested(stmt.body, line)
+
+    def visit_assign_expr(self, expr: Assign) -> str:
+        value = self.expression(expr.value)
+        binding = self.bindings.get(expr)
+        if binding is None:
+            return f"_set_global('g_{expr.name.lexeme}', {value}, {expr.name.line})"
+        if binding.captured:
+            return f"_set_cell({binding.name}, {value})"
+        return f"({binding.name} := {value})"
+
+    def visit_binary_expr(self, expr: Binary) -> str:
+        line = expr.operator.line
+        token_type = expr.operator.token_type
+
+        if token_type == TokenType.EQUAL_EQUAL or token_type == TokenType.BANG_EQUAL:
+            return self.equality(expr.left, expr.right, token_type == TokenType.BANG_EQUAL)
+
+        if token_type == TokenType.PLUS:
+            operator = "+"
+            error = f"_add_error({line})"
+        else:
+            operator = COMPARISONS.get(token_type) or ARITHMETIC[token_type]
+            error = f"_operands_error({line})"
+
+        def operation(a: str, b: str) -> str:
+            return f"_divide({a}, {b})" if token_type == TokenType.SLASH else f"{a} {operator} {b}"
+
+        # A literal operand's type is known, so only the other side needs checking.
+        right_value = expr.right.value if isinstance(expr.right, Literal) else None
+        if right_value.__class__ is str or right_value.__class__ in self.number_types:
+            if token_type != TokenType.PLUS and right_value.__class__ is str:
+                return f"({self.expression(expr.left)}, {error})[1]"
+            a = self.temp()
+            left = f"({a} := {self.expression(expr.left)})"
+            check = f"{left}.__class__ is str" if right_value.__class__ is str else self.is_number(left)
+            return f"({operation(a, self.expression(expr.right))} if {check} else {error})"
+
+        a = self.temp()
+        b = self.temp()
+        left = f"({a} := {self.expression(expr.left)})"
+        right = f"({b} := {self.expression(expr.right)})"
+        if len(self.number_types) == 1:
+            if token_type == TokenType.PLUS:
+                check = f"{left}.__class__ is {right}.__class__ and {a}.__class__ in _Addable"
+            else:
+                check = f"{left}.__class__ is {right}.__class__ is _Number"
+        else:
+            # Mixed number types are fine here, and `&` evaluates both sides before the
+            # error is raised.
+            check = f"({left}.__class__ in _Numbers) & ({right}.__class__ in _Numbers)"
+            if token_type == TokenType.PLUS:
+                check = f"{check} or {a}.__class__ is {b}.__class__ is str"
+        return f"({operation(a, b)} if {check} else {error})"
+
+    def equality(self, left: Expr, right: Expr, negate: bool) -> str:
+        """
+        Python's `==`, except that bound methods are only equal to themselves, as in the
+        other engines. Python's are equal whenever they bind the same method to the
+        same instance. A literal is never a method, so comparing one needs no check.
+        """
+        if isinstance(left, Literal) or isinstance(right, Literal):
+            operator = "!=" if negate else "=="
+            return f"({self.expression(left)} {operator} {self.expression(right)})"
+        a = self.temp()
+        b = self.temp()
+        equal = (f"({a} := {self.expression(left)}) == ({b} := {self.expression(right)}) "
+                 f"and ({a}.__class__ is not _Method or {a} is {b})")
+        return f"(not ({equal}))" if negate else f"({equal})"
+
+    def visit_call_expr(self, expr: Call) -> str:
+        line = expr.paren.line
+        arguments = [self.expression(argument) for argument in expr.arguments]
+
+        if isinstance(expr.callee, Get):
+            return f"_invoke({self.expression(expr.callee.object)}, 'f_{expr.callee.name.lexeme}', {line}{''.join(', ' + a for a in arguments)})"
+
+        callee = self.expression(expr.callee)
+        joined = ", ".join(arguments)
+
+        # The fast path repeats the argument code, so it is only taken when that cannot
+        # nest (and so double) any further.
+        if any(contains_call(argument) for argument in expr.arguments):
+            return f"_call({callee}, {line}{''.join(', ' + a for a in arguments)})"
+
+        function = self.temp()
+        return (
+            f"({function}({joined}) if ({function} := {callee}).__class__ is _Function and "
+            f"{function}.__code__.co_argcount == {len(arguments)} else "
+            f"_call({function}, {line}{''.join(', ' + a for a in arguments)}))"
+        )
+
+    def visit_get_expr(self, expr: Get) -> str:
+        return f"_get({self.expression(expr.object)}, 'f_{expr.name.lexeme}', {expr.name.line})"
+
+    def visit_grouping_expr(self, expr: Grouping) -> str:
+        return f"({self.expression(expr.expression)})"
+
+    def visit_literal_expr(self, expr: Literal) -> str:
+        value = expr.value
+        if value.__class__ is int or value.__class__ is float and isfinite(value) or value.__class__ not in self.number_types:
+            return repr(value)
+        # Decimals and (folded) infinities have no literal syntax, so they live in the namespace.
+        return self.interpreter.constant(value)
+
+    def visit_logical_expr(self, expr: Logical) -> str:
+        left = self.expression(expr.left)
+        right = self.expression(expr.right)
+        a = self.temp()
+        truthy = f"({a} := {left}) is not None and {a} is not False"
+        if expr.operator.token_type == TokenType.OR:
+            return f"({a} if {truthy} else {right})"
+        return f"({right} if {truthy} else {a})"
+
+    def visit_set_expr(self, expr: Set) -> str:
+        line = expr.name.line
+        return f"_set(_instance({self.expression(expr.object)}, {line}), 'f_{expr.name.lexeme}', {self.expression(expr.value)})"
+
+    def visit_super_expr(self, expr: Super) -> str:
+        return f"_super(__class__, this, 'f_{expr.method.lexeme}', {expr.method.line})"
+
+    def visit_this_expr(self, expr: This) -> str:
+        return "this"
+
+    def visit_unary_expr(self, expr: Unary) -> str:
+        a = self.temp()
+        right = self.expression(expr.right)
+        if expr.operator.token_type == TokenType.BANG:
+            return f"(({a} := {right}) is None or {a} is False)"
+        return f"(-{a} if {self.is_number(f'({a} := {right})')} else _operand_error({expr.operator.line}))"
+
+    def visit_variable_expr(self, expr: Variable) -> str:
+        binding = self.bindings.get(expr)
+        if binding is None:
+            return f"g_{expr.name.lexeme}"
+        if binding.captured:
+            return f"{binding.name}[0]"
+        return binding.name
+
+    def is_number(self, code: str) -> str:
+        if len(self.number_types) == 1:
+            return f"{code}.__class__ is _Number"
+        return f"{code}.__class__ in _Numbers"
+
+    def line_of(self, expr: Expr) -> int:
+        match expr:
+            case Assign() | Variable():
+                return expr.name.line
+            case Binary() | Logical():
+                # A literal on the left has no line of its own.
+                return self.line_of(expr.left) or expr.operator.line
+            case Call():
+                return expr.paren.line
+            case Get() | Set():
+                return expr.name.line
+            case Grouping():
+                return self.line_of(expr.expression)
+            case Super() | This():
+                return expr.keyword.line
+            case Unary():
+                return expr.operator.line
+        return 0
+
+
+def contains_call(expr: Expr) -> bool:
+    match expr:
+        case Call():
+            return True
+        case Assign():
+            return contains_call(expr.value)
+        case Binary() | Logical():
+            return contains_call(expr.left) or contains_call(expr.right)
+        case Get():
+            return contains_call(expr.object)
+        case Grouping():
+            return contains_call(expr.expression)
+        case Set():
+            return contains_call(expr.object) or contains_call(expr.value)
+        case Unary():
+            return contains_call(expr.right)
+    return False
+
+
+def nested_code(code: CodeType) -> Iterator[CodeType]:
+    """
+    Yields the code of every function, class body and method defined inside `code`.
+    """
+    for constant in code.co_consts:
+        if isinstance(constant, CodeType):
+            yield constant
+            yield from nested_code(constant)
+
+
+class TranspilingInterpreter:
+    """
+    Runs programs by translating them to Python with `Transpiler` and handing the result
+    to CPython's compile() and exec(). Lox globals live in one namespace dict that is
+    kept for the life of the interpreter, so the REPL works as usual.
+    """
+    def __init__(self, numbers: NumberBackend = DECIMAL, diagnostics: Diagnostics | None = None,
+                 output: Output | None = None):
+        self.numbers = numbers
+        self.diagnostics = Diagnostics() if diagnostics is None else diagnostics
+        self.output = Output() if output is None else output
+        self.locals: dict[Expr, int] = {}
+        self.namespace: dict[str, Any] = dict(RUNTIME)
+        show = partial(stringify, numbers=numbers)
+        self.namespace.update({
+            "_Number": numbers.types[0],
+            "_Numbers": numbers.types,
+            "_Addable": (*numbers.types, str),
+            "_divide": numbers.divide,
+            "_str": show,
+            "_print": self.output.write_line,
+            "_set_global": self.set_global,
+        })
+        # What every run starts with. See `reset`.
+        self.natives: dict[str, Any] = {f"g_{name}": native for name, native in natives(numbers, show).items()}
+        self.namespace.update(self.natives)
+        # The other globals prepared programs declare or runs were given, for `reset`.
+        self.defined: set[str] = set()
+        # Names of code objects mapped to their Python line -> Lox line tables.
+        self.line_maps: dict[str, list[int]] = {}
+        self.filename = "" # Of the last program run
+        self.code: CodeType | None = None # Of the last program run, until it is released
+        self.constants: dict[str, str] = {} # repr -> name
+        self.constant_users: dict[str, int] = {} # repr -> programs still using it
+        self.program_constants: set[str] = set() # reprs used by the last program run
+        # Names of forgotten programs and constants, to use again: CPython keeps every
+        # distinct file and global name it compiles, so fresh ones would leak.
+        self.free_filenames: list[str] = []
+        self.free_constant_names: list[str] = []
+        self.ids = 0
+
+    def next_id(self) -> int:
+        self.ids += 1
+        return self.ids
+
+    def constant(self, value: Any) -> str:
+        name = self.constants.get(repr(value))
+        if name is None:
+            name = self.free_constant_names.pop() if self.free_constant_names else f"_k{self.next_id()}"
+            self.namespace[name] = value
+            self.constants[repr(value)] = name
+        self.program_constants.add(repr(value))
+        return name
+
+    def set_global(self, name: str, value: Any, line: int) -> Any:
+        if name not in self.namespace:
+            raise runtime_error(line, f"Undefined variable '{lox_name(name)}' during assignment.")
+        self.namespace[name] = value
+        return value
+
+    def resolve(self, expr: Expr, depth: int, slot: int) -> None:
+        self.locals[expr] = depth
+
+    def resolve_tail_call(self, stmt: Return) -> None:
+        pass
+
+    def resolve_pure(self, function: Function, callees: frozenset[str]) -> None:
+        pass
+
+    def release(self, program: Program) -> None:
+        """
+        Forgets the resolutions of a program that has finished running, which only the
+        transpiler needed. Its line map and the constants only it used are forgotten
+        too, at once unless it defined functions, which may still run, and otherwise
+        once the Python code of all of them has been freed.
+        """
+        for expr, _, _ in program.resolutions:
+            self.locals.pop(expr, None)
+        filename, constants, code = self.filename, self.program_constants, self.code
+        self.program_constants = set()
+        self.code = None
+        if not any(isinstance(node, Function) for node in program.transient_nodes()):
+            self.forget(filename, constants)
+            return
+
+        codes = list(nested_code(code))
+        remaining = len(codes)
+
+        def code_freed() -> None:
+            nonlocal remaining
+            remaining -= 1
+            if not remaining:
+                self.forget(filename, constants)
+        for nested in codes:
+            weakref.finalize(nested, code_freed).atexit = False
+
+    def forget(self, filename: str, constants: set[str]) -> None:
+        """
+        Forgets a program once no code of its can run any more, and frees its names.
+        """
+        del self.line_maps[filename]
+        self.free_filenames.append(filename)
+        for value in constants:
+            users = self.constant_users[value] - 1
+            if users:
+                self.constant_users[value] = users
+            else:
+                del self.constant_users[value]
+                name = self.constants.pop(value)
+                del self.namespace[name]
+                self.free_constant_names.append(name)
+
+    def interpret(self, statements: list[Stmt]) -> None:
+        self.run_prepared(self.prepare(statements))
+
+    def prepare(self, statements: list[Stmt]) -> Callable[[], None]:
+        """
+        Returns the program's `_main`, defined in the namespace.
+        """
+        self.defined.update(
+            f"g_{statement.name.lexeme}" for statement in statements
+            if isinstance(statement, (Var, Function, Class))
+        )
+        self.program_constants = set()
+        source, line_map = Transpiler(self).transpile(statements)
+        if DEBUG_PRINT_SOURCE:
+            print(source)
+
+        # None of the code of a forgotten program is left to be confused with this one's.
+        self.filename = self.free_filenames.pop() if self.free_filenames else f"<lox {self.next_id()}>"
+        self.line_maps[self.filename] = line_map
+        for value in self.program_constants:
+            self.constant_users[value] = self.constant_users.get(value, 0) + 1
+        self.code = compile(source, self.filename, "exec")
+        exec(self.code, self.namespace)
+        return self.namespace["_main"]
+
+    def reset(self, values: dict[str, Any], diagnostics: Diagnostics) -> None:
+        """
+        Starts a fresh run, where only the natives and `values` are defined. The Lox
+        globals are the `g_` names of the namespace, which the generated functions hold
+        on to, so they are swapped in place.
+        """
+        namespace = self.namespace
+        for name in self.defined:
+            namespace.pop(name, None)
+        namespace.update(self.natives)
+        values = {f"g_{name}": value for name, value in values.items()}
+        namespace.update(values)
+        self.defined.update(values)
+        self.diagnostics = diagnostics
+
+    def call_global(self, name: str, arguments: list[Any]) -> Any:
+        """
+        Calls a global function or class from Python, as `Script.call` does. Raises
+        RunTimeError if that fails.
+        """
+        if f"g_{name}" not in self.namespace:
+            raise runtime_error(0, f"Undefined variable '{name}' during get.")
+        return self.run_python(call, self.namespace[f"g_{name}"], 0, *arguments)
+
+    def run_prepared(self, main: Callable[[], None]) -> None:
+        try:
+            self.run_python(main)
+        except RunTimeError as error:
+            self.diagnostics.runtime_error(error)
+
+    def run_python(self, function: Callable[..., Any], *arguments: Any) -> Any:
+        """
+        Calls generated code, turning the Python errors it may raise into Lox ones.
+        """
+        try:
+            return function(*arguments)
+        except NameError as error:
+            # Reading a global that was never defined.
+            message = f"Undefined variable '{lox_name(error.name)}' during get."
+            raise runtime_error(self.error_line(error), message) from None
+        except RecursionError as error:
+            raise runtime_error(self.error_line(error), "Stack overflow.") from None
+        except NativeError as error:
+            # From the number backend's `divide`. Natives called from Lox are reported
+            # by `call`.
+            raise runtime_error(self.error_line(error), error.message) from None
+        except ArithmeticError as error:
+            # From `+`, `-` or `*` on ints or decimals too large to represent.
+            raise runtime_error(self.error_line(error), "Number too large.") from None
+
+    def error_line(self, error: BaseException) -> int:
+        """
+        Maps the innermost frame of generated code in the traceback back to its Lox line.
+        """
+        line = 0
+        traceback = error.__traceback__
+        while traceback is not None:
+            line_map = self.line_maps.get(traceback.tb_frame.f_code.co_filename)
+            if line_map is not None:
+                line = line_map[traceback.tb_lineno - 1]
+            traceback = traceback.tb_next
+        return line
@@ -0,0 +1,600 @@
+from __future__ import annotations
+from typing import Any
+
+from chunk import (
+    FunctionProto, OP_CONSTANT, OP_NIL, OP_TRUE, OP_FALSE, OP_POP, OP_GET_LOCAL, OP_SET_LOCAL,
+    OP_GET_GLOBAL, OP_DEFINE_GLOBAL, OP_SET_GLOBAL, OP_GET_UPVALUE, OP_SET_UPVALUE,
+    OP_GET_PROPERTY, OP_SET_PROPERTY, OP_GET_SUPER, OP_EQUAL, OP_NOT_EQUAL, OP_GREATER,
+    OP_GREATER_EQUAL, OP_LESS, OP_LESS_EQUAL, OP_ADD, OP_SUBTRACT, OP_MULTIPLY, OP_DIVIDE,
+    OP_NOT, OP_NEGATE, OP_PRINT, OP_JUMP, OP_JUMP_IF_FALSE, OP_JUMP_IF_TRUE,
+    OP_POP_JUMP_IF_FALSE, OP_CALL, OP_INVOKE, OP_SUPER_INVOKE, OP_CLOSURE, OP_CLOSE_UPVALUE,
+    OP_RETURN, OP_CLASS, OP_INHERIT, OP_METHOD,
+)
+from compiler import Compiler
+from error import Diagnostics, NativeError, RunTimeError
+from output import Output
+from expr import Expr
+from lox_callable import LoxCallable
+from natives import natives
+from number_backend import NumberBackend, DECIMAL
+from program import Program
+from stmt import Stmt, Function, Return
+from token_type import Token, TokenType
+
+DEBUG_PRINT_CODE = False
+FRAMES_MAX = 1024
+
+
+class Upvalue:
+    """
+    A captured variable. While the variable is still live on the stack the upvalue is
+    open and `location` is its stack index; once it goes out of scope the value is moved
+    into `closed` and `location` is set to -1.
+    """
+    __slots__ = ("location", "closed")
+
+    def __init__(self, location: int):
+        self.location = location
+        self.closed = None
+
+
+class Closure:
+    __slots__ = ("function", "upvalues")
+
+    def __init__(self, function: FunctionProto):
+        self.function = function
+        self.upvalues: list[Upvalue] = []
+
+    def __str__(self) -> str:
+        return str(self.function)
+
+
+class VMClass:
+    __slots__ = ("name", "methods")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.methods: dict[str, Closure] = {}
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class VMInstance:
+    __slots__ = ("klass", "fields")
+
+    def __init__(self, klass: VMClass):
+        self.klass = klass
+        self.fields: dict[str, Any] = {}
+
+    def __str__(self) -> str:
+        return f"{self.klass.name} instance"
+
+
+class BoundMethod:
+    __slots__ = ("receiver", "method")
+
+    def __init__(self, receiver: Any, method: Closure):
+        self.receiver = receiver
+        self.method = method
+
+    def __str__(self) -> str:
+        return str(self.method)
+
+
+class CallFrame:
+    __slots__ = ("closure", "ip", "base")
+
+    def __init__(self, closure: Closure, base: int):
+        self.closure = closure
+        self.ip = 0
+        self.base = base
+
+
+class VM:
+    """
+    A stack based virtual machine for the bytecode produced by `Compiler`.
+
+    It slots in for `Interpreter` in `Lox`: the resolver still runs first to report
+    static errors, but the depths it hands to `resolve` are not needed because the
+    compiler addresses variables by stack slot and upvalue index.
+    """
+    def __init__(self, numbers: NumberBackend = DECIMAL, diagnostics: Diagnostics | None = None,
+                 output: Output | None = None):
+        self.numbers = numbers
+        self.diagnostics = Diagnostics() if diagnostics is None else diagnostics
+        self.output = Output() if output is None else output
+        # What every run starts with. See `reset`.
+        self.natives: dict[str, Any] = natives(numbers)
+        self.globals: dict[str, Any] = dict(self.natives)
+        self.stack: list[Any] = []
+        self.frames: list[CallFrame] = []
+        self.open_upvalues: list[Upvalue] = [] # Sorted by stack location
+
+    def resolve(self, expr: Expr, depth: int, slot: int) -> None:
+        pass
+
+    def resolve_tail_call(self, stmt: Return) -> None:
+        pass
+
+    def resolve_pure(self, function: Function, callees: frozenset[str]) -> None:
+        pass
+
+    def release(self, program: Program) -> None:
+        pass
+
+    def interpret(self, statements: list[Stmt]) -> None:
+        self.run_prepared(self.prepare(statements))
+
+    def prepare(self, statements: list[Stmt]) -> FunctionProto:
+        function = Compiler().compile(statements)
+        if DEBUG_PRINT_CODE:
+            from debug import disassemble_chunk
+            disassemble_chunk(function.chunk, str(function))
+        return function
+
+    def reset(self, values: dict[str, Any], diagnostics: Diagnostics) -> None:
+        """
+        Starts a fresh run, where only the natives and `values` are defined.
+        """
+        self.globals = {**self.natives, **values}
+        self.diagnostics = diagnostics
+
+    def call_global(self, name: str, arguments: list[Any]) -> Any:
+        """
+        Calls a global function or class from Python, as `Script.call` does. Raises
+        RunTimeError if that fails.
+        """
+        token = Token(TokenType.IDENTIFIER, name, None, 0)
+        if name not in self.globals:
+            raise RunTimeError(token, f"Undefined variable '{name}' during get.")
+        function = self.globals[name]
+        argc = len(arguments)
+        if function.__class__ is Closure:
+            arity = function.function.arity
+        elif function.__class__ is BoundMethod:
+            arity = function.method.function.arity
+        elif function.__class__ is VMClass:
+            initializer = function.methods.get("init")
+            arity = 0 if initializer is None else initializer.function.arity
+        elif isinstance(function, LoxCallable):
+            arity = function.arity()
+        else:
+            raise RunTimeError(token, "Can only call functions and classes.")
+        if argc != arity:
+            raise RunTimeError(token, f"Expected {arity} arguments but got {argc}.")
+
+        if isinstance(function, LoxCallable):
+            try:
+                return function.call(self, arguments)
+            except NativeError as error:
+                raise RunTimeError(token, error.message)
+        self.stack.append(function)
+        self.stack.extend(arguments)
+        self.call_value(function, argc)
+        if not self.frames:
+            # A class without an initializer, which needs no code run.
+            return self.stack.pop()
+        try:
+            return self.run()
+        except RunTimeError:
+            self.reset_stack()
+            raise
+
+    def run_prepared(self, function: FunctionProto) -> None:
+        closure = Closure(function)
+        self.stack.append(closure)
+        self.frames.append(CallFrame(closure, 0))
+
+        try:
+            self.run()
+        except RunTimeError as error:
+            self.diagnostics.runtime_error(error)
+            self.reset_stack()
+
+    def reset_stack(self) -> None:
+        self.stack.clear()
+        self.frames.clear()
+        self.open_upvalues.clear()
+
+    def run(self) -> Any:
+        """
+        Runs until the outermost frame returns, and returns what it returned.
+        """
+        stack = self.stack
+        push = stack.append
+        pop = stack.pop
+        frames = self.frames
+        globals = self.globals
+        write_line = self.output.write_line
+        number_types = self.numbers.types
+        divide = self.numbers.divide
+
+        frame = frames[-1]
+        closure = frame.closure
+        code = closure.function.chunk.code
+        constants = closure.function.chunk.constants
+        ip = frame.ip
+        base = frame.base
+
+        while True:
+            op = code[ip]
+            ip += 1
+
+            # The branches are ordered roughly by how often they are executed.
+            if op is OP_GET_LOCAL:
+                push(stack[base + code[ip]])
+                ip += 1
+            elif op is OP_CONSTANT:
+                push(constants[code[ip]])
+                ip += 1
+            elif op is OP_GET_GLOBAL:
+                name = constants[code[ip]]
+                ip += 1
+                try:
+                    push(globals[name])
+                except KeyError:
+                    frame.ip = ip
+                    raise self.runtime_error(f"Undefined variable '{name}' during get.")
+            elif op is OP_LESS:
+                b = pop()
+                a = stack[-1]
+                if a.__class__ not in number_types or b.__class__ not in number_types:
+                    frame.ip = ip
+                    raise self.runtime_error("Operands must be numbers.")
+                stack[-1] = a < b
+            elif op is OP_SUBTRACT:
+                b = pop()
+                a = stack[-1]
+                if a.__class__ not in number_types or b.__class__ not in number_types:
+                    frame.ip = ip
+                    raise self.runtime_error("Operands must be numbers.")
+                try:
+                    stack[-1] = a - b
+                except ArithmeticError:
+                    frame.ip = ip
+                    raise self.runtime_error("Number too large.") from None
+            elif op is OP_ADD:
+                b = pop()
+                a = stack[-1]
+                if a.__class__ in number_types and b.__class__ in number_types or a.__class__ is b.__class__ is str:
+                    try:
+                        stack[-1] = a + b
+                    except ArithmeticError:
+                        frame.ip = ip
+                        raise self.runtime_error("Number too large.") from None
+                else:
+                    frame.ip = ip
+                    raise self.runtime_error("Operands must be two strings or two numbers.")
+            elif op is OP_POP_JUMP_IF_FALSE:
+                value = pop()
+                if value is None or value is False:
+                    ip = code[ip]
+                else:
+                    ip += 1
+            elif op is OP_CALL:
+                argc = code[ip]
+                ip += 1
+                callee = stack[-1 - argc]
+                frame.ip = ip
+                if callee.__class__ is Closure:
+                    # Calls between Lox functions are the hot path, so they are set up
+                    # inline rather than through call_value().
+                    function = callee.function
+                    if argc != function.arity:
+                        raise self.runtime_error(f"Expected {function.arity} arguments but got {argc}.")
+                    if len(frames) == FRAMES_MAX:
+                        raise self.runtime_error("Stack overflow.")
+                    frame = CallFrame(callee, len(stack) - argc - 1)
+                    frames.append(frame)
+                else:
+                    self.call_value(callee, argc)
+                    frame = frames[-1]
+                closure = frame.closure
+                code = closure.function.chunk.code
+                constants = closure.function.chunk.constants
+                ip = frame.ip
+                base = frame.base
+            elif op is OP_RETURN:
+                result = pop()
+                if self.open_upvalues:
+                    self.close_upvalues(base)
+                frames.pop()
+                if not frames:
+                    pop()
+                    return result
+                del stack[base:]
+                push(result)
+
+                frame = frames[-1]
+                closure = frame.closure
+                code = closure.function.chunk.code
+                constants = closure.function.chunk.constants
+                ip = frame.ip
+                base = frame.base
+            elif op is OP_POP:
+                pop()
+            elif op is OP_JUMP:
+                ip = code[ip]
+            elif op is OP_SET_LOCAL:
+                stack[base + code[ip]] = stack[-1]
+                ip += 1
+            elif op is OP_GET_UPVALUE:
+                upvalue = closure.upvalues[code[ip]]
+                ip += 1
+                if upvalue.location == -1:
+                    push(upvalue.closed)
+                else:
+                    push(stack[upvalue.location])
+            elif op is OP_SET_UPVALUE:
+                upvalue = closure.upvalues[code[ip]]
+                ip += 1
+                if upvalue.location == -1:
+                    upvalue.closed = stack[-1]
+                else:
+                    stack[upvalue.location] = stack[-1]
+            elif op is OP_INVOKE:
+                name = constants[code[ip]]
+                argc = code[ip + 1]
+                ip += 2
+                frame.ip = ip
+                self.invoke(name, argc)
+                frame = frames[-1]
+                closure = frame.closure
+                code = closure.function.chunk.code
+                constants = closure.function.chunk.constants
+                ip = frame.ip
+                base = frame.base
+            elif op is OP_GET_PROPERTY:
+                instance = stack[-1]
+                name = constants[code[ip]]
+                ip += 1
+                if instance.__class__ is not VMInstance:
+                    frame.ip = ip
+                    raise self.runtime_error("Only instances have properties.")
+                if name in instance.fields:
+                    stack[-1] = instance.fields[name]
+                else:
+                    frame.ip = ip
+                    stack[-1] = self.bind_method(instance.klass, instance, name)
+            elif op is OP_SET_PROPERTY:
+                instance = stack[-2]
+                if instance.__class__ is not VMInstance:
+                    frame.ip = ip + 1
+                    raise self.runtime_error("Only instances have fields.")
+                value = pop()
+                instance.fields[constants[code[ip]]] = value
+                ip += 1
+                stack[-1] = value
+            elif op is OP_NIL:
+                push(None)
+            elif op is OP_TRUE:
+                push(True)
+            elif op is OP_FALSE:
+                push(False)
+            elif op is OP_EQUAL:
+                b = pop()
+                stack[-1] = stack[-1] == b
+            elif op is OP_NOT_EQUAL:
+                b = pop()
+                stack[-1] = not stack[-1] == b
+            elif op is OP_GREATER:
+                b = pop()
+                a = stack[-1]
+                if a.__class__ not in number_types or b.__class__ not in number_types:
+                    frame.ip = ip
+                    raise self.runtime_error("Operands must be numbers.")
+                stack[-1] = a > b
+            elif op is OP_GREATER_EQUAL:
+                b = pop()
+                a = stack[-1]
+                if a.__class__ not in number_types or b.__class__ not in number_types:
+                    frame.ip = ip
+                    raise self.runtime_error("Operands must be numbers.")
+                stack[-1] = a >= b
+            elif op is OP_LESS_EQUAL:
+                b = pop()
+                a = stack[-1]
+                if a.__class__ not in number_types or b.__class__ not in number_types:
+                    frame.ip = ip
+                    raise self.runtime_error("Operands must be numbers.")
+                stack[-1] = a <= b
+            elif op is OP_MULTIPLY:
+                b = pop()
+                a = stack[-1]
+                if a.__class__ not in number_types or b.__class__ not in number_types:
+                    frame.ip = ip
+                    raise self.runtime_error("Operands must be numbers.")
+                try:
+                    stack[-1] = a * b
+                except ArithmeticError:
+                    frame.ip = ip
+                    raise self.runtime_error("Number too large.") from None
+            elif op is OP_DIVIDE:
+                b = pop()
+                a = stack[-1]
+                if a.__class__ not in number_types or b.__class__ not in number_types:
+                    frame.ip = ip
+                    raise self.runtime_error("Operands must be numbers.")
+                try:
+                    stack[-1] = divide(a, b)
+                except NativeError as error:
+                    frame.ip = ip
+                    raise self.runtime_error(error.message)
+            elif op is OP_NOT:
+                value = stack[-1]
+                stack[-1] = value is None or value is False
+            elif op is OP_NEGATE:
+                value = stack[-1]
+                if value.__class__ not in number_types:
+                    frame.ip = ip
+                    raise self.runtime_error("Operand must be a number.")
+                stack[-1] = -value
+            elif op is OP_PRINT:
+                write_line(self.stringify(pop()))
+            elif op is OP_JUMP_IF_FALSE:
+                value = stack[-1]
+                if value is None or value is False:
+                    ip = code[ip]
+                else:
+                    ip += 1
+            elif op is OP_JUMP_IF_TRUE:
+                value = stack[-1]
+                if value is None or value is False:
+                    ip += 1
+                else:
+                    ip = code[ip]
+            elif op is OP_DEFINE_GLOBAL:
+                globals[constants[code[ip]]] = pop()
+                ip += 1
+            elif op is OP_SET_GLOBAL:
+                name = constants[code[ip]]
+                ip += 1
+                if name not in globals:
+                    frame.ip = ip
+                    raise self.runtime_error(f"Undefined variable '{name}' during assignment.")
+                globals[name] = stack[-1]
+            elif op is OP_CLOSURE:
+                function = constants[code[ip]]
+                ip += 1
+                new_closure = Closure(function)
+                for _ in range(function.upvalue_count):
+                    is_local = code[ip]
+                    index = code[ip + 1]
+                    ip += 2
+                    if is_local:
+                        new_closure.upvalues.append(self.capture_upvalue(base + index))
+                    else:
+                        new_closure.upvalues.append(closure.upvalues[index])
+                push(new_closure)
+            elif op is OP_CLOSE_UPVALUE:
+                self.close_upvalues(len(stack) - 1)
+                pop()
+            elif op is OP_GET_SUPER:
+                name = constants[code[ip]]
+                ip += 1
+                frame.ip = ip
+                superclass = pop()
+                stack[-1] = self.bind_method(superclass, stack[-1], name)
+            elif op is OP_SUPER_INVOKE:
+                name = constants[code[ip]]
+                argc = code[ip + 1]
+                ip += 2
+                frame.ip = ip
+                superclass = pop()
+                self.invoke_from_class(superclass, name, argc)
+                frame = frames[-1]
+                closure = frame.closure
+                code = closure.function.chunk.code
+                constants = closure.function.chunk.constants
+                ip = frame.ip
+                base = frame.base
+            elif op is OP_CLASS:
+                push(VMClass(constants[code[ip]]))
+                ip += 1
+            elif op is OP_INHERIT:
+                superclass = stack[-2]
+                if superclass.__class__ is not VMClass:
+                    frame.ip = ip
+                    raise self.runtime_error("Superclass must be a class.")
+                # Copy-down inheritance: methods are never added to a class after its
+                # declaration, so the subclass can take a snapshot of its superclass's.
+                subclass = pop()
+                subclass.methods.update(superclass.methods)
+            elif op is OP_METHOD:
+                method = pop()
+                stack[-1].methods[constants[code[ip]]] = method
+                ip += 1
+            else:
+                raise RuntimeError(f"Unknown opcode {op}")
+
+    def call_value(self, callee: Any, argc: int) -> None:
+        """
+        Calls anything other than a plain closure. Closures get a new frame pushed;
+        everything else leaves its result on the stack in place of the callee.
+        """
+        if callee.__class__ is BoundMethod:
+            self.stack[-1 - argc] = callee.receiver
+            self.call(callee.method, argc)
+        elif callee.__class__ is VMClass:
+            self.stack[-1 - argc] = VMInstance(callee)
+            initializer = callee.methods.get("init")
+            if initializer is not None:
+                self.call(initializer, argc)
+            elif argc != 0:
+                raise self.runtime_error(f"Expected 0 arguments but got {argc}.")
+        elif callee.__class__ is Closure:
+            self.call(callee, argc)
+        elif isinstance(callee, LoxCallable):
+            if argc != callee.arity():
+                raise self.runtime_error(f"Expected {callee.arity()} arguments but got {argc}.")
+            arguments = self.stack[len(self.stack) - argc:]
+            try:
+                result = callee.call(self, arguments)
+            except NativeError as error:
+                raise self.runtime_error(error.message)
+            del self.stack[len(self.stack) - argc - 1:]
+            self.stack.append(result)
+        else:
+            raise self.runtime_error("Can only call functions and classes.")
+
+    def call(self, closure: Closure, argc: int) -> None:
+        if argc != closure.function.arity:
+            raise self.runtime_error(f"Expected {closure.function.arity} arguments but got {argc}.")
+        if len(self.frames) == FRAMES_MAX:
+            raise self.runtime_error("Stack overflow.")
+        self.frames.append(CallFrame(closure, len(self.stack) - argc - 1))
+
+    def invoke(self, name: str, argc: int) -> None:
+        receiver = self.stack[-1 - argc]
+        if receiver.__class__ is not VMInstance:
+            raise self.runtime_error("Only instances have properties.")
+
+        # A field holding a function shadows a method of the same name.
+        if name in receiver.fields:
+            value = receiver.fields[name]
+            self.stack[-1 - argc] = value
+            self.call_value(value, argc)
+            return
+
+        self.invoke_from_class(receiver.klass, name, argc)
+
+    def invoke_from_class(self, klass: VMClass, name: str, argc: int) -> None:
+        method = klass.methods.get(name)
+        if method is None:
+            raise self.runtime_error(f"Undefined property '{name}'.")
+        self.call(method, argc)
+
+    def bind_method(self, klass: VMClass, receiver: Any, name: str) -> BoundMethod:
+        method = klass.methods.get(name)
+        if method is None:
+            raise self.runtime_error(f"Undefined property '{name}'.")
+        return BoundMethod(receiver, method)
+
+    def capture_upvalue(self, location: int) -> Upvalue:
+        for upvalue in self.open_upvalues:
+            if upvalue.location == location:
+                return upvalue
+        upvalue = Upvalue(location)
+        self.open_upvalues.append(upvalue)
+        self.open_upvalues.sort(key=lambda upvalue: upvalue.location)
+        return upvalue
+
+    def close_upvalues(self, last: int) -> None:
+        open_upvalues = self.open_upvalues
+        while open_upvalues and open_upvalues[-1].location >= last:
+            upvalue = open_upvalues.pop()
+            upvalue.closed = self.stack[upvalue.location]
+            upvalue.location = -1
+
+    def runtime_error(self, message: str) -> RunTimeError:
+        frame = self.frames[-1]
+        line = frame.closure.function.chunk.lines[frame.ip - 1]
+        return RunTimeError(Token(TokenType.EOF, "", None, line), message)
+
+    def stringify(self, object: Any) -> str:
+        if object is None:
+            return "nil"
+        if object.__class__ in self.numbers.types:
+            return self.numbers.stringify(object)
+        return str(object)